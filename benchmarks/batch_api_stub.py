@@ -0,0 +1,172 @@
+"""A local stand-in for the OpenAI files and batches endpoints, answering the requests of a job with StubLLM.
+
+Run it with `python benchmarks/batch_api_stub.py --port 8089` and analyze with
+`diagnostic_analyzer batch ... --batch-api --batch-api-url http://127.0.0.1:8089/v1`
+(OPENAI_API_KEY must be set to any value), or start it in a script with
+BatchAPIStub().start().
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from llm_stub import StubLLM
+
+CHARS_PER_TOKEN = 4
+
+class BatchAPIStub:
+    """
+    Serves POST /v1/files, GET /v1/files/<id>/content, POST /v1/batches,
+    GET /v1/batches/<id> and POST /v1/batches/<id>/cancel.
+
+    A job stays in_progress for processing_seconds and then completes with a
+    chat completion per request from llm, except every fail_every-th request,
+    which is answered with an error in the error file. Token usage is
+    estimated from the text, with cached_tokens set to cached_tokens.
+    """
+    def __init__(self, llm=None, processing_seconds=0.2, fail_every=0, cached_tokens=0):
+        self.llm = llm or StubLLM()
+        self.processing_seconds = processing_seconds
+        self.fail_every = fail_every
+        self.cached_tokens = cached_tokens
+        self.files = {}
+        self.batches = {}
+        self.request_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        self.app = self._create_app()
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serves in a background thread and returns the API root, such as http://127.0.0.1:8089/v1."""
+        self._server = make_server(host, port, self.app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_port}/v1"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+
+    def _new_id(self, prefix):
+        return f"{prefix}-{next(self._ids)}"
+
+    def _add_file(self, content, filename, purpose):
+        file = {"id": self._new_id("file"), "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file["id"]] = (file, content)
+        return file
+
+    def _create_app(self):
+        app = Flask(__name__)
+
+        @app.post("/v1/files")
+        def create_file():
+            upload = request.files["file"]
+            return jsonify(self._add_file(upload.read(), upload.filename, request.form.get("purpose", "batch")))
+
+        @app.get("/v1/files/<file_id>/content")
+        def get_file_content(file_id):
+            if file_id not in self.files:
+                return jsonify({"error": {"message": f"No such file {file_id}"}}), 404
+            return Response(self.files[file_id][1], mimetype="application/jsonl")
+
+        @app.post("/v1/batches")
+        def create_batch():
+            body = request.get_json()
+            if body.get("input_file_id") not in self.files:
+                return jsonify({"error": {"message": "Unknown input_file_id"}}), 400
+            now = int(time.time())
+            batch = {"id": self._new_id("batch"), "object": "batch", "endpoint": body["endpoint"],
+                     "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                     "status": "in_progress", "created_at": now, "in_progress_at": now,
+                     "output_file_id": None, "error_file_id": None, "metadata": body.get("metadata"),
+                     "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+            self.batches[batch["id"]] = batch
+            threading.Timer(self.processing_seconds, self._process, args=(batch,)).start()
+            return jsonify(batch)
+
+        @app.get("/v1/batches/<batch_id>")
+        def get_batch(batch_id):
+            if batch_id not in self.batches:
+                return jsonify({"error": {"message": f"No such batch {batch_id}"}}), 404
+            return jsonify(self.batches[batch_id])
+
+        @app.post("/v1/batches/<batch_id>/cancel")
+        def cancel_batch(batch_id):
+            batch = self.batches[batch_id]
+            if batch["status"] == "in_progress":
+                batch["status"] = "cancelled"
+            return jsonify(batch)
+
+        return app
+
+    def _process(self, batch):
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]][1].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            with self._lock:
+                self.request_count += 1
+                failed = self.fail_every and self.request_count % self.fail_every == 0
+            item = json.loads(line)
+            result = {"id": self._new_id("batch_req"), "custom_id": item["custom_id"], "error": None}
+            if failed:
+                result["response"] = {"status_code": 500, "body": {"error": {"message": "Stub failure"}}}
+                errors.append(result)
+            else:
+                result["response"] = {"status_code": 200, "body": self._complete(item["body"])}
+                outputs.append(result)
+
+        if batch["status"] == "cancelled":
+            return
+        if outputs:
+            batch["output_file_id"] = self._add_file(_to_jsonl(outputs), "output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._add_file(_to_jsonl(errors), "errors.jsonl", "batch_output")["id"]
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def _complete(self, body):
+        prompt = body["messages"][-1]["content"]
+        response_format = body.get("response_format", {}).get("json_schema")
+        content = self.llm(prompt, response_format) if response_format else self.llm(prompt)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return {
+            "id": self._new_id("chatcmpl"), "object": "chat.completion", "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": min(self.cached_tokens, prompt_tokens)}},
+        }
+
+def _to_jsonl(items):
+    return "".join(json.dumps(item) + "\n" for item in items).encode("utf-8")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--processing-seconds", type=float, default=1.0, help="Time every job stays in progress")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every n-th request with an error")
+    args = parser.parse_args()
+
+    stub = BatchAPIStub(processing_seconds=args.processing_seconds, fail_every=args.fail_every)
+    print(f"Batch API stand-in at {stub.start(port=args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compares the upload size, ingest time and peak memory of a bundle as plain files, zip and tar.gz."""
+import argparse
+import gzip
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.bundle_loader import load_bundle_path
+from synthetic import generate_thread_dumps
+
+LOG_LINE = "TID: [-1234] [] [2024-01-01 10:00:{second:02d},000] {level} {{org.apache.synapse.core.axis2.Axis2Sender}} - Request {index} processed\n"
+
+def generate_log(line_count):
+    """Generates a carbon style log with a sprinkling of errors."""
+    return "".join(LOG_LINE.format(second=i % 60, level="ERROR" if i % 50 == 0 else "INFO", index=i)
+                   for i in range(line_count))
+
+def write_bundle(folder, thread_count, dump_count, log_lines):
+    """Writes the dumps and logs of a bundle, with a rotated log gzipped like the server does."""
+    os.makedirs(folder)
+    for i, dump in enumerate(generate_thread_dumps(thread_count, dump_count)):
+        with open(os.path.join(folder, f"threaddump-{i + 1}-1.txt"), "w", encoding="utf-8") as dump_file:
+            dump_file.write(dump)
+    log = generate_log(log_lines)
+    with open(os.path.join(folder, "log.txt"), "w", encoding="utf-8") as log_file:
+        log_file.write(log)
+    with gzip.open(os.path.join(folder, "wso2carbon.log.1.gz"), "wt", encoding="utf-8") as rotated_log:
+        rotated_log.write(log)
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=2000, help="Threads per dump")
+    parser.add_argument("--dumps", type=int, default=3, help="Thread dumps in the bundle")
+    parser.add_argument("--log-lines", type=int, default=200000, help="Lines per log file")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of loads to time per layout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        folder = os.path.join(temp_dir, "bundle")
+        write_bundle(folder, args.threads, args.dumps, args.log_lines)
+
+        zip_path = os.path.join(temp_dir, "bundle.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(os.listdir(folder)):
+                archive.write(os.path.join(folder, name), f"bundle/{name}")
+        tar_path = os.path.join(temp_dir, "bundle.tar.gz")
+        with tarfile.open(tar_path, "w:gz") as archive:
+            archive.add(folder, "bundle")
+
+        raw_size = None
+        for label, path in (("folder", folder), ("zip", zip_path), ("tar.gz", tar_path)):
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                files = load_bundle_path(path)
+                times.append(time.perf_counter() - start)
+            loaded_bytes = sum(len(file.getvalue()) for file in files.values())
+            del files
+
+            tracemalloc.start()
+            files = load_bundle_path(path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del files
+
+            upload_megabytes = size_of(path) / (1024 * 1024)
+            raw_size = raw_size or size_of(path)
+            seconds = min(times)
+            print(f"{label:<7} upload {upload_megabytes:7.1f} MB ({size_of(path) / raw_size:5.1%} of the folder), "
+                  f"{loaded_bytes / (1024 * 1024):7.1f} MB loaded in {seconds * 1000:7.1f} ms "
+                  f"({loaded_bytes / (1024 * 1024) / seconds:6.1f} MB/s), peak {peak / (1024 * 1024):6.1f} MB")
+
+if __name__ == "__main__":
+    main()
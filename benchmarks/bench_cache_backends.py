@@ -0,0 +1,114 @@
+"""Checks the shared cache backends and times their reads and writes.
+
+memory:// and sqlite:/// are checked for least recently used eviction at
+their size limit and for TTL expiry. RedisCache is checked for TTL expiry
+against fakeredis when it is installed, and against a server with --redis-url;
+its eviction is left to the server. Exits with status 1 when a check fails.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package.cache_backends import create_cache_backend, RedisCache
+
+NAMESPACE = "bench"
+VALUE_BYTES = 1000
+# RedisCache sends whole seconds (SET EX), so the shortest TTL all backends support
+TTL_SECONDS = 1
+
+def check_eviction(backend):
+    """Fills a backend limited to 3 values, returns the errors found."""
+    errors = []
+    for key in ("a", "b", "c"):
+        backend.set(NAMESPACE, key, key.encode() * VALUE_BYTES)
+    # Reading a makes b the least recently used entry
+    backend.get(NAMESPACE, "a")
+    backend.set(NAMESPACE, "d", b"d" * VALUE_BYTES)
+    if backend.get(NAMESPACE, "b") is not None:
+        errors.append("the least recently used entry was not evicted")
+    for key in ("a", "c", "d"):
+        if backend.get(NAMESPACE, key) != key.encode() * VALUE_BYTES:
+            errors.append(f"entry {key} was evicted or changed")
+    backend.set(NAMESPACE, "huge", b"x" * VALUE_BYTES * 10)
+    if backend.get(NAMESPACE, "a") is None and backend.get(NAMESPACE, "huge") is None:
+        errors.append("a value larger than the limit evicted the whole cache")
+    return errors
+
+def check_expiry(backend):
+    """Writes an entry with a TTL and one without, returns the errors found."""
+    errors = []
+    backend.set(NAMESPACE, "expiring", b"value", ttl=TTL_SECONDS)
+    backend.set(NAMESPACE, "kept", b"value")
+    if backend.get(NAMESPACE, "expiring") != b"value":
+        errors.append("an entry was not readable before its TTL")
+    time.sleep(TTL_SECONDS + 0.2)
+    if backend.get(NAMESPACE, "expiring") is not None:
+        errors.append("an entry was readable after its TTL")
+    if backend.get(NAMESPACE, "kept") != b"value":
+        errors.append("an entry without TTL expired")
+    backend.delete(NAMESPACE, "kept")
+    if backend.get(NAMESPACE, "kept") is not None:
+        errors.append("a deleted entry was readable")
+    return errors
+
+def time_operations(backend, count):
+    """Returns the (write, read) operations per second over count keys."""
+    value = b"v" * VALUE_BYTES
+    start = time.perf_counter()
+    for index in range(count):
+        backend.set(NAMESPACE, f"timed-{index}", value)
+    write_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for index in range(count):
+        backend.get(NAMESPACE, f"timed-{index}")
+    read_seconds = time.perf_counter() - start
+    return count / write_seconds, count / read_seconds
+
+def get_backends(work_dir, redis_url):
+    """Returns (name, create_limited, create) for every backend that can be checked here."""
+    limit = 3 * VALUE_BYTES
+    backends = [
+        ("memory://", lambda: create_cache_backend(f"memory://?max_bytes={limit}"),
+         lambda: create_cache_backend("memory://")),
+        ("sqlite:///", lambda: create_cache_backend(f"sqlite:///{work_dir}/limited.db?max_bytes={limit}"),
+         lambda: create_cache_backend(f"sqlite:///{work_dir}/cache.db")),
+    ]
+    try:
+        import fakeredis
+    except ImportError:
+        print("skip fakeredis: not installed (pip install fakeredis)")
+    else:
+        backends.append(("fakeredis", None, lambda: RedisCache(client=fakeredis.FakeRedis())))
+    if redis_url:
+        backends.append((redis_url, None, lambda: create_cache_backend(redis_url)))
+    return backends
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", help="Also check a Redis server, such as redis://localhost:6379/15")
+    parser.add_argument("--operations", type=int, default=2000, help="Keys written and read when timing")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, create_limited, create in get_backends(work_dir, args.redis_url):
+            errors = check_eviction(create_limited()) if create_limited else []
+            backend = create()
+            errors += check_expiry(backend)
+            writes, reads = time_operations(backend, args.operations)
+            for key in range(args.operations):
+                backend.delete(NAMESPACE, f"timed-{key}")
+
+            failed = failed or bool(errors)
+            eviction = "" if create_limited else ", eviction left to the server"
+            print(f"{'FAIL' if errors else 'ok':4} {name}: {writes:,.0f} writes/s, {reads:,.0f} reads/s{eviction}")
+            for error in errors:
+                print(f"     {error}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Times ranking threads by the CPU time they used between dumps, for many threads across many dumps."""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.thread_dump_processor import Analysis, Thread
+from diagnostic_analyzer_package.cpu_ranking import rank_cpu_threads
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from synthetic import IDLE_STACK, RUNNING_STACKS, HOT_THREAD_EVERY
+
+def build_analyses(thread_count, dump_count, interval_seconds, churn):
+    """
+    Builds dumps with the threads as objects, as the parsers leave them, without parsing text.
+
+    Every dump replaces the churn fraction of the threads by new ones, so
+    threads appear and disappear between dumps as in a busy server.
+    """
+    thread_groups_config = load_thread_groups_config()
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    replaced = int(thread_count * churn)
+    analyses = []
+    for i in range(dump_count):
+        analysis = Analysis(i + 1, f"dump {i + 1}", {}, thread_groups_config)
+        analysis.date = start + timedelta(seconds=interval_seconds * i)
+        uptime = 3600 + interval_seconds * i
+        threads = []
+        for number in range(1 + replaced * i, thread_count + 1 + replaced * i):
+            thread = Thread()
+            thread.name = f"PassThroughMessageProcessor-{number}"
+            thread.tid = f"0x{0x7f0000000000 + number * 0x1000:016x}"
+            thread.nid = f"0x{0x1000 + number:x}"
+            thread.nativeId = 0x1000 + number
+            hot = number % HOT_THREAD_EVERY == 0
+            # Threads started halfway between the dump they first appear in and the one before it
+            first_dump = max(0, -(-(number - thread_count) // replaced))
+            thread.elapsedSeconds = uptime if first_dump == 0 else interval_seconds * (i - first_dump + 0.5)
+            thread.cpuMillis = thread.elapsedSeconds * (900 if hot else number % 20)
+            thread.threadState = "RUNNABLE" if hot else "WAITING (parking)"
+            thread.frames = RUNNING_STACKS[0] if hot else IDLE_STACK
+            threads.append(thread)
+        analysis.analyzeThreads(threads)
+        analyses.append(analysis)
+    return analyses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=20000, help="Threads per dump")
+    parser.add_argument("--dumps", type=int, default=10, help="Number of dumps")
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between dumps")
+    parser.add_argument("--churn", type=float, default=0.05, help="Fraction of threads replaced between dumps")
+    parser.add_argument("--top", type=int, default=10, help="Threads ranked")
+    args = parser.parse_args()
+
+    analyses = build_analyses(args.threads, args.dumps, args.interval, args.churn)
+
+    start = time.perf_counter()
+    ranked = rank_cpu_threads(analyses, args.top)
+    seconds = time.perf_counter() - start
+
+    print(f"threads:  {sum(len(analysis.threads) for analysis in analyses)} ({args.dumps} dumps)")
+    print(f"ranking:  {seconds * 1000:.1f} ms")
+    for thread in ranked[:3]:
+        print(f"  {thread['name']}: {thread['cpuMillis']:.0f} ms CPU, {thread['cpuPercent']}% over {thread['intervals']} intervals")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Compares loading a parsed thread dump from the dump cache with reparsing it."""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.thread_dump_processor import Analysis
+from diagnostic_analyzer_package.dump_cache import serialize_analysis, deserialize_analysis
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from synthetic import generate_thread_dump_of_size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=100, help="Size of the generated thread dump")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of cache loads to time")
+    args = parser.parse_args()
+
+    thread_groups_config = load_thread_groups_config()
+    text = generate_thread_dump_of_size(int(args.size_mb * 1024 * 1024))
+
+    start = time.perf_counter()
+    analysis = Analysis(1, "benchmark", {}, thread_groups_config)
+    analysis.analyze(text)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = serialize_analysis(analysis)
+    serialize_seconds = time.perf_counter() - start
+
+    with tempfile.NamedTemporaryFile(suffix=".dadc") as cache_file:
+        cache_file.write(data)
+        cache_file.flush()
+        load_times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            with open(cache_file.name, "rb") as handle:
+                loaded = deserialize_analysis(handle.read(), 1, "benchmark", {}, thread_groups_config)
+            load_times.append(time.perf_counter() - start)
+
+    assert len(loaded.threads) == len(analysis.threads)
+    load_seconds = min(load_times)
+
+    print(f"dump size:       {len(text) / 1024 / 1024:.1f} MB, {len(analysis.threads)} threads")
+    print(f"reparse:         {parse_seconds:.3f} s")
+    print(f"serialize:       {serialize_seconds:.3f} s")
+    print(f"cache entry:     {len(data) / 1024 / 1024:.2f} MB")
+    print(f"cache load:      {load_seconds:.3f} s")
+    print(f"speedup:         {parse_seconds / load_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
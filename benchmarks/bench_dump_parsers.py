@@ -0,0 +1,53 @@
+"""Measures the throughput of every thread dump parser, from format detection to the parsed model."""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.thread_dump_processor import Analysis
+from diagnostic_analyzer_package.dump_parsers import detect_dump_format
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from synthetic import generate_thread_dump, generate_sigquit_output, generate_jcmd_json_dump
+
+def parse_file(text, thread_groups_config):
+    """Detects the format of a file and parses every dump in it, without the dump cache."""
+    parser = detect_dump_format(text)
+    analyses = []
+    for i, dump_text in enumerate(parser["split"](text)):
+        analysis = Analysis(i + 1, f"dump {i + 1}", {}, thread_groups_config)
+        parser["parse"](analysis, dump_text)
+        analyses.append(analysis)
+    return parser["name"], analyses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=5000, help="Threads per dump")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of parses to time per format")
+    args = parser.parse_args()
+
+    thread_groups_config = load_thread_groups_config()
+    inputs = [
+        ("jstack -l", generate_thread_dump(args.threads)),
+        ("SIGQUIT console output (3 dumps)", generate_sigquit_output(args.threads // 3)),
+        ("jcmd JSON, JDK 21", generate_jcmd_json_dump(args.threads // 2, virtual_thread_count=args.threads // 2)),
+        ("jcmd JSON, with states", generate_jcmd_json_dump(args.threads // 2, virtual_thread_count=args.threads // 2,
+                                                           with_states=True)),
+    ]
+
+    for label, text in inputs:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            name, analyses = parse_file(text, thread_groups_config)
+            times.append(time.perf_counter() - start)
+
+        seconds = min(times)
+        megabytes = len(text.encode()) / (1024 * 1024)
+        threads = sum(len(analysis.threads) for analysis in analyses)
+        print(f"{label:<34} [{name}] {megabytes:6.1f} MB, {threads} threads: {seconds * 1000:8.1f} ms, "
+              f"{megabytes / seconds:6.1f} MB/s, {threads / seconds:9.0f} threads/s")
+
+if __name__ == "__main__":
+    main()
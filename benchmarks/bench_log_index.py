@@ -0,0 +1,54 @@
+"""Times building the log event index and correlating problem threads with dumps, against a linear scan."""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package.log_index import build_log_index, get_log_thread_name, get_correlated_log_events
+from diagnostic_analyzer_package.log_ingest import TIMESTAMP_FORMAT
+
+LOG_LINE = "[{time:%Y-%m-%d %H:%M:%S},{millis:03d}] [PassThroughMessageProcessor-{thread}]  INFO {{LogMediator}} - Request {index}\n"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000, help="Log events in the window")
+    parser.add_argument("--threads", type=int, default=200, help="Threads logging the events")
+    parser.add_argument("--problem-threads", type=int, default=20, help="Problem threads to correlate")
+    parser.add_argument("--dumps", type=int, default=3, help="Thread dumps to correlate with")
+    args = parser.parse_args()
+
+    start_time = datetime(2024, 1, 1, 12)
+    log_content = "".join(LOG_LINE.format(time=start_time + timedelta(milliseconds=i * 10), millis=i % 1000,
+                                          thread=i % args.threads, index=i) for i in range(args.events))
+    span = timedelta(milliseconds=args.events * 10)
+    dump_dates = [start_time + span * (i + 1) / (args.dumps + 1) for i in range(args.dumps)]
+    problem_threads = [f"PassThroughMessageProcessor-{i}" for i in range(args.problem_threads)]
+
+    start = time.perf_counter()
+    log_index = build_log_index(log_content)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    correlated = get_correlated_log_events(log_index, problem_threads, dump_dates)
+    query_seconds = time.perf_counter() - start
+
+    # The same lookups by scanning every event
+    start = time.perf_counter()
+    matches = 0
+    for dump_date in dump_dates:
+        window_start = (dump_date - timedelta(seconds=120)).strftime(TIMESTAMP_FORMAT)
+        window_end = (dump_date + timedelta(seconds=10)).strftime(TIMESTAMP_FORMAT)
+        for thread_name in problem_threads:
+            matches += sum(1 for timestamp, event in zip(log_index.timestamps, log_index.events)
+                           if window_start <= timestamp <= window_end and get_log_thread_name(event) == thread_name)
+    scan_seconds = time.perf_counter() - start
+
+    queries = len(dump_dates) * len(problem_threads)
+    print(f"{len(log_index)} events, {len(log_content) / (1024 * 1024):.1f} MB: index built in {build_seconds * 1000:.1f} ms")
+    print(f"{queries} correlation queries: {query_seconds * 1000:.2f} ms indexed, {scan_seconds * 1000:.1f} ms scanned "
+          f"({sum(len(group['events']) for group in correlated)} events kept of {matches} matches)")
+
+if __name__ == "__main__":
+    main()
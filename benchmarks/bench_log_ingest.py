@@ -0,0 +1,60 @@
+"""Compares merging all the logs of a bundle with reading only the window around the thread dumps."""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package.log_ingest import read_logs
+
+CARBON_LINE = "TID: [-1234] [] [{time:%Y-%m-%d %H:%M:%S},{millis:03d}] {level} {{org.apache.synapse.mediators.builtin.LogMediator}} - Request {index} processed\n"
+STACK_TRACE = "java.lang.IllegalStateException: Connection pool exhausted\n\tat org.apache.synapse.transport.passthru.TargetConnections.getConnection(TargetConnections.java:120)\n"
+ACCESS_LINE = '10.0.0.{host} - - [{time:%d/%b/%Y:%H:%M:%S} +0000] "POST /services/OrderAPI HTTP/1.1" 200 512\n'
+
+def generate_carbon_log(start, line_count, seconds_per_line):
+    lines = []
+    for i in range(line_count):
+        time_of_line = start + timedelta(seconds=i * seconds_per_line)
+        error = i % 200 == 0
+        lines.append(CARBON_LINE.format(time=time_of_line, millis=i % 1000, level="ERROR" if error else "INFO", index=i))
+        if error:
+            lines.append(STACK_TRACE)
+    return "".join(lines).encode()
+
+def generate_access_log(start, line_count, seconds_per_line):
+    return "".join(ACCESS_LINE.format(host=i % 250, time=start + timedelta(seconds=i * seconds_per_line))
+                   for i in range(line_count)).encode()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=500000, help="Lines per log file")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of reads to time")
+    args = parser.parse_args()
+
+    # A day of logs in two rotated carbon logs and an access log, with a dump at noon
+    day = datetime(2024, 1, 1)
+    seconds_per_line = 12 * 3600 / args.lines
+    files = {
+        "wso2carbon.log.1.gz": BytesIO(gzip.compress(generate_carbon_log(day, args.lines, seconds_per_line))),
+        "wso2carbon.log": BytesIO(generate_carbon_log(day + timedelta(hours=12), args.lines, seconds_per_line)),
+        "http_access_2024-01-01.log": BytesIO(generate_access_log(day, args.lines, 2 * seconds_per_line)),
+    }
+    dump_dates = [day + timedelta(hours=12), day + timedelta(hours=12, seconds=20)]
+    megabytes = (len(gzip.decompress(files["wso2carbon.log.1.gz"].getvalue())) + len(files["wso2carbon.log"].getvalue())
+                 + len(files["http_access_2024-01-01.log"].getvalue())) / (1024 * 1024)
+
+    for label, dates in (("all logs", None), ("dump window", dump_dates)):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            text = read_logs(files, dates)
+            times.append(time.perf_counter() - start)
+        seconds = min(times)
+        print(f"{label:<12} {megabytes:6.1f} MB of logs: {seconds * 1000:8.1f} ms, "
+              f"{len(text) / (1024 * 1024):7.2f} MB sent downstream")
+
+if __name__ == "__main__":
+    main()
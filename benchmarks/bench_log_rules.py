@@ -0,0 +1,65 @@
+"""Measures the throughput of the log rule engine against scanning the logs with the combined regex alone."""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package.log_rules import get_log_rules
+
+LOG_LINES = [
+    "TID: [-1234] [] [2024-01-01 10:{minute:02d}:{second:02d},{millis:03d}]  INFO {{org.apache.synapse.mediators.builtin.LogMediator}} - To: /services/OrderAPI, MessageID: urn:uuid:{index:08d}, Direction: request\n",
+    "TID: [-1234] [] [2024-01-01 10:{minute:02d}:{second:02d},{millis:03d}]  INFO {{org.apache.synapse.transport.passthru.PassThroughHttpSender}} - Sending response for request {index}\n",
+]
+SIGNATURE_LINES = [
+    "TID: [-1234] [] [2024-01-01 10:{minute:02d}:{second:02d},{millis:03d}] ERROR {{org.apache.synapse.transport.passthru.util.RelayUtils}} - Error while building Passthrough stream\n",
+    "TID: [-1234] [] [2024-01-01 10:{minute:02d}:{second:02d},{millis:03d}]  WARN {{org.apache.synapse.core.axis2.TimeoutHandler}} - Expiring message ID : urn:uuid:{index:08d}; dropping message after ENDPOINT timeout of : 60 seconds\n",
+    "java.net.SocketException: Too many open files\n",
+    "TID: [-1234] [] [2024-01-01 10:{minute:02d}:{second:02d},{millis:03d}] ERROR {{org.apache.synapse.transport.passthru.TargetHandler}} - Connection timed out while connecting to backend {index}\n",
+]
+
+def generate_log(size_bytes, signature_every):
+    """Generates an MI log with a known failure signature every signature_every lines."""
+    lines = []
+    size = 0
+    index = 0
+    while size < size_bytes:
+        if index % signature_every == 0:
+            template = SIGNATURE_LINES[(index // signature_every) % len(SIGNATURE_LINES)]
+        else:
+            template = LOG_LINES[index % len(LOG_LINES)]
+        line = template.format(minute=(index // 60000) % 60, second=(index // 1000) % 60,
+                               millis=index % 1000, index=index)
+        lines.append(line)
+        size += len(line)
+        index += 1
+    return "".join(lines).encode()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the generated log")
+    parser.add_argument("--signature-every", type=int, default=1000, help="Lines between failure signatures")
+    parser.add_argument("--regex-mb", type=int, default=10, help="MB scanned with the combined regex alone")
+    args = parser.parse_args()
+
+    log_rules = get_log_rules()
+    data = generate_log(args.size_mb * 1024 * 1024, args.signature_every)
+    megabytes = len(data) / (1024 * 1024)
+
+    start = time.perf_counter()
+    summary = log_rules.scan(BytesIO(data))
+    seconds = time.perf_counter() - start
+    matched = {entry["rule"]: entry["count"] for entry in summary if entry["count"]}
+    print(f"rule engine   {megabytes:7.1f} MB in {seconds * 1000:8.1f} ms: {megabytes / seconds:7.1f} MB/s, {matched}")
+
+    # The combined regex on its own, over a slice of the log
+    sample = data[:args.regex_mb * 1024 * 1024]
+    start = time.perf_counter()
+    count = sum(1 for _ in log_rules.keyword_regex.finditer(sample))
+    seconds = time.perf_counter() - start
+    print(f"regex only    {len(sample) / (1024 * 1024):7.1f} MB in {seconds * 1000:8.1f} ms: "
+          f"{len(sample) / (1024 * 1024) / seconds:7.1f} MB/s, {count} matches")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Reports the prompt prefix each stage shares between two different analyses, the part a provider can cache.
+
+The JSON schema of a structured stage is sent before the prompt, so it is
+counted as part of the shared prefix. Exits with status 1 when the static
+instructions of a stage are not part of that shared prefix, which means
+something that changes between analyses was put before them; a prefix below
+the caching minimum is reported but does not fail.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package import prompts
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from diagnostic_analyzer_package.model_routing import estimate_tokens
+from diagnostic_analyzer_package.structured_output import THREAD_SELECTION_FORMAT, LOG_FINDINGS_FORMAT
+
+# Prompt caching applies to prefixes of at least this many tokens
+MIN_CACHED_PREFIX_TOKENS = 1024
+# Response formats sent with the prompt of the structured stages
+STAGE_FORMATS = {"initial_thread_analysis": THREAD_SELECTION_FORMAT, "log_analysis": LOG_FINDINGS_FORMAT}
+SUS_CLASSES = [{"package": "org.apache.synapse.transport.passthru.util", "class": "RelayUtils", "issue_line": 165}]
+
+def build_prompts(seed):
+    """Builds the prompt of every stage from inputs that differ with seed."""
+    text = f"analysis {seed} " * 200
+    thread_groups_config = load_thread_groups_config()
+    return {
+        "initial_thread_analysis": (
+            prompts.get_initial_thread_analysis_prompt(f"Problem {seed}", text, thread_groups_config),
+            prompts.INITIAL_THREAD_ANALYSIS_INSTRUCTIONS),
+        "comprehensive_thread_analysis": (
+            prompts.get_comprehensive_thread_analysis_prompt(f"Problem {seed}", text, text, {f"thread-{seed}": [text]}),
+            prompts.COMPREHENSIVE_THREAD_ANALYSIS_INSTRUCTIONS),
+        "log_analysis": (
+            prompts.get_log_analysis_prompt(f"Problem {seed}", text, SUS_CLASSES, text),
+            prompts.LOG_ANALYSIS_INSTRUCTIONS.format(sus_classes=json.dumps(SUS_CLASSES))),
+        "class_analysis": (
+            prompts.get_class_analysis_prompt(f"Problem {seed}", {f"Class{seed}.java": text}, text, text),
+            prompts.CLASS_ANALYSIS_INSTRUCTIONS),
+        "final_conclusion": (
+            prompts.get_diagnostic_conclusion_prompt(f"Problem {seed}", text, text, text),
+            prompts.DIAGNOSTIC_CONCLUSION_INSTRUCTIONS),
+    }
+
+def get_shared_prefix(first, second):
+    """Returns the number of leading characters first and second have in common."""
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.parse_args()
+
+    first, second = build_prompts(1), build_prompts(2)
+    failed = False
+    cacheable = 0
+    for stage, (prompt, instructions) in first.items():
+        shared = get_shared_prefix(prompt, second[stage][0])
+        schema_tokens = estimate_tokens(json.dumps(STAGE_FORMATS[stage])) if stage in STAGE_FORMATS else 0
+        tokens = schema_tokens + estimate_tokens(prompt[:shared])
+        status = "ok" if shared >= len(instructions) else "FAIL"
+        failed = failed or status == "FAIL"
+        if tokens >= MIN_CACHED_PREFIX_TOKENS:
+            cacheable += 1
+            note = ", cacheable"
+        else:
+            note = f", NOT cacheable (below the {MIN_CACHED_PREFIX_TOKENS} tokens providers cache)"
+        print(f"{status:4} {stage}: ~{tokens} of ~{schema_tokens + estimate_tokens(prompt)} tokens shared{note}")
+
+    print(f"{cacheable} of {len(first)} stages have a prefix long enough for prompt caching")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
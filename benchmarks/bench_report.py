@@ -0,0 +1,53 @@
+"""Times every report exporter on long LLM-style sections and reports output sizes and the PDF page count."""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostic_analyzer_package.report import get_final_report_model, export_report, REPORT_EXPORTERS
+
+WORDS = ("thread pool blocked waiting lock monitor PassThroughMessageProcessor SynapseWorker "
+         "org.apache.synapse.transport.passthru.TargetHandler timeout connection endpoint "
+         "deadlock contention increase worker_pool_size_core mediation sequence latency").split()
+
+def generate_section(lines, seed):
+    """Generates LLM-style report text with headings, bullets, separators and paragraphs."""
+    random.seed(seed)
+    output = []
+    while len(output) < lines:
+        output.append(f"Finding {len(output)}: " + " ".join(random.choices(WORDS, k=6)))
+        output.append("-" * 40)
+        for _ in range(3):
+            output.append("- " + " ".join(random.choices(WORDS, k=random.randint(8, 30))))
+        output.append(" ".join(random.choices(WORDS, k=random.randint(20, 60))))
+        output.append("")
+    return "\n".join(output[:lines])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200, help="Approximate number of pages to render")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of renders to time")
+    args = parser.parse_args()
+
+    # About 20 source lines per page once long paragraphs wrap
+    lines_per_section = args.pages * 20 // 4
+    sections = [generate_section(lines_per_section, seed) for seed in range(4)]
+
+    report = get_final_report_model("Slow responses from the PassThrough transport.", sections[0], sections[1],
+                                    class_analysis=sections[2], final_report=sections[3])
+
+    for report_format in REPORT_EXPORTERS:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = export_report(report, report_format).getvalue()
+            times.append(time.perf_counter() - start)
+
+        print(f"{report_format + ':':<10} {min(times) * 1000:8.1f} ms (best of {args.repeat}), {len(output) / 1024:.0f} KB")
+        if report_format == "pdf":
+            print(f"{'pages:':<10} {output.count(b'/Type /Page') - output.count(b'/Type /Pages')}")
+
+if __name__ == "__main__":
+    main()
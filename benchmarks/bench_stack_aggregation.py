@@ -0,0 +1,75 @@
+"""Times flame graph aggregation over many threads across several dumps."""
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.thread_dump_processor import Analysis
+from diagnostic_analyzer_package.stack_aggregator import (aggregate_stacks, build_call_tree,
+                                                          to_collapsed_stacks, get_top_contended_locks)
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from synthetic import generate_thread_dump
+
+def build_analyses(thread_count, dump_count, sample_threads):
+    """
+    Parses a sample dump per dump index and replicates its threads up to thread_count,
+    so large scales can be benchmarked without parsing gigabytes of text.
+    """
+    thread_groups_config = load_thread_groups_config()
+    analyses = []
+    for i in range(dump_count):
+        analysis = Analysis(i + 1, f"dump {i + 1}", {}, thread_groups_config)
+        analysis.analyze(generate_thread_dump(sample_threads, seed=i))
+        factor = max(1, thread_count // len(analysis.threads))
+        for status, threads in analysis.threadsByStatus.items():
+            # Copy the frame lists so every thread owns its stack, as after parsing
+            replicas = []
+            for _ in range(factor):
+                for thread in threads:
+                    replica = copy.copy(thread)
+                    replica.frames = list(thread.frames)
+                    replicas.append(replica)
+            analysis.threadsByStatus[status] = replicas
+        analysis.threads = [thread for threads in analysis.threadsByStatus.values() for thread in threads]
+        analyses.append(analysis)
+    return analyses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=50000, help="Threads per dump")
+    parser.add_argument("--dumps", type=int, default=3, help="Number of dumps")
+    parser.add_argument("--sample-threads", type=int, default=2000, help="Threads parsed per sample dump")
+    args = parser.parse_args()
+
+    analyses = build_analyses(args.threads, args.dumps, args.sample_threads)
+    total_threads = sum(len(analysis.threads) for analysis in analyses)
+
+    start = time.perf_counter()
+    stack_counts = aggregate_stacks(analyses)
+    aggregate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_call_tree(stack_counts)
+    tree_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collapsed = to_collapsed_stacks(stack_counts)
+    collapsed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_top_contended_locks(analyses)
+    locks_seconds = time.perf_counter() - start
+
+    total = aggregate_seconds + tree_seconds + collapsed_seconds + locks_seconds
+    print(f"threads:          {total_threads} ({args.dumps} dumps), {len(stack_counts)} distinct stacks")
+    print(f"aggregate:        {aggregate_seconds * 1000:.1f} ms")
+    print(f"call tree:        {tree_seconds * 1000:.1f} ms")
+    print(f"collapsed export: {collapsed_seconds * 1000:.1f} ms ({len(collapsed.splitlines())} lines)")
+    print(f"contended locks:  {locks_seconds * 1000:.1f} ms")
+    print(f"total:            {total * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
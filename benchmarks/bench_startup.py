@@ -0,0 +1,67 @@
+"""Measures package import time with `python -X importtime` and enforces a startup budget.
+
+Exits with status 1 when an entry point imports slower than its budget or
+pulls in a dependency that it should only load on first use.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module: (budget in milliseconds, dependencies that must not be imported)
+ENTRY_POINTS = {
+    "diagnostic_analyzer_package.thread_analyzer": (75, ["openai", "reportlab", "requests", "flask"]),
+    "diagnostic_analyzer_package.main": (120, ["openai", "reportlab", "requests", "flask"]),
+    "diagnostic_analyzer_package.app": (400, ["openai", "reportlab", "requests"]),
+}
+
+def measure_import(module, repeat):
+    """
+    Imports module in fresh interpreters and returns the best cumulative import
+    time in milliseconds and the set of top-level modules that were imported.
+    """
+    best = None
+    imported = set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        cumulative = None
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            fields = [field.strip() for field in line[len("import time:"):].split("|")]
+            if not fields[1].isdigit():
+                continue  # Header line
+            name = fields[2]
+            imported.add(name.strip().split(".")[0])
+            if name.strip() == module:
+                cumulative = int(fields[1]) / 1000
+        if cumulative is not None and (best is None or cumulative < best):
+            best = cumulative
+    return best, imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every budget")
+    args = parser.parse_args()
+
+    failed = False
+    for module, (budget, forbidden) in ENTRY_POINTS.items():
+        milliseconds, imported = measure_import(module, args.repeat)
+        budget *= args.scale
+        eager = sorted(dependency for dependency in forbidden if dependency in imported)
+        within_budget = milliseconds is not None and milliseconds <= budget
+        status = "ok" if within_budget and not eager else "FAIL"
+        failed = failed or status == "FAIL"
+        print(f"{status:4} {module}: {milliseconds:.1f} ms (budget {budget:.0f} ms)"
+              + (f", eagerly imports {', '.join(eager)}" if eager else ""))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Parses jcmd JSON dumps with up to a million virtual threads and reports time and retained memory."""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from diagnostic_analyzer_package.thread_dump_processor import Analysis
+from diagnostic_analyzer_package.dump_parsers import parse_jcmd_json
+from diagnostic_analyzer_package.thread_table import get_thread_table, get_virtual_thread_summary
+from diagnostic_analyzer_package.stack_aggregator import aggregate_stacks
+from diagnostic_analyzer_package.utils import load_thread_groups_config
+from synthetic import iter_jcmd_json_dump
+
+def write_dump(path, platform_threads, virtual_threads, with_states):
+    """Streams a generated jcmd JSON dump to a file."""
+    with open(path, "w", encoding="utf-8") as dump_file:
+        for piece in iter_jcmd_json_dump(platform_threads, virtual_threads, with_states=with_states):
+            dump_file.write(piece)
+
+def parse(path, thread_groups_config):
+    """Parses the dump from the file, in chunks, and builds the columnar table and summaries."""
+    analysis = Analysis(1, "dump", {}, thread_groups_config)
+    with open(path, encoding="utf-8") as dump_file:
+        parse_jcmd_json(analysis, dump_file)
+    table = get_thread_table(analysis)
+    get_virtual_thread_summary(table)
+    aggregate_stacks([analysis])
+    return analysis, table
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--virtual-threads", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Virtual thread counts to benchmark")
+    parser.add_argument("--platform-threads", type=int, default=500, help="Platform threads per dump")
+    parser.add_argument("--with-states", action="store_true", help="Add the states and carriers of newer JDKs")
+    args = parser.parse_args()
+
+    thread_groups_config = load_thread_groups_config()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for virtual_threads in args.virtual_threads:
+            path = os.path.join(temp_dir, f"threaddump-{virtual_threads}.json")
+            write_dump(path, args.platform_threads, virtual_threads, args.with_states)
+            megabytes = os.path.getsize(path) / (1024 * 1024)
+
+            start = time.perf_counter()
+            analysis, table = parse(path, thread_groups_config)
+            seconds = time.perf_counter() - start
+            del analysis, table
+
+            # Retained memory is what the parsed model keeps once the input is gone
+            tracemalloc.start()
+            analysis, table = parse(path, thread_groups_config)
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f"{table.thread_count:>9} threads ({megabytes:6.1f} MB): {seconds:6.2f} s, "
+                  f"{table.thread_count / seconds:8.0f} threads/s, {len(analysis.threads)} thread objects, "
+                  f"{len(table)} table rows, retained {retained / (1024 * 1024):5.1f} MB, peak {peak / (1024 * 1024):5.1f} MB")
+            del analysis, table
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
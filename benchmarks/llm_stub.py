@@ -0,0 +1,69 @@
+"""A local stand-in for the LLM, answering every prompt type of the pipeline in the expected format."""
+import re
+import json
+import time
+
+THREAD_NAME_REGEX = re.compile(r"'name': '([^']+)'")
+WORDS = ("thread pool blocked waiting lock monitor PassThroughMessageProcessor SynapseWorker timeout connection "
+         "endpoint deadlock contention worker_pool_size_core mediation sequence latency backend").split()
+SUSPECTED_CLASSES = [{"package": "org.apache.synapse.transport.passthru.util", "class": "RelayUtils", "issue_line": 165}]
+ERROR_MESSAGE = "Error while building Passthrough stream"
+
+class StubLLM:
+    """
+    Answers prompts with canned text of a fixed size after an optional delay.
+
+    The initial thread analysis gets the names of the first threads listed in
+    the prompt, and the log analysis gets suspected classes and an error
+    message, so every later stage of the pipeline runs as with a real model.
+    Calls asking for a structured response get a JSON object of that format,
+    except every malformed_every-th one, which is cut short to exercise the
+    repair of invalid responses.
+    """
+    def __init__(self, latency_seconds=0.0, response_words=400, malformed_every=0):
+        self.latency_seconds = latency_seconds
+        self.malformed_every = malformed_every
+        self.body = " ".join(WORDS[i % len(WORDS)] for i in range(response_words))
+        self.calls = 0
+        self.structured_calls = 0
+        self.prompt_chars = 0
+        # Last structured answer per format, what a repair gives back
+        self.last_answers = {}
+
+    def __call__(self, prompt, response_format=None):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        heading = prompt.lstrip()[:200]
+        if heading.startswith("# Structured Output Repair Request"):
+            return self._structured(self.last_answers.get(response_format["name"], "{}"), response_format)
+
+        fields = None
+        if heading.startswith("# Thread Dump Analysis Request"):
+            names = []
+            for name in THREAD_NAME_REGEX.findall(prompt):
+                if name not in names:
+                    names.append(name)
+                if len(names) == 3:
+                    break
+            fields = {"analysis": self.body, "threads_for_analysis": names}
+        elif "analyzing error logs" in heading:
+            fields = {"analysis": self.body, "suspected_classes": SUSPECTED_CLASSES, "error_message": ERROR_MESSAGE}
+
+        if response_format and fields is not None:
+            self.last_answers[response_format["name"]] = json.dumps(fields)
+            return self._structured(self.last_answers[response_format["name"]], response_format)
+        if fields is None:
+            return self.body
+        if "threads_for_analysis" in fields:
+            return f"{self.body}\n\nTHREADS_FOR_ANALYSIS: {json.dumps(fields['threads_for_analysis'])}"
+        return f"{self.body}\n\nSUSPECTED_CLASSES: {SUSPECTED_CLASSES!r}\nERROR_MESSAGE: {ERROR_MESSAGE}"
+
+    def _structured(self, text, response_format):
+        self.structured_calls += 1
+        if self.malformed_every and self.structured_calls % self.malformed_every == 0:
+            # Cut inside the analysis text, as a response stopped early would be
+            return text[:len(text) // 2]
+        return text
@@ -0,0 +1,216 @@
+"""Runs the end-to-end benchmark suite on synthetic bundles at several scales and writes machine-readable results.
+
+Every scale is a generated bundle (thread dumps spread over the ThreadGroups.json
+pools with contended locks, a deadlock and multi-line thread names, plus a
+current and a rotated carbon log). Each stage is timed --repeat times with the
+LLM replaced by a local stub and the dump cache disabled. Results are written
+as JSON; with --compare, stages slower than a previous result file by more
+than --threshold are reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Every run parses the dumps and calls the LLM, warm caches would hide regressions
+os.environ["DIAGNOSTIC_ANALYZER_CACHE_DIR"] = ""
+os.environ["DIAGNOSTIC_ANALYZER_CACHE_URL"] = ""
+
+from diagnostic_analyzer_package.thread_dump_processor import Analysis
+from diagnostic_analyzer_package.thread_analyzer import parse_thread_dumps, analyze_thread_dumps
+from diagnostic_analyzer_package.log_analyzer import get_log_content
+from diagnostic_analyzer_package.log_ingest import get_dump_dates
+from diagnostic_analyzer_package.log_rules import scan_log_files
+from diagnostic_analyzer_package.local_report import build_local_report
+from diagnostic_analyzer_package.pipeline import run_analysis
+from diagnostic_analyzer_package.report import write_final_report
+from diagnostic_analyzer_package.bundle_loader import load_bundle_path
+from diagnostic_analyzer_package.utils import load_thread_groups_config, read_in_memory_file, set_llm_backend
+from synthetic import write_bundle
+from llm_stub import StubLLM
+
+MEGABYTE = 1024 * 1024
+
+# name: bundle parameters, see synthetic.write_bundle()
+SCALES = {
+    "small": {"thread_count": 1000, "dump_count": 3, "log_bytes": 20 * MEGABYTE, "rotated_log_bytes": 5 * MEGABYTE},
+    "medium": {"thread_count": 5000, "dump_count": 3, "log_bytes": 200 * MEGABYTE, "rotated_log_bytes": 50 * MEGABYTE},
+    "large": {"thread_count": 20000, "dump_count": 5, "log_bytes": 1024 * MEGABYTE, "rotated_log_bytes": 256 * MEGABYTE},
+}
+SCENARIO = {"contended_locks": 5, "waiters_per_lock": 20, "deadlocks": 1, "multiline_names": 3}
+
+def time_stage(function, repeat):
+    """Calls function repeat times and returns the run times in seconds and the last result."""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+def get_git_revision():
+    """Returns the abbreviated commit of the tree being measured, or None outside of a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_scale(scale, parameters, repeat, work_dir, stub):
+    """Generates the bundle of a scale and times every stage on it."""
+    bundle_dir = os.path.join(work_dir, scale)
+    start = time.perf_counter()
+    write_bundle(bundle_dir, **parameters, **SCENARIO)
+    generate_seconds = time.perf_counter() - start
+
+    in_memory_files = load_bundle_path(bundle_dir)
+    input_bytes = sum(len(file.getvalue()) for file in in_memory_files.values())
+    thread_groups_config = load_thread_groups_config()
+    dump_texts = [read_in_memory_file(file) for name, file in sorted(in_memory_files.items()) if name.startswith("threaddump-")]
+    analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+    dump_dates = get_dump_dates(analyses)
+    thread_count = sum(len(analysis.threads) for analysis in analyses)
+    print(f"{scale}: {thread_count} threads in {len(analyses)} dumps, {input_bytes / MEGABYTE:.0f} MB "
+          f"(generated in {generate_seconds:.1f}s)", file=sys.stderr)
+
+    def analyze_dumps():
+        for index, text in enumerate(dump_texts):
+            Analysis(index + 1, f"Thread Dump Analysis {index + 1}", {}, thread_groups_config).analyze(text)
+
+    def pipeline():
+        return run_analysis(thread_groups_config, in_memory_files, "Requests to OrderAPI time out")
+
+    stages = [
+        ("analysis_analyze", analyze_dumps, thread_count),
+        ("parse_thread_dumps", lambda: parse_thread_dumps(thread_groups_config, in_memory_files), thread_count),
+        ("analyze_thread_dumps", lambda: analyze_thread_dumps(thread_groups_config, in_memory_files, analyses), thread_count),
+        ("log_window", lambda: get_log_content(in_memory_files, dump_dates), None),
+        ("log_rules", lambda: scan_log_files(in_memory_files), None),
+        ("local_report", lambda: build_local_report(thread_groups_config, in_memory_files, "", analyses), None),
+        ("pipeline_stub_llm", pipeline, None),
+    ]
+
+    results = []
+    pipeline_results = None
+    for name, function, items in stages:
+        calls_before = stub.calls
+        runs, result = time_stage(function, repeat)
+        if name == "pipeline_stub_llm":
+            pipeline_results = result
+        entry = {
+            "name": name,
+            "scale": scale,
+            "best": round(min(runs), 4),
+            "median": round(statistics.median(runs), 4),
+            "runs": [round(seconds, 4) for seconds in runs],
+            "inputBytes": input_bytes,
+            "threads": thread_count,
+            "llmCalls": (stub.calls - calls_before) // repeat,
+        }
+        if items:
+            entry["itemsPerSecond"] = round(items / min(runs))
+        results.append(entry)
+        print(f"  {name:<22} best {entry['best'] * 1000:9.1f} ms  median {entry['median'] * 1000:9.1f} ms", file=sys.stderr)
+
+    def final_report():
+        return write_final_report(pipeline_results["customer_problem"], str(pipeline_results["log_analysis"]),
+                                  str(pipeline_results["comprehensive_thread_analysis"]),
+                                  pipeline_results["class_analysis"], str(pipeline_results["final_report"]),
+                                  output=BytesIO())
+    # reportlab is imported by the first report, keep that out of the timings
+    final_report()
+    runs, _ = time_stage(final_report, repeat)
+    results.append({"name": "write_final_report", "scale": scale, "best": round(min(runs), 4),
+                    "median": round(statistics.median(runs), 4), "runs": [round(seconds, 4) for seconds in runs],
+                    "inputBytes": input_bytes, "threads": thread_count, "llmCalls": 0})
+    print(f"  {'write_final_report':<22} best {min(runs) * 1000:9.1f} ms  median {statistics.median(runs) * 1000:9.1f} ms",
+          file=sys.stderr)
+
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    return results
+
+def compare_results(results, baseline, threshold):
+    """Prints the change of every stage against a previous result file and returns the regressions."""
+    previous = {(entry["name"], entry["scale"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["name"], entry["scale"]))
+        if before is None or not before["best"]:
+            continue
+        ratio = entry["best"] / before["best"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{entry['scale']:<7} {entry['name']:<22} {before['best'] * 1000:9.1f} ms -> {entry['best'] * 1000:9.1f} ms "
+              f"({ratio:5.2f}x) {flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append({"name": entry["name"], "scale": entry["scale"], "ratio": round(ratio, 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="small,medium", help=f"Comma-separated scales, of {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, the best and median are reported")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM waits before answering")
+    parser.add_argument("--work-dir", help="Directory for the generated bundles (a temporary directory by default)")
+    parser.add_argument("-o", "--output", help="File to write the JSON results to (stdout by default)")
+    parser.add_argument("--compare", help="Previous JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"unknown scales: {', '.join(unknown)}")
+
+    stub = StubLLM(args.llm_latency)
+    set_llm_backend(stub)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="diagnostic_analyzer_bench_")
+    try:
+        results = []
+        for scale in scales:
+            results.extend(run_scale(scale, SCALES[scale], args.repeat, work_dir, stub))
+    finally:
+        set_llm_backend(None)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = {
+        "suite": "diagnostic_analyzer",
+        "revision": get_git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "repeat": args.repeat,
+        "scales": {scale: {**SCALES[scale], **SCENARIO} for scale in scales},
+        "results": results,
+    }
+
+    exit_status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.threshold)
+        output["regressions"] = regressions
+        exit_status = 1 if regressions else 0
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    return exit_status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,460 @@
+"""Generators for synthetic Micro Integrator thread dumps, logs and bundles used by the benchmarks."""
+import gzip
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+THREAD_GROUPS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "diagnostic_analyzer_package", "ThreadGroups.json")
+
+POOL_THREAD_NAMES = [
+    "PassThroughMessageProcessor-{n}",
+    "HTTP-Sender I/O dispatcher-{n}",
+    "HTTP-Listener I/O dispatcher-{n}",
+    "HTTPS-Listener I/O dispatcher-{n}",
+    "SynapseWorker-{n}",
+    "nioEventLoopGroup-3-{n}",
+    "Timer-{n}",
+    "GC Thread#{n}",
+    "pool-{n}-thread-1",
+]
+
+IDLE_STACK = [
+    "jdk.internal.misc.Unsafe.park(java.base@17.0.8/Native Method)",
+    "java.util.concurrent.locks.LockSupport.park(java.base@17.0.8/LockSupport.java:341)",
+    "java.util.concurrent.locks.AbstractQueuedSynchronizer$ConditionNode.block(java.base@17.0.8/AbstractQueuedSynchronizer.java:506)",
+    "java.util.concurrent.ForkJoinPool.managedBlock(java.base@17.0.8/ForkJoinPool.java:3465)",
+    "java.util.concurrent.locks.AbstractQueuedSynchronizer$ConditionObject.await(java.base@17.0.8/AbstractQueuedSynchronizer.java:1623)",
+    "java.util.concurrent.LinkedBlockingQueue.take(java.base@17.0.8/LinkedBlockingQueue.java:435)",
+    "java.util.concurrent.ThreadPoolExecutor.getTask(java.base@17.0.8/ThreadPoolExecutor.java:1062)",
+    "java.util.concurrent.ThreadPoolExecutor.runWorker(java.base@17.0.8/ThreadPoolExecutor.java:1122)",
+    "java.util.concurrent.ThreadPoolExecutor$Worker.run(java.base@17.0.8/ThreadPoolExecutor.java:635)",
+    "java.lang.Thread.run(java.base@17.0.8/Thread.java:833)",
+]
+
+RUNNING_STACKS = [
+    [
+        "java.net.SocketInputStream.socketRead0(java.base@17.0.8/Native Method)",
+        "java.net.SocketInputStream.read(java.base@17.0.8/SocketInputStream.java:168)",
+        "org.apache.http.impl.io.SessionInputBufferImpl.fillBuffer(SessionInputBufferImpl.java:153)",
+        "org.apache.synapse.transport.passthru.TargetHandler.inputReady(TargetHandler.java:512)",
+        "org.apache.synapse.transport.passthru.ServerWorker.run(ServerWorker.java:180)",
+    ],
+    [
+        "org.apache.synapse.commons.json.JsonUtil.toJsonString(JsonUtil.java:1120)",
+        "org.apache.synapse.mediators.builtin.LogMediator.getLogMessage(LogMediator.java:230)",
+        "org.apache.synapse.mediators.builtin.LogMediator.mediate(LogMediator.java:130)",
+        "org.apache.synapse.mediators.AbstractListMediator.mediate(AbstractListMediator.java:109)",
+        "org.apache.synapse.core.axis2.ProxyServiceMessageReceiver.receive(ProxyServiceMessageReceiver.java:228)",
+    ],
+]
+
+# Start of the JVM the dumps are taken from, so CPU and elapsed times grow from dump to dump
+JVM_START = datetime(2024, 5, 1, 9, 0, 0)
+HOT_THREAD_EVERY = 997
+
+def _thread_header(name, number, tid, nid, daemon, uptime_seconds):
+    daemon_flag = " daemon" if daemon else ""
+    # Every thread uses a fixed share of a core, a few of them nearly all of it
+    cpu_share = 0.9 if number % HOT_THREAD_EVERY == 0 else (number * 2654435761 % 1000) / 50000
+    elapsed = max(1.0, uptime_seconds - number * 0.001)
+    return (f'"{name}" #{number}{daemon_flag} prio=5 os_prio=0 cpu={cpu_share * elapsed * 1000:.2f}ms '
+            f'elapsed={elapsed:.2f}s tid=0x{tid:016x} nid=0x{nid:x} waiting on condition  [0x{tid:016x}]')
+
+def generate_thread_dump(thread_count, frames_per_thread=30, date=None, seed=0):
+    """
+    Generates a jstack style thread dump.
+
+    Args:
+        thread_count (int): Number of threads in the dump.
+        frames_per_thread (int): Approximate stack depth of each thread.
+        date (datetime): Timestamp written at the top of the dump.
+        seed (int): Random seed, so repeated runs produce identical dumps.
+
+    Returns:
+        str: The thread dump text.
+    """
+    random.seed(seed)
+    date = date or datetime(2024, 5, 1, 10, 0, 0)
+    lines = [
+        date.strftime("%Y-%m-%d %H:%M:%S"),
+        "Full thread dump OpenJDK 64-Bit Server VM (17.0.8+7 mixed mode, sharing):",
+        "",
+    ]
+    filler = [f"org.wso2.carbon.mediation.Layer{depth}.invoke(Layer{depth}.java:{100 + depth})" for depth in range(frames_per_thread)]
+    uptime_seconds = max(60.0, (date - JVM_START).total_seconds())
+
+    for number in range(1, thread_count + 1):
+        name = random.choice(POOL_THREAD_NAMES).format(n=number)
+        tid = 0x7f0000000000 + number * 0x1000
+        lines.append(_thread_header(name, number, tid, 0x1000 + number, number % 3 != 0, uptime_seconds))
+        if random.random() < 0.2:
+            lines.append("   java.lang.Thread.State: RUNNABLE")
+            stack = random.choice(RUNNING_STACKS)
+            for frame in stack:
+                lines.append(f"\tat {frame}")
+            depth = random.randint(0, max(0, frames_per_thread - len(stack) - len(IDLE_STACK[-2:])))
+            for frame in filler[:depth]:
+                lines.append(f"\tat {frame}")
+            for frame in IDLE_STACK[-2:]:
+                lines.append(f"\tat {frame}")
+        else:
+            lines.append("   java.lang.Thread.State: WAITING (parking)")
+            lines.append(f"\tat {IDLE_STACK[0]}")
+            lines.append(f"\t- parking to wait for  <0x{0x700000000 + number % 512:016x}> (a java.util.concurrent.locks.AbstractQueuedSynchronizer$ConditionObject)")
+            for frame in IDLE_STACK[1:]:
+                lines.append(f"\tat {frame}")
+        lines.append("")
+        lines.append("   Locked ownable synchronizers:")
+        lines.append("\t- None")
+        lines.append("")
+
+    return "\n".join(lines) + "\n"
+
+def generate_thread_dump_of_size(size_bytes, frames_per_thread=30, date=None, seed=0):
+    """Generates a thread dump of roughly size_bytes characters."""
+    sample = generate_thread_dump(200, frames_per_thread, date, seed)
+    thread_count = max(1, int(200 * size_bytes / len(sample)))
+    return generate_thread_dump(thread_count, frames_per_thread, date, seed)
+
+def generate_thread_dumps(thread_count, dump_count=3, interval_seconds=10, frames_per_thread=30):
+    """
+    Generates a bundle of thread dumps named like the Micro Integrator diagnostic tool does.
+
+    Returns:
+        dict: {filename: dump_text}
+    """
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    dumps = {}
+    for i in range(1, dump_count + 1):
+        date = start + timedelta(seconds=interval_seconds * (i - 1))
+        dumps[f"threaddump-{i}-{int(date.timestamp())}.txt"] = generate_thread_dump(thread_count, frames_per_thread, date, seed=i)
+    return dumps
+
+VIRTUAL_STACK = [
+    "java.base/jdk.internal.vm.Continuation.yield(Continuation.java:357)",
+    "java.base/java.lang.VirtualThread.yieldContinuation(VirtualThread.java:431)",
+    "java.base/java.lang.VirtualThread.parkNanos(VirtualThread.java:621)",
+    "java.base/java.lang.VirtualThread.sleepNanos(VirtualThread.java:793)",
+    "java.base/java.lang.Thread.sleep(Thread.java:507)",
+    "org.wso2.carbon.mediation.VirtualWorker.run(VirtualWorker.java:42)",
+    "java.base/java.lang.VirtualThread.run(VirtualThread.java:309)",
+]
+
+def generate_sigquit_output(thread_count, dump_count=3, interval_seconds=10, frames_per_thread=30):
+    """
+    Generates console output of a JVM that received SIGQUIT dump_count times, with
+    log lines before and between the dumps and the heap summary after each dump.
+    """
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    parts = []
+    for i in range(dump_count):
+        date = start + timedelta(seconds=interval_seconds * i)
+        parts.append(f"[{date:%Y-%m-%d %H:%M:%S,000}]  INFO {{org.apache.synapse.ServerManager}} - Server ready for processing requests\n"
+                     f"[{date:%Y-%m-%d %H:%M:%S,000}]  WARN {{org.apache.synapse.transport.passthru.TargetHandler}} - Connection timeout\n")
+        parts.append(generate_thread_dump(thread_count, frames_per_thread, date, seed=i + 1))
+        parts.append("JNI global refs: 512, weak refs: 0\n\n"
+                     "Heap\n"
+                     " garbage-first heap   total 1048576K, used 524288K [0x00000000c0000000, 0x0000000100000000)\n"
+                     "  region size 1024K, 256 young (262144K), 12 survivors (12288K)\n"
+                     " Metaspace       used 120000K, committed 122000K, reserved 1163264K\n")
+    return "".join(parts)
+
+VIRTUAL_STACKS = [
+    VIRTUAL_STACK,
+    [
+        "java.base/jdk.internal.vm.Continuation.yield(Continuation.java:357)",
+        "java.base/java.lang.VirtualThread.yieldContinuation(VirtualThread.java:431)",
+        "java.base/java.lang.VirtualThread.park(VirtualThread.java:582)",
+        "java.base/java.util.concurrent.locks.LockSupport.park(LockSupport.java:369)",
+        "java.base/java.util.concurrent.LinkedBlockingQueue.take(LinkedBlockingQueue.java:435)",
+        "org.wso2.carbon.mediation.VirtualWorker.poll(VirtualWorker.java:57)",
+        "java.base/java.lang.VirtualThread.run(VirtualThread.java:309)",
+    ],
+    [
+        "java.base/sun.nio.ch.Net.poll(Native Method)",
+        "java.base/sun.nio.ch.NioSocketImpl.park(NioSocketImpl.java:191)",
+        "java.base/sun.nio.ch.NioSocketImpl.implRead(NioSocketImpl.java:309)",
+        "org.apache.http.impl.io.SessionInputBufferImpl.fillBuffer(SessionInputBufferImpl.java:153)",
+        "org.wso2.carbon.mediation.VirtualWorker.call(VirtualWorker.java:88)",
+        "java.base/java.lang.VirtualThread.run(VirtualThread.java:309)",
+    ],
+]
+CARRIER_COUNT = 8
+
+def iter_jcmd_json_dump(thread_count, virtual_thread_count=0, frames_per_thread=30, date=None, seed=0, with_states=False):
+    """
+    Yields a JDK 21 style `jcmd <pid> Thread.dump_to_file -format=json` dump in pieces,
+    so dumps with millions of virtual threads can be written without building them in memory.
+
+    Args:
+        thread_count (int): Number of platform threads, in the root container.
+        virtual_thread_count (int): Number of unnamed virtual threads, in an executor container.
+        with_states (bool): Whether to add the thread states and carriers printed by newer JDKs.
+    """
+    random.seed(seed)
+    date = date or datetime(2024, 5, 1, 10, 0, 0)
+    filler = [f"org.wso2.carbon.mediation.Layer{depth}.invoke(Layer{depth}.java:{100 + depth})" for depth in range(frames_per_thread)]
+
+    yield ('{\n  "threadDump": {\n    "processId": "4242",\n'
+           f'    "time": "{date:%Y-%m-%dT%H:%M:%S}.000000Z",\n    "runtimeVersion": "21.0.2+13-LTS",\n'
+           '    "threadContainers": [\n      {\n        "container": "<root>",\n        "parent": null,\n'
+           '        "owner": null,\n        "threads": [')
+
+    for number in range(1, thread_count + 1):
+        if number <= CARRIER_COUNT and virtual_thread_count:
+            name = f"ForkJoinPool-1-worker-{number}"
+            stack, state = list(IDLE_STACK), "WAITING"
+        elif random.random() < 0.2:
+            name = random.choice(POOL_THREAD_NAMES).format(n=number)
+            stack = random.choice(RUNNING_STACKS) + filler[:random.randint(0, frames_per_thread // 2)] + IDLE_STACK[-2:]
+            state = "RUNNABLE"
+        else:
+            name = random.choice(POOL_THREAD_NAMES).format(n=number)
+            stack, state = list(IDLE_STACK), "WAITING"
+        thread = {"tid": str(number), "name": name, "stack": stack}
+        if with_states:
+            thread["state"] = state
+        yield ("," if number > 1 else "") + "\n          " + json.dumps(thread)
+
+    yield f'\n        ],\n        "threadCount": "{thread_count}"\n      }}'
+
+    if virtual_thread_count:
+        yield (',\n      {\n        "container": "java.util.concurrent.ThreadPerTaskExecutor@5e9f23b4",\n'
+               '        "parent": "<root>",\n        "owner": null,\n        "threads": [')
+        # One template per stack, only the tid changes between virtual threads
+        templates = []
+        for stack in VIRTUAL_STACKS:
+            thread = {"tid": "TID", "name": "", "stack": stack}
+            if with_states:
+                thread.update({"state": "WAITING", "virtual": True})
+            templates.append(json.dumps(thread).split('"TID"'))
+        mounted = {"tid": "TID", "name": "", "state": "RUNNABLE", "virtual": True, "carrier": "CARRIER", "stack": RUNNING_STACKS[0]}
+        mounted_template = json.dumps(mounted)
+
+        for number in range(thread_count + 1, thread_count + virtual_thread_count + 1):
+            if with_states and number % 1000 == 0:
+                text = mounted_template.replace("TID", str(number)).replace("CARRIER", str(number // 1000 % CARRIER_COUNT + 1))
+            else:
+                prefix, suffix = templates[number % len(templates)]
+                text = f'{prefix}"{number}"{suffix}'
+            yield ("," if number > thread_count + 1 else "") + "\n          " + text
+        yield f'\n        ],\n        "threadCount": "{virtual_thread_count}"\n      }}'
+
+    yield "\n    ]\n  }\n}\n"
+
+def generate_jcmd_json_dump(thread_count, virtual_thread_count=0, frames_per_thread=30, date=None, seed=0, with_states=False):
+    """Generates a jcmd JSON thread dump as text, see iter_jcmd_json_dump()."""
+    return "".join(iter_jcmd_json_dump(thread_count, virtual_thread_count, frames_per_thread, date, seed, with_states))
+
+CONTENDED_LOCK_CLASSES = [
+    "org.apache.commons.dbcp.PoolingDataSource",
+    "org.apache.synapse.transport.passthru.TargetConnections",
+    "org.apache.synapse.endpoints.EndpointContext",
+]
+CONTENDED_STACK = [
+    "org.apache.synapse.transport.passthru.TargetConnections.getConnection(TargetConnections.java:120)",
+    "org.apache.synapse.transport.passthru.DeliveryAgent.submit(DeliveryAgent.java:142)",
+    "org.apache.synapse.transport.passthru.PassThroughHttpSender.invoke(PassThroughHttpSender.java:271)",
+    "org.apache.synapse.core.axis2.Axis2FlexibleMEPClient.send(Axis2FlexibleMEPClient.java:619)",
+    "org.apache.synapse.mediators.builtin.SendMediator.mediate(SendMediator.java:121)",
+    "org.apache.synapse.transport.passthru.ServerWorker.run(ServerWorker.java:180)",
+    "java.util.concurrent.ThreadPoolExecutor.runWorker(java.base@17.0.8/ThreadPoolExecutor.java:1136)",
+    "java.lang.Thread.run(java.base@17.0.8/Thread.java:833)",
+]
+
+# Function to size the thread pools of a dump from ThreadGroups.json
+def get_pool_thread_counts(scale=1.0, default_count=200):
+    """
+    Returns {poolName: thread_count} for every pool of ThreadGroups.json, its
+    configured size (or default_count when not a number) multiplied by scale.
+    """
+    with open(THREAD_GROUPS_PATH, encoding="utf-8") as config_file:
+        groups = json.load(config_file)["threadGroups"]
+    counts = {}
+    for group in groups:
+        size = group["threadCount"] if isinstance(group["threadCount"], int) else default_count
+        counts[group["poolName"]] = max(1, int(size * scale))
+    return counts
+
+def _lock_address(index):
+    return f"0x{0x600000000 + index * 0x40:016x}"
+
+def generate_pool_thread_dump(pool_counts, date=None, seed=0, contended_locks=0, waiters_per_lock=0, deadlocks=0,
+                              multiline_names=0, frames_per_thread=30):
+    """
+    Generates a jstack style thread dump with the given number of threads per pool.
+
+    Args:
+        pool_counts (dict): {poolName: thread_count}, see get_pool_thread_counts().
+        date (datetime): Timestamp written at the top of the dump.
+        seed (int): Random seed, so repeated runs produce identical dumps.
+        contended_locks (int): Locks held by a running thread while waiters_per_lock threads are BLOCKED on each.
+        waiters_per_lock (int): Threads blocked on every contended lock.
+        deadlocks (int): Pairs of threads that each hold the lock the other one waits for.
+        multiline_names (int): Threads whose name contains a newline, split over two header lines.
+        frames_per_thread (int): Approximate stack depth of the idle and running threads.
+
+    Returns:
+        str: The thread dump text.
+    """
+    random.seed(seed)
+    date = date or datetime(2024, 5, 1, 10, 0, 0)
+    uptime_seconds = max(60.0, (date - JVM_START).total_seconds())
+    filler = [f"org.wso2.carbon.mediation.Layer{depth}.invoke(Layer{depth}.java:{100 + depth})" for depth in range(frames_per_thread)]
+    lines = [
+        date.strftime("%Y-%m-%d %H:%M:%S"),
+        "Full thread dump OpenJDK 64-Bit Server VM (17.0.8+7 mixed mode, sharing):",
+        "",
+    ]
+    number = 0
+
+    def add_thread(name, state, frames, locks=()):
+        nonlocal number
+        number += 1
+        tid = 0x7f0000000000 + number * 0x1000
+        header = _thread_header(name, number, tid, 0x1000 + number, True, uptime_seconds)
+        if "\n" in name:
+            # jstack prints the name as is, so the header continues on the next line
+            first, rest = header.split("\n", 1)
+            lines.append(first)
+            lines.append(rest)
+        else:
+            lines.append(header)
+        lines.append(f"   java.lang.Thread.State: {state}")
+        for index, frame in enumerate(frames):
+            lines.append(f"\tat {frame}")
+            for lock_index, (action, address, class_name) in enumerate(locks):
+                if lock_index == index:
+                    lines.append(f"\t- {action} <{address}> (a {class_name})")
+        lines.append("")
+        lines.append("   Locked ownable synchronizers:")
+        lines.append("\t- None")
+        lines.append("")
+
+    pool_names = list(pool_counts)
+    pool_iterators = {pool_name: iter(range(1, pool_counts[pool_name] + 1)) for pool_name in pool_names}
+
+    def next_pool_thread_name(pool_name="PassThroughMessageProcessor"):
+        thread_number = next(pool_iterators.get(pool_name, iter(())), None)
+        if thread_number is None:
+            return f"{pool_name}-extra-{number}"
+        return f"{pool_name}-{thread_number}"
+
+    for lock_index in range(contended_locks):
+        address = _lock_address(lock_index)
+        class_name = CONTENDED_LOCK_CLASSES[lock_index % len(CONTENDED_LOCK_CLASSES)]
+        add_thread(next_pool_thread_name(), "RUNNABLE", CONTENDED_STACK, [("locked", address, class_name)])
+        for _ in range(waiters_per_lock):
+            add_thread(next_pool_thread_name(), "BLOCKED (on object monitor)", CONTENDED_STACK,
+                       [("waiting to lock", address, class_name)])
+
+    for deadlock_index in range(deadlocks):
+        first = _lock_address(contended_locks + 2 * deadlock_index)
+        second = _lock_address(contended_locks + 2 * deadlock_index + 1)
+        class_name = CONTENDED_LOCK_CLASSES[deadlock_index % len(CONTENDED_LOCK_CLASSES)]
+        add_thread(next_pool_thread_name("SynapseWorker"), "BLOCKED (on object monitor)", CONTENDED_STACK,
+                   [("waiting to lock", second, class_name), ("locked", first, class_name)])
+        add_thread(next_pool_thread_name("SynapseWorker"), "BLOCKED (on object monitor)", CONTENDED_STACK,
+                   [("waiting to lock", first, class_name), ("locked", second, class_name)])
+
+    for index in range(multiline_names):
+        add_thread(f"Endpoint worker {index} for\nOrderAPI", "WAITING (parking)", IDLE_STACK)
+
+    for pool_name in pool_names:
+        for thread_number in pool_iterators[pool_name]:
+            name = f"{pool_name}-{thread_number}"
+            if random.random() < 0.2:
+                stack = random.choice(RUNNING_STACKS)
+                depth = random.randint(0, max(0, frames_per_thread - len(stack) - 2))
+                add_thread(name, "RUNNABLE", stack + filler[:depth] + IDLE_STACK[-2:])
+            else:
+                add_thread(name, "WAITING (parking)", IDLE_STACK)
+
+    return "\n".join(lines) + "\n"
+
+CARBON_INFO = "TID: [-1234] [] [{time},{millis:03d}]  INFO {{org.apache.synapse.mediators.builtin.LogMediator}} - To: /services/OrderAPI, MessageID: urn:uuid:{index:08d}, Direction: request {{PassThroughMessageProcessor-{thread}}}\n"
+CARBON_WARN = "TID: [-1234] [] [{time},{millis:03d}]  WARN {{org.apache.synapse.core.axis2.TimeoutHandler}} - Expiring message ID : urn:uuid:{index:08d}; dropping message after ENDPOINT timeout of : 60 seconds {{SynapseWorker-{thread}}}\n"
+CARBON_ERROR = "TID: [-1234] [] [{time},{millis:03d}] ERROR {{org.apache.synapse.transport.passthru.util.RelayUtils}} - Error while building Passthrough stream {{PassThroughMessageProcessor-{thread}}}\n"
+CARBON_STACK_TRACE = (
+    "org.apache.axis2.AxisFault: Error while building Passthrough stream\n"
+    "\tat org.apache.synapse.transport.passthru.util.RelayUtils.handleException(RelayUtils.java:463)\n"
+    "\tat org.apache.synapse.transport.passthru.util.RelayUtils.buildMessage(RelayUtils.java:165)\n"
+    "\tat org.apache.synapse.mediators.AbstractListMediator.mediate(AbstractListMediator.java:109)\n"
+    "\tat org.apache.synapse.transport.passthru.ServerWorker.run(ServerWorker.java:180)\n"
+    "Caused by: java.net.SocketTimeoutException: Read timed out\n"
+    "\tat org.apache.synapse.transport.passthru.Pipe.consume(Pipe.java:248)\n"
+    "\t... 12 more\n"
+)
+
+def iter_carbon_log(size_bytes, start=None, seconds_per_line=0.01, error_every=500, warn_every=200, seed=0,
+                    chunk_lines=10000):
+    """
+    Yields a wso2carbon.log of about size_bytes in chunks of bytes, so GB-scale logs can be written without building them in memory.
+
+    Mostly INFO lines, with a timeout warning every warn_every lines and an
+    error with a multi-line stack trace every error_every lines.
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2024, 5, 1, 9, 0, 0)
+    size = 0
+    index = 0
+    while size < size_bytes:
+        chunk = []
+        for _ in range(chunk_lines):
+            moment = start + timedelta(seconds=index * seconds_per_line)
+            fields = {"time": moment.strftime("%Y-%m-%d %H:%M:%S"), "millis": moment.microsecond // 1000,
+                      "index": index, "thread": rng.randint(1, 200)}
+            if index % error_every == 0:
+                chunk.append(CARBON_ERROR.format(**fields))
+                chunk.append(CARBON_STACK_TRACE)
+            elif index % warn_every == 0:
+                chunk.append(CARBON_WARN.format(**fields))
+            else:
+                chunk.append(CARBON_INFO.format(**fields))
+            index += 1
+        data = "".join(chunk).encode()
+        size += len(data)
+        yield data
+
+# Average size of a generated log line, used to spread the lines over the time a log covers
+CARBON_LINE_BYTES = 190
+LOG_HOURS = 6
+
+def write_bundle(directory, thread_count, dump_count=3, interval_seconds=10, log_bytes=0, rotated_log_bytes=0,
+                 contended_locks=0, waiters_per_lock=0, deadlocks=0, multiline_names=0):
+    """
+    Writes a diagnostic bundle as the Micro Integrator diagnostic tool collects it.
+
+    The thread dumps spread thread_count threads over the ThreadGroups.json
+    pools; the log covers the dumps, and the rotated log, gzipped, the time before it.
+
+    Returns:
+        str: The bundle directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    configured = get_pool_thread_counts()
+    scale = thread_count / sum(configured.values())
+    pool_counts = {pool_name: max(1, int(count * scale)) for pool_name, count in configured.items()}
+
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    for i in range(1, dump_count + 1):
+        date = start + timedelta(seconds=interval_seconds * (i - 1))
+        text = generate_pool_thread_dump(pool_counts, date, i, contended_locks, waiters_per_lock, deadlocks, multiline_names)
+        with open(os.path.join(directory, f"threaddump-{i}-{int(date.timestamp())}.txt"), "w", encoding="utf-8") as dump_file:
+            dump_file.write(text)
+
+    # The current log covers the six hours up to a minute after the last dump, the rotated log the day before
+    log_end = start + timedelta(seconds=interval_seconds * dump_count + 60)
+    if log_bytes:
+        seconds_per_line = LOG_HOURS * 3600 / max(1, log_bytes // CARBON_LINE_BYTES)
+        with open(os.path.join(directory, "wso2carbon.log"), "wb") as log_file:
+            for chunk in iter_carbon_log(log_bytes, log_end - timedelta(hours=LOG_HOURS), seconds_per_line):
+                log_file.write(chunk)
+    if rotated_log_bytes:
+        seconds_per_line = 24 * 3600 / max(1, rotated_log_bytes // CARBON_LINE_BYTES)
+        with gzip.open(os.path.join(directory, "wso2carbon.log.1.gz"), "wb", compresslevel=1) as log_file:
+            for chunk in iter_carbon_log(rotated_log_bytes, log_end - timedelta(hours=LOG_HOURS + 24), seconds_per_line, seed=1):
+                log_file.write(chunk)
+    return directory
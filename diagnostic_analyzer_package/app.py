@@ -1,20 +1,32 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g
 from dotenv import load_dotenv
 import sys
 import os
-import json
-from io import BytesIO
-from datetime import timedelta
+import uuid
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
 from flask import Response
 import logging
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from diagnostic_analyzer_package.thread_analyzer import analyze_thread_dumps_and_extract_problems, get_comprehensive_thread_analysis
+from diagnostic_analyzer_package.thread_analyzer import (parse_thread_dumps, analyze_thread_dumps_and_extract_problems,
+                                                         get_comprehensive_thread_analysis)
 from diagnostic_analyzer_package.log_analyzer import get_log_content, analyze_error_log, fetch_and_analyze_files
-from diagnostic_analyzer_package.utils import read_package_file
-from diagnostic_analyzer_package.report import write_final_report
+from diagnostic_analyzer_package.log_ingest import get_dump_dates
+from diagnostic_analyzer_package.log_rules import scan_log_files
+from diagnostic_analyzer_package.utils import load_thread_groups_config, load_log_rules_config, cleanup_thread
+from diagnostic_analyzer_package.report import (open_cached_final_report, iter_file_chunks, get_report_cache_key, iter_report,
+                                                 get_final_report_model, get_local_report_model, get_report_format,
+                                                 REPORT_EXPORTERS)
+from diagnostic_analyzer_package.local_report import build_local_report
+from diagnostic_analyzer_package.bundle_loader import load_bundle_files, BundleError, BundleTooLargeError
 from diagnostic_analyzer_package.final_analyzer import get_diagnostic_conclusion
+from diagnostic_analyzer_package.metrics import (timed_stage, start_request_timings, stop_request_timings,
+                                                 get_request_timings, render_metrics, HTTP_SECONDS)
+from diagnostic_analyzer_package.profiling import AnalysisProfiler, get_profile_dir, is_profile_requested, PROFILE_HEADER
+from diagnostic_analyzer_package.singleflight import SingleFlight, get_analysis_key
 
 app = Flask(__name__, static_folder='frontend/build', static_url_path='/')
 
@@ -34,123 +46,311 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.WARNING)
 
-# Load thread groups configuration
-thread_groups_config = json.loads(read_package_file('ThreadGroups.json'))
+# Analysis results of this worker by analysis ID, and report artifacts by analysis ID and section content hash
+memory_store = {'analysis_data': {}, 'results': {}, 'reports': {}}
+data_timestamps = {}
+memory_store_lock = threading.Lock()
+threading.Thread(target=cleanup_thread, args=(memory_store, data_timestamps, memory_store_lock), daemon=True).start()
+# Analyses of /analyze in flight in this worker, keyed by the content hash of the upload
+analysis_flights = SingleFlight("analysis")
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+def store_analysis_data(analysis_id, analysis):
+    """Keeps the sections of an analysis waiting for class selection, the only input /analyze_classes accepts."""
+    with memory_store_lock:
+        memory_store['analysis_data'][analysis_id] = analysis
+        data_timestamps[analysis_id] = datetime.now(timezone.utc)
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    # Get form data
-    customer_problem = request.form.get('customer_problem', '')
-    
-    # Handle file upload
-    if 'diagnostic_files' not in request.files:
-        return jsonify({"error": "No files uploaded"}), 400
+def store_results(analysis_id, results):
+    """Keeps the results of an analysis so its report can be downloaded by ID."""
+    with memory_store_lock:
+        memory_store['results'][analysis_id] = results
+        data_timestamps[analysis_id] = datetime.now(timezone.utc)
 
-    # Save uploaded files to the temp directory
-    files = request.files.getlist('diagnostic_files')
+def get_report_artifacts(analysis_id, customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis):
+    """
+    Returns the report artifacts of an analysis, running the final LLM call only the first time.
+
+    Artifacts are kept per analysis ID and content hash of the sections, so
+    sections that changed since the last download get a new report instead
+    of the stored one.
+
+    Returns:
+        dict: The conclusion, report sections, content key and the report model.
+    """
+    content_key = get_report_cache_key(customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis)
+    with memory_store_lock:
+        artifacts = memory_store['reports'].get(analysis_id, {}).get(content_key)
+    if artifacts is not None:
+        return artifacts
+
+    final_report = get_diagnostic_conclusion(
+        customer_problem,
+        log_analysis,
+        comprehensive_thread_analysis,
+        class_analysis
+    )
+    sections = (customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis, str(final_report))
+    artifacts = {
+        'sections': sections,
+        'conclusion': str(final_report),
+        'key': get_report_cache_key(*sections),
+        'report': get_final_report_model(*sections),
+    }
+
+    with memory_store_lock:
+        memory_store['reports'].setdefault(analysis_id, {})[content_key] = artifacts
+        data_timestamps[analysis_id] = datetime.now(timezone.utc)
+    return artifacts
+
+def get_requested_report_format(default='pdf'):
+    """
+    Returns the report format asked for by ?format=, or negotiated from the Accept header.
+
+    Returns None if ?format= names a format without an exporter.
+    """
+    if 'format' in request.args:
+        return get_report_format(request.args['format'])
 
+    # Listed PDF first so clients accepting anything keep getting the PDF
+    formats = [default] + [name for name in REPORT_EXPORTERS if name != default]
+    mimetype = request.accept_mimetypes.best_match([REPORT_EXPORTERS[name]['mimetype'] for name in formats])
+    for name in formats:
+        if REPORT_EXPORTERS[name]['mimetype'] == mimetype:
+            return name
+    return default
+
+def load_uploaded_files():
+    """
+    Loads the uploaded diagnostic files, expanding zip, tar.gz and .gz uploads from the request stream.
+
+    Returns:
+        tuple: ({filename: BytesIO}, None), or (None, error response) for unreadable or oversized archives.
+    """
+    files = request.files.getlist('diagnostic_files')
     logger.info(f"Received {len(files)} files for analysis.")
+    try:
+        with timed_stage("upload_decode"):
+            return load_bundle_files((file.filename, file.stream) for file in files), None
+    except BundleTooLargeError as e:
+        return None, (jsonify({"error": str(e)}), 413)
+    except BundleError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
+def send_report_artifact(artifacts, report_format):
+    """Sends a stored report artifact, answering 304 when the client already has it."""
+    etag = f"{artifacts['key']}-{report_format}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    exporter = REPORT_EXPORTERS[report_format]
+    filename = f"final_diagnostic_report{exporter['extension']}"
+    if report_format == 'pdf':
+        # Rendered once into the report cache, then streamed from disk
+        report_file = open_cached_final_report(*artifacts['sections'])
+        response = Response(iter_file_chunks(report_file), mimetype=exporter['mimetype'])
+        response.headers['Content-Length'] = str(os.fstat(report_file.fileno()).st_size)
+        # Also closed when the response is never streamed
+        response.call_on_close(report_file.close)
+    else:
+        # Lightweight formats are streamed while they are rendered
+        response = Response(iter_report(artifacts['report'], report_format), mimetype=exporter['mimetype'])
+
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Vary'] = 'Accept'
+    response.set_etag(etag)
+    return response
+
+@app.before_request
+def start_request_metrics():
+    # Every request collects its own stage timing breakdown
+    g.request_start = time.perf_counter()
+    g.request_timings_token = start_request_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint or 'unknown',
+                             method=request.method, status=response.status_code)
+    return response
 
-    in_memory_files = {}
-    for file in files:
-            file_content = file.read()
-            in_memory_file = BytesIO(file_content)
-            in_memory_files[file.filename] = in_memory_file
+@app.teardown_request
+def stop_request_metrics(error=None):
+    token = g.pop('request_timings_token', None)
+    if token is not None:
+        stop_request_timings(token)
+    # Saves the profile and frees the profiler when the analysis failed half way
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format, for the worker process that answers the scrape
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def run_upload_analysis(thread_groups_config, in_memory_files, customer_problem):
+    """
+    Runs the thread dump and log analysis of an upload for /analyze.
+
+    The result is shared by identical uploads in flight, so it holds no
+    per-request data such as the analysis ID.
+
+    Returns:
+        dict: The analysis sections of the upload.
+    """
     # Analyze thread dumps
+    analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+    log_signatures = scan_log_files(in_memory_files)
     thread_analysis, problem_threads = analyze_thread_dumps_and_extract_problems(
-        thread_groups_config, in_memory_files, customer_problem
-    )
+        thread_groups_config, in_memory_files, customer_problem, analyses
+    ) or ("Thread dump analysis failed.", [])
+
+    # Get the log records around the thread dumps
+    log_content = get_log_content(in_memory_files, get_dump_dates(analyses))
     
     if problem_threads:
         comprehensive_thread_analysis = get_comprehensive_thread_analysis(
-            thread_analysis, problem_threads, customer_problem, log_content
+            thread_analysis, problem_threads, customer_problem, log_content, get_dump_dates(analyses), analyses
         )
     else:
         comprehensive_thread_analysis = "Not applicable - no problematic threads identified."
 
-    # Get log content
-    log_content = get_log_content(in_memory_files)
-
     if log_content:
-        log_analysis, suspected_classes, error_message = analyze_error_log(log_content, customer_problem)
+        log_analysis, suspected_classes, error_message = analyze_error_log(log_content, customer_problem, log_signatures)
     else:
         log_analysis = "No log content available for analysis."
         suspected_classes = []
         error_message = ""
 
-    # Save analysis data 
-    analysis_data = {
-        'customerProblem': customer_problem,
-        'problemThreads': problem_threads,
-        'suspectedClasses': suspected_classes,
-        'threadAnalysis': thread_analysis,
-        'comprehensiveThreadAnalysis': comprehensive_thread_analysis,
-        'logAnalysis': log_analysis,
-        'customerProblem': error_message,
+    return {
+        'customer_problem': customer_problem,
+        'problem_threads': problem_threads,
+        'suspected_classes': suspected_classes,
+        'error_message': error_message,
+        'log_signatures': log_signatures,
+        'thread_analysis': thread_analysis,
+        'comprehensive_thread_analysis': comprehensive_thread_analysis,
+        'log_analysis': log_analysis,
     }
 
-    # If there are suspected classes, redirect to class selection
-    if suspected_classes:
-        return  {"success": True, "analysis_data": analysis_data}
-        
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def serve(path):
+    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
+        return send_from_directory(app.static_folder, path)
     else:
-        
-        # Store results in a file
-        results = {
-            'customer_problem': customer_problem,
-            'problem_threads': problem_threads,
-            'thread_analysis': thread_analysis,
-            'comprehensive_thread_analysis': comprehensive_thread_analysis,
-            'log_analysis': log_analysis,
-            'class_analysis': None
+        return send_from_directory(app.static_folder, 'index.html')
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    # Get form data
+    customer_problem = request.form.get('customer_problem', '')
+    
+    # Handle file upload
+    if 'diagnostic_files' not in request.files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    in_memory_files, error_response = load_uploaded_files()
+    if error_response:
+        return error_response
+
+    # Every request gets its own ID, even when it shares the analysis of an identical upload
+    analysis_id = uuid.uuid4().hex
+
+    # Opt-in profile of the analysis stages, saved under the analysis ID
+    profiler = None
+    if is_profile_requested(request.headers.get(PROFILE_HEADER)):
+        profiler = g.profiler = AnalysisProfiler(os.path.join(get_profile_dir(), analysis_id))
+        profiler.start()
+
+    # Identical uploads in flight share one analysis and its LLM calls
+    thread_groups_config = load_thread_groups_config()
+    key = get_analysis_key(in_memory_files, customer_problem, thread_groups_config, load_log_rules_config())
+    analysis, shared = analysis_flights.do(key, run_upload_analysis, thread_groups_config, in_memory_files, customer_problem)
+
+    profile = profiler.stop() if profiler else None
+
+    # If there are suspected classes, redirect to class selection
+    if analysis['suspected_classes']:
+        store_analysis_data(analysis_id, analysis)
+        analysis_data = {
+            'analysis_id': analysis_id,
+            'customerProblem': customer_problem,
+            'problemThreads': analysis['problem_threads'],
+            'suspectedClasses': analysis['suspected_classes'],
+            'logSignatures': analysis['log_signatures'],
+            'threadAnalysis': analysis['thread_analysis'],
+            'comprehensiveThreadAnalysis': analysis['comprehensive_thread_analysis'],
+            'logAnalysis': analysis['log_analysis'],
+            'errorMessage': analysis['error_message'],
         }
+        return {"success": True, "analysis_data": analysis_data, "profile": profile,
+                "shared": shared, "timings": get_request_timings()}
+
+    # Store results in a file
+    results = {
+        'analysis_id': analysis_id,
+        'customer_problem': customer_problem,
+        'problem_threads': analysis['problem_threads'],
+        'thread_analysis': analysis['thread_analysis'],
+        'comprehensive_thread_analysis': analysis['comprehensive_thread_analysis'],
+        'log_analysis': analysis['log_analysis'],
+        'log_signatures': analysis['log_signatures'],
+        'class_analysis': None
+    }
+    store_results(analysis_id, results)
+
+    return {"success": True, "results": results, "profile": profile, "shared": shared, "timings": get_request_timings()}
+
+@app.route('/analyze_local', methods=['POST'])
+def analyze_local():
+    # Deterministic report from the parsed data only, no LLM calls
+    customer_problem = request.form.get('customer_problem', '')
+
+    if 'diagnostic_files' not in request.files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    in_memory_files, error_response = load_uploaded_files()
+    if error_response:
+        return error_response
 
-        return ({"success": True, "results": results})
+    report = build_local_report(load_thread_groups_config(), in_memory_files, customer_problem)
+
+    report_format = get_report_format(request.args.get('format', ''))
+    if report_format:
+        exporter = REPORT_EXPORTERS[report_format]
+        return Response(
+            iter_report(get_local_report_model(report), report_format),
+            mimetype=exporter['mimetype'],
+            headers={
+                'Content-Disposition': f"attachment; filename=local_diagnostic_report{exporter['extension']}"
+            }
+        )
+
+    return jsonify({"success": True, "report": report, "timings": get_request_timings()})
 
 @app.route('/analyze_classes', methods=['POST'])
 def analyze_classes():
     # Get JSON data from request
     data = request.get_json(force=True)  # force=True to parse even if content-type is wrong
 
-    # Extract everything from JSON payload
+    # The sections come from the stored analysis, never from the request, so the
+    # results stored under the ID (and its shareable report link) are the server's own
+    analysis_id = data.get('analysis_id')
+    with memory_store_lock:
+        analysis = memory_store['analysis_data'].get(analysis_id)
+    if analysis is None:
+        return jsonify({"error": "Unknown or expired analysis ID"}), 404
+
     selected_class_names = data.get('selected_classes', [])
-    original_suspected_classes = data.get('suspected_classes', [])
-    log_analysis = data.get('log_analysis', '')
-    comprehensive_thread_analysis = data.get('comprehensive_thread_analysis', '')
-    customer_problem = data.get('customer_problem', '')
-    error_message = data.get('error_message', '')
-    problem_threads = data.get('problem_threads', [])
-    thread_analysis = data.get('thread_analysis', '')
-
-    # Find the full class objects from the original suspected_classes
-    selected_classes = []
-
-    # Check if the suspected classes are already in dictionary format
-    if original_suspected_classes and isinstance(original_suspected_classes[0], dict):
-        # Filter the original suspected classes to only include those selected
-        for sus_class in original_suspected_classes:
-            if sus_class.get('class') in selected_class_names:
-                selected_classes.append(sus_class)
-    else:
-        # If they're just strings
-        logger.warning(f"suspected_classes are not in dictionary format: {original_suspected_classes}")
-        # Create mock dictionaries for the selected classes
-        for class_name in selected_class_names:
-            # This is a fallback approach - these are dummy values
-            selected_classes.append({
-                "class": class_name,
-                "package": "unknown.package",
-                "issue_line": 1
-            })
+    customer_problem = analysis['customer_problem']
+    log_analysis = analysis['log_analysis']
+
+    # Only classes suspected by the log analysis can be selected
+    selected_classes = [sus_class for sus_class in analysis['suspected_classes']
+                        if isinstance(sus_class, dict) and sus_class.get('class') in selected_class_names]
 
     # Perform class analysis
     class_analysis = None
@@ -160,7 +360,7 @@ def analyze_classes():
             class_analysis = fetch_and_analyze_files(
                 selected_classes,  # Now this is a list of dictionaries
                 customer_problem, 
-                error_message,
+                analysis['error_message'],
                 log_analysis
             )
         except Exception as e:
@@ -169,15 +369,17 @@ def analyze_classes():
             return jsonify({"error": f"Error analyzing classes: {str(e)}"}), 500
 
     results = {
+        "analysis_id": analysis_id,
         "class_analysis": class_analysis,
         "log_analysis": log_analysis,
-        "comprehensive_thread_analysis": comprehensive_thread_analysis,
+        "comprehensive_thread_analysis": analysis['comprehensive_thread_analysis'],
         "customer_problem": customer_problem,
-        "problem_threads": problem_threads,
-        "thread_analysis": thread_analysis
+        "problem_threads": analysis['problem_threads'],
+        "thread_analysis": analysis['thread_analysis']
     }
+    store_results(analysis_id, results)
     
-    return jsonify({"success": True, "results": results})
+    return jsonify({"success": True, "results": results, "timings": get_request_timings()})
 
 @app.route('/download_report', methods=['POST'])
 def download_report():
@@ -191,30 +393,48 @@ def download_report():
     customer_problem = data.get('customer_problem', '')
     class_analysis = data.get('class_analysis', '')
 
-        # Generate final report
-    final_report = get_diagnostic_conclusion(
+    report_format = get_requested_report_format()
+    if report_format is None:
+        return jsonify({"error": f"Unsupported report format: {request.args['format']}"}), 400
+
+    # Clients that do not send an analysis ID share artifacts by report content
+    analysis_id = data.get('analysis_id') or get_report_cache_key(
+        customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis
+    )
+
+    # Generate final report (the conclusion is computed once per analysis)
+    artifacts = get_report_artifacts(
+        analysis_id,
         customer_problem,
         log_analysis,
         comprehensive_thread_analysis,
         class_analysis
     )
-    
-    # Generate PDF Report
-    buffer = write_final_report(
-        customer_problem, 
-        log_analysis, 
-        comprehensive_thread_analysis, 
-        class_analysis=class_analysis, 
-        final_report=final_report
-    )
-    
-    return Response(
-        buffer,
-        mimetype='application/pdf',
-        headers={
-            'Content-Disposition': 'attachment; filename=final_diagnostic_report.pdf'
-        }
+
+    return send_report_artifact(artifacts, report_format)
+
+@app.route('/download_report/<analysis_id>', methods=['GET'])
+def download_report_by_id(analysis_id):
+    # Shareable link to the report of a stored analysis
+    report_format = get_requested_report_format()
+    if report_format is None:
+        return jsonify({"error": f"Unsupported report format: {request.args['format']}"}), 400
+
+    # Only built from the stored results, never from sections a client posted
+    with memory_store_lock:
+        results = memory_store['results'].get(analysis_id)
+    if results is None:
+        return jsonify({"error": "Unknown or expired analysis ID"}), 404
+
+    artifacts = get_report_artifacts(
+        analysis_id,
+        results.get('customer_problem', ''),
+        results.get('log_analysis', ''),
+        results.get('comprehensive_thread_analysis', ''),
+        results.get('class_analysis', '')
     )
 
+    return send_report_artifact(artifacts, report_format)
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import logging
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from .pipeline import run_analysis
+from .report import (get_final_report_model, get_local_report_model, render_report_pdf, export_report,
+                     get_report_format, REPORT_EXPORTERS)
+from .local_report import build_local_report
+from .thread_analyzer import parse_thread_dumps
+from .stack_aggregator import aggregate_stacks, to_collapsed_stacks
+from .utils import load_thread_groups_config, set_llm_batch
+from .bundle_loader import load_bundle_path, is_bundle_archive, strip_archive_suffix
+from .metrics import start_request_timings, stop_request_timings, format_request_timings
+from .profiling import AnalysisProfiler
+from .batch_api import BatchCollector, create_batch_client, DEFAULT_POLL_SECONDS
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+PROBLEM_FILENAME = "problem.txt"
+
+# Function to list the bundles given as a directory or a manifest file
+def discover_bundles(source, default_problem=""):
+    """
+    Lists the diagnostic bundles to analyze.
+
+    A directory source contains one sub-directory or archive (zip, tar, tar.gz
+    or .gz) per bundle. A manifest source
+    is either a JSON list (of paths, or objects with "path", and optionally
+    "name" and "customer_problem") or a text file with one bundle path per line.
+    Relative manifest paths are resolved against the manifest location. The
+    problem.txt of a bundle is only read from folders, archived bundles take
+    their customer problem from the manifest or the default.
+
+    Args:
+        source (str): Bundle directory or manifest file.
+        default_problem (str): Customer problem used when a bundle does not provide one.
+
+    Returns:
+        list: A list of {"name", "path", "customer_problem"} dictionaries.
+    """
+    if os.path.isdir(source):
+        entries = [name for name in sorted(os.listdir(source))
+                   if os.path.isdir(os.path.join(source, name)) or is_bundle_archive(os.path.join(source, name))]
+        base_dir = source
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding='utf-8') as manifest:
+            if source.endswith('.json'):
+                entries = json.load(manifest)
+            else:
+                entries = [line.strip() for line in manifest
+                           if line.strip() and not line.strip().startswith('#')]
+
+    bundles = []
+    used_names = set()
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        path = os.path.join(base_dir, entry["path"])
+        name = entry.get("name") or strip_archive_suffix(os.path.basename(os.path.normpath(path)))
+
+        # Keep output file names unique when bundles share a folder name
+        unique_name = name
+        suffix = 2
+        while unique_name in used_names:
+            unique_name = f"{name}-{suffix}"
+            suffix += 1
+        used_names.add(unique_name)
+
+        customer_problem = entry.get("customer_problem")
+        if customer_problem is None:
+            problem_path = os.path.join(path, PROBLEM_FILENAME)
+            if os.path.isfile(problem_path):
+                with open(problem_path, encoding='utf-8') as problem_file:
+                    customer_problem = problem_file.read().strip()
+            else:
+                customer_problem = default_problem
+
+        bundles.append({"name": unique_name, "path": path, "customer_problem": customer_problem})
+
+    return bundles
+
+# Function to analyze one bundle and write its reports (runs in a worker process)
+def analyze_bundle(bundle, output_dir, thread_groups_config, analyze_classes=False, local=False, report_formats=("pdf",),
+                   profile=False):
+    """
+    Analyzes a single bundle and writes the <name>.json results and a report per
+    format, such as <name>.pdf or <name>.md, to output_dir (and <name>.collapsed
+    flame graph stacks in local mode, and <name>.pstats and <name>.profile.txt
+    when profiling).
+
+    Args:
+        bundle (dict): A bundle returned by discover_bundles().
+        output_dir (str): Directory the reports are written to.
+        thread_groups_config (dict): Configuration for thread groups.
+        analyze_classes (bool): Whether to analyze all suspected classes.
+        local (bool): Whether to build the local report without any LLM call.
+        report_formats (tuple): Report formats to export, see report.REPORT_EXPORTERS.
+        profile (bool): Whether to profile the analysis with cProfile and tracemalloc.
+
+    Returns:
+        dict: Timing and size statistics of the bundle, with the time of every stage under "timings".
+    """
+    start = time.perf_counter()
+    timings_token = start_request_timings()
+    stats = {"name": bundle["name"], "input_bytes": 0, "success": False, "error": None}
+    profiler = AnalysisProfiler(os.path.join(output_dir, bundle["name"])) if profile else None
+    if profiler:
+        profiler.start()
+
+    try:
+        in_memory_files = load_bundle_path(bundle["path"])
+        stats["input_bytes"] = sum(len(file.getvalue()) for file in in_memory_files.values())
+
+        if local:
+            analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+            results = build_local_report(thread_groups_config, in_memory_files, bundle["customer_problem"], analyses)
+
+            # Collapsed stacks of all dumps, for flamegraph.pl or speedscope
+            with open(os.path.join(output_dir, f"{bundle['name']}.collapsed"), 'w', encoding='utf-8') as collapsed_file:
+                collapsed_file.write(to_collapsed_stacks(aggregate_stacks(analyses)))
+        else:
+            results = run_analysis(thread_groups_config, in_memory_files, bundle["customer_problem"], analyze_classes)
+
+        with open(os.path.join(output_dir, f"{bundle['name']}.json"), 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2, default=str)
+
+        if local:
+            report = get_local_report_model(results)
+        else:
+            report = get_final_report_model(
+                results['customer_problem'],
+                str(results['log_analysis']),
+                str(results['comprehensive_thread_analysis']),
+                class_analysis=results['class_analysis'],
+                final_report=str(results['final_report']),
+                metadata={key: results[key] for key in ('problem_threads', 'suspected_classes', 'error_message')}
+            )
+
+        for report_format in report_formats:
+            report_path = os.path.join(output_dir, bundle['name'] + REPORT_EXPORTERS[report_format]['extension'])
+            if report_format == 'pdf':
+                render_report_pdf(report, output=report_path)
+            else:
+                export_report(report, report_format, report_path)
+
+        stats["success"] = True
+    except Exception as e:
+        logger.error(f"Failed to analyze bundle {bundle['name']}: {e}")
+        stats["error"] = str(e)
+    finally:
+        if profiler:
+            profiler.stop()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["timings"] = stop_request_timings(timings_token)
+    return stats
+
+# Function to analyze one bundle in a thread whose LLM calls go to Batch API jobs
+def analyze_bundle_in_batch(collector, *args):
+    """Runs analyze_bundle(*args) as a pipeline of collector, see batch_api.BatchCollector."""
+    with collector.pipeline():
+        return analyze_bundle(*args)
+
+# Function to analyze many bundles through a bounded worker pool
+def run_batch(bundles, output_dir, thread_groups_config, workers=4, analyze_classes=False, local=False,
+              report_formats=("pdf",), profile=False, batch_api=False, batch_api_url=None,
+              batch_poll_seconds=DEFAULT_POLL_SECONDS):
+    """
+    Analyzes bundles in parallel and logs per-bundle and aggregate throughput.
+
+    With batch_api, the bundles are analyzed in threads of this process and
+    their LLM calls are collected into OpenAI Batch API jobs, which cost half
+    and have their own rate limits but may take up to 24 hours. Workers then
+    bounds the bundles waiting on jobs at the same time, and so the requests
+    per job.
+
+    Args:
+        bundles (list): Bundles returned by discover_bundles().
+        output_dir (str): Directory the reports are written to.
+        thread_groups_config (dict): Configuration for thread groups.
+        workers (int): Maximum number of bundles analyzed at the same time.
+        analyze_classes (bool): Whether to analyze all suspected classes.
+        local (bool): Whether to build local reports without any LLM call.
+        report_formats (tuple): Report formats to export, see report.REPORT_EXPORTERS.
+        profile (bool): Whether to profile every bundle, see analyze_bundle().
+        batch_api (bool): Whether to send the LLM calls as Batch API jobs, ignored in local mode.
+        batch_api_url (str, optional): API root of the Batch API, such as a local stand-in.
+        batch_poll_seconds (float): Time between status checks of a running job.
+
+    Returns:
+        list: Statistics of every bundle, in completion order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    all_stats = []
+
+    collector = None
+    if batch_api and not local:
+        collector = BatchCollector(create_batch_client(batch_api_url), poll_seconds=batch_poll_seconds)
+        set_llm_batch(collector)
+        task = functools.partial(analyze_bundle_in_batch, collector)
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        task = analyze_bundle
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    try:
+        with executor:
+            futures = [executor.submit(task, bundle, output_dir, thread_groups_config, analyze_classes, local,
+                                       report_formats, profile)
+                       for bundle in bundles]
+            for future in as_completed(futures):
+                stats = future.result()
+                all_stats.append(stats)
+                status = "ok" if stats["success"] else f"failed ({stats['error']})"
+                megabytes = stats["input_bytes"] / (1024 * 1024)
+                logger.info(f"[{len(all_stats)}/{len(bundles)}] {stats['name']}: {status}, "
+                            f"{megabytes:.1f} MB in {stats['seconds']:.1f}s "
+                            f"({megabytes / max(stats['seconds'], 1e-9):.2f} MB/s)")
+                logger.debug(f"{stats['name']} time per stage: {format_request_timings(stats['timings'])}")
+    finally:
+        if collector:
+            set_llm_batch(None)
+            collector.close()
+            logger.info(f"Sent the LLM calls in {len(collector.batch_ids)} Batch API jobs")
+
+    elapsed = time.perf_counter() - start
+    succeeded = sum(1 for stats in all_stats if stats["success"])
+    total_megabytes = sum(stats["input_bytes"] for stats in all_stats) / (1024 * 1024)
+    logger.info(f"Analyzed {succeeded}/{len(bundles)} bundles ({total_megabytes:.1f} MB) in {elapsed:.1f}s "
+                f"with {workers} workers: {len(bundles) / max(elapsed, 1e-9) * 60:.1f} bundles/min, "
+                f"{total_megabytes / max(elapsed, 1e-9):.2f} MB/s")
+    return all_stats
+
+def batch_main(argv=None):
+    """
+    Entry point of `diagnostic_analyzer batch`.
+    """
+    parser = argparse.ArgumentParser(prog="diagnostic_analyzer batch",
+                                     description="Analyze many diagnostic bundles without user interaction.")
+    parser.add_argument("source", help="Directory with one sub-directory or archive per bundle, or a manifest file")
+    parser.add_argument("-o", "--output-dir", default="reports", help="Directory for the results and reports")
+    parser.add_argument("-w", "--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Maximum number of bundles analyzed in parallel")
+    parser.add_argument("-p", "--problem", default="",
+                        help=f"Customer problem for bundles without a {PROBLEM_FILENAME} or manifest entry")
+    parser.add_argument("--analyze-classes", action="store_true",
+                        help="Fetch and analyze every suspected class")
+    parser.add_argument("--local", action="store_true",
+                        help="Build deterministic reports from the parsed data only, without LLM calls")
+    parser.add_argument("-f", "--format", action="append", dest="formats", metavar="FORMAT",
+                        help=f"Report format, one of {', '.join(REPORT_EXPORTERS)} or md (repeatable, default pdf)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Save a cProfile and tracemalloc profile of every bundle next to its reports")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Send the LLM calls of all bundles as OpenAI Batch API jobs (half the cost, up to 24 hours)")
+    parser.add_argument("--batch-api-url", default=None,
+                        help="API root for --batch-api, such as http://127.0.0.1:8089/v1 (default OPENAI_BASE_URL)")
+    parser.add_argument("--batch-poll-seconds", type=float, default=DEFAULT_POLL_SECONDS,
+                        help="Seconds between status checks of a running Batch API job")
+    args = parser.parse_args(argv)
+
+    report_formats = []
+    for name in args.formats or ["pdf"]:
+        report_format = get_report_format(name)
+        if report_format is None:
+            parser.error(f"unsupported report format: {name}")
+        if report_format not in report_formats:
+            report_formats.append(report_format)
+
+    thread_groups_config = load_thread_groups_config()
+    bundles = discover_bundles(args.source, args.problem)
+    if not bundles:
+        logger.error(f"No bundles found in {args.source}")
+        return 1
+
+    all_stats = run_batch(bundles, args.output_dir, thread_groups_config, max(1, args.workers), args.analyze_classes, args.local,
+                          tuple(report_formats), args.profile, args.batch_api, args.batch_api_url, args.batch_poll_seconds)
+    return 0 if all(stats["success"] for stats in all_stats) else 1
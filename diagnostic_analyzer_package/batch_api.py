@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+
+from .metrics import LLM_BATCHES
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_SECONDS = 30
+DEFAULT_MAX_WAIT_SECONDS = 300
+# Requests per input file accepted by the Batch API
+MAX_BATCH_REQUESTS = 50000
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Function to create the OpenAI client used for Batch API jobs
+def create_batch_client(base_url=None):
+    """
+    Creates an OpenAI client for the files and batches endpoints.
+
+    Args:
+        base_url (str, optional): API root such as http://127.0.0.1:8089/v1 for a local stand-in,
+            defaults to OPENAI_BASE_URL or the OpenAI API.
+    """
+    # Imported on first use, like in utils.call_chatgpt_api
+    import openai
+
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url or None)
+
+class BatchCollector:
+    """
+    Sends the chat requests of many analysis pipelines as Batch API jobs.
+
+    Every pipeline runs in its own thread inside pipeline(), and its calls to
+    complete() block until the job holding the request is done. Queued
+    requests are submitted as one job once every running pipeline is waiting
+    for a response, the oldest one has waited max_wait_seconds, or
+    MAX_BATCH_REQUESTS are queued. Jobs run independently, so pipelines that
+    got their responses queue their next stage while other jobs are running.
+    """
+    def __init__(self, client, poll_seconds=DEFAULT_POLL_SECONDS, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        self.client = client
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        # Ids of the submitted jobs, in submission order
+        self.batch_ids = []
+        self._condition = threading.Condition()
+        # [(custom_id, request, pending)] not submitted yet
+        self._queued = []
+        self._first_queued = None
+        self._running = 0
+        self._waiting = 0
+        self._closed = False
+        self._request_ids = itertools.count(1)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="batch-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    @contextmanager
+    def pipeline(self):
+        """Counts the calling thread as a running pipeline while the block runs."""
+        with self._condition:
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def complete(self, request):
+        """
+        Queues a Chat Completions request and waits for its response.
+
+        Args:
+            request (dict): The body of a POST /v1/chat/completions request.
+
+        Returns:
+            dict: The chat completion, as the synchronous endpoint returns it.
+
+        Raises:
+            RuntimeError: If the job failed or did not answer the request.
+        """
+        pending = {"done": threading.Event(), "response": None, "error": None}
+        with self._condition:
+            if not self._queued:
+                self._first_queued = time.monotonic()
+            self._queued.append((f"request-{next(self._request_ids)}", request, pending))
+            self._waiting += 1
+            self._condition.notify_all()
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise RuntimeError(pending["error"])
+        return pending["response"]
+
+    def close(self):
+        """Submits the requests still queued and stops the dispatcher."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._dispatcher.join()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._queued:
+                        if self._closed:
+                            return
+                        self._condition.wait()
+                        continue
+                    waited = time.monotonic() - self._first_queued
+                    if (self._closed or self._waiting >= self._running or len(self._queued) >= MAX_BATCH_REQUESTS
+                            or waited >= self.max_wait_seconds):
+                        break
+                    self._condition.wait(self.max_wait_seconds - waited)
+                requests = self._queued[:MAX_BATCH_REQUESTS]
+                self._queued = self._queued[MAX_BATCH_REQUESTS:]
+                self._first_queued = time.monotonic()
+            threading.Thread(target=self._run_batch, args=(requests,), name="batch-job", daemon=True).start()
+
+    def _run_batch(self, requests):
+        lines = "".join(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request}) + "\n"
+                        for custom_id, request, _ in requests)
+        try:
+            status, results = self._submit_and_wait(lines.encode("utf-8"), len(requests))
+        except Exception as error:
+            logger.error(f"Batch API job of {len(requests)} requests failed: {error}")
+            status, results = "error", {}
+        LLM_BATCHES.inc(status=status)
+
+        for custom_id, _, pending in requests:
+            result = results.get(custom_id)
+            response = (result or {}).get("response") or {}
+            if result is None:
+                pending["error"] = f"No response in the Batch API job ({status})"
+            elif result.get("error") or response.get("status_code") != 200:
+                pending["error"] = f"Batch API request failed: {result.get('error') or response.get('body')}"
+            else:
+                pending["response"] = response["body"]
+
+        # Counted as answered before any pipeline resumes, so a quick next request is not submitted alone
+        with self._condition:
+            self._waiting -= len(requests)
+        for _, _, pending in requests:
+            pending["done"].set()
+
+    def _submit_and_wait(self, content, request_count):
+        input_file = self.client.files.create(file=("diagnostic_analyzer_batch.jsonl", content), purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=COMPLETION_WINDOW,
+                                           metadata={"source": "diagnostic_analyzer"})
+        self.batch_ids.append(batch.id)
+        logger.info(f"Submitted Batch API job {batch.id} with {request_count} requests")
+
+        while batch.status not in FINAL_STATUSES:
+            time.sleep(self.poll_seconds)
+            batch = self.client.batches.retrieve(batch.id)
+        logger.info(f"Batch API job {batch.id} {batch.status}")
+
+        # Expired and cancelled jobs still return the requests they completed
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                for line in self.client.files.content(file_id).text.splitlines():
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["custom_id"]] = result
+        return batch.status, results
@@ -0,0 +1,253 @@
+import os
+import gzip
+import zlib
+import tarfile
+import zipfile
+import logging
+from io import BytesIO
+from contextlib import ExitStack
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+DEFAULT_MAX_BUNDLE_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_BUNDLE_MEMBERS = 10000
+BUNDLE_CHUNK_SIZE = 1024 * 1024
+MAX_NESTED_ARCHIVES = 2
+
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+TAR_MAGIC = b"ustar"
+TAR_MAGIC_OFFSET = 257
+ARCHIVE_HEAD_BYTES = TAR_MAGIC_OFFSET + len(TAR_MAGIC)
+
+# Heap dumps, flight recordings and binaries are never read by the analyzers
+SKIPPED_MEMBER_SUFFIXES = (".hprof", ".jfr", ".core", ".jar", ".war", ".class", ".so", ".dll", ".exe",
+                           ".png", ".jpg", ".jpeg", ".gif")
+SKIPPED_MEMBER_DIRECTORIES = ("__MACOSX",)
+
+class BundleError(ValueError):
+    """Raised when an uploaded archive cannot be read."""
+
+class BundleTooLargeError(BundleError):
+    """Raised when an archive expands beyond the configured size or member limits."""
+
+# Function to read the decompression limits from the environment
+def get_bundle_limits():
+    """
+    Returns (max_bytes, max_members) for the files expanded from one upload or bundle.
+
+    The limits come from DIAGNOSTIC_ANALYZER_MAX_BUNDLE_BYTES and
+    DIAGNOSTIC_ANALYZER_MAX_BUNDLE_MEMBERS and protect against archives that
+    expand to far more data than was uploaded.
+    """
+    max_bytes = int(os.getenv("DIAGNOSTIC_ANALYZER_MAX_BUNDLE_BYTES", DEFAULT_MAX_BUNDLE_BYTES))
+    max_members = int(os.getenv("DIAGNOSTIC_ANALYZER_MAX_BUNDLE_MEMBERS", DEFAULT_MAX_BUNDLE_MEMBERS))
+    return max_bytes, max_members
+
+# Function to tell archives from regular diagnostic files
+def get_archive_type(filename, head=b""):
+    """
+    Returns "zip", "tar" or "gzip" for an archive, or None for a regular file.
+
+    The file name decides first, so "bundle.tar.gz" is a tar archive rather than
+    a single gzipped file. Files without a known suffix are sniffed from the
+    first ARCHIVE_HEAD_BYTES bytes, if given.
+    """
+    name = filename.lower()
+    if name.endswith((".tar.gz", ".tgz", ".tar")):
+        return "tar"
+    if name.endswith(".zip"):
+        return "zip"
+    if name.endswith(".gz"):
+        return "gzip"
+
+    if head.startswith(ZIP_MAGIC):
+        return "zip"
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head[TAR_MAGIC_OFFSET:ARCHIVE_HEAD_BYTES] == TAR_MAGIC:
+        return "tar"
+    return None
+
+# Function to strip the archive suffix from a file name
+def strip_archive_suffix(filename):
+    """Returns the name of a bundle or gzipped file without its archive suffix."""
+    name = filename.lower()
+    for suffix in (".tar.gz", ".tgz", ".tar", ".zip", ".gz"):
+        if name.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+class _Budget:
+    # Running totals shared by every file of one upload or bundle
+    def __init__(self, max_bytes=None, max_members=None):
+        default_bytes, default_members = get_bundle_limits()
+        self.max_bytes = default_bytes if max_bytes is None else max_bytes
+        self.max_members = default_members if max_members is None else max_members
+        self.bytes = 0
+        self.members = 0
+
+    def add_member(self, name):
+        self.members += 1
+        if self.members > self.max_members:
+            raise BundleTooLargeError(f"Bundle has more than {self.max_members} files (at {name})")
+
+    def add_bytes(self, name, size):
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            raise BundleTooLargeError(f"Bundle expands to more than {self.max_bytes} bytes (at {name})")
+
+def _copy_member(stream, name, budget):
+    # Decompresses chunk by chunk so an oversized member stops at the limit instead of after it is inflated
+    buffer = BytesIO()
+    while True:
+        chunk = stream.read(BUNDLE_CHUNK_SIZE)
+        if not chunk:
+            break
+        budget.add_bytes(name, len(chunk))
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+def _is_seekable(stream):
+    # Members of a streamed tar archive are not seekable and may fail when asked
+    try:
+        return stream.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+def _is_skipped(path):
+    parts = path.replace("\\", "/").split("/")
+    basename = parts[-1]
+    if basename.startswith(".") or any(part in SKIPPED_MEMBER_DIRECTORIES for part in parts[:-1]):
+        return True
+    return basename.lower().endswith(SKIPPED_MEMBER_SUFFIXES)
+
+def _add_member(in_memory_files, path, stream, budget, depth):
+    budget.add_member(path)
+    if _is_skipped(path):
+        logger.debug(f"Skipping bundle member {path}")
+        return
+
+    basename = os.path.basename(path.replace("\\", "/"))
+    archive_type = get_archive_type(basename)
+    if archive_type is not None and depth < MAX_NESTED_ARCHIVES:
+        # Rotated logs are usually gzipped inside the bundle
+        _expand_archive(in_memory_files, path, stream, archive_type, budget, depth + 1)
+        return
+
+    # The analyzers look files up by name, the member path only disambiguates duplicates
+    key = basename if basename not in in_memory_files else path
+    in_memory_files[key] = _copy_member(stream, path, budget)
+
+def _expand_archive(in_memory_files, path, stream, archive_type, budget, depth):
+    try:
+        if archive_type == "zip":
+            # The zip directory is at the end of the file, so the archive needs random access
+            if not _is_seekable(stream):
+                stream = _copy_member(stream, path, budget)
+            with zipfile.ZipFile(stream) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            _add_member(in_memory_files, info.filename, member, budget, depth)
+        elif archive_type == "tar":
+            # Stream mode reads the archive front to back, compressed or not
+            with tarfile.open(fileobj=stream, mode="r|*") as archive:
+                for info in archive:
+                    if info.isfile():
+                        _add_member(in_memory_files, info.name, archive.extractfile(info), budget, depth)
+        else:
+            with gzip.GzipFile(fileobj=stream, mode="rb") as member:
+                _add_member(in_memory_files, strip_archive_suffix(path), member, budget, depth)
+    except BundleError:
+        raise
+    except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError) as e:
+        raise BundleError(f"Cannot read archive {path}: {e}") from e
+
+def _get_gzip_content_type(filename, stream):
+    # A gzipped tar does not always come with a .tar.gz name, so peek at the decompressed header
+    try:
+        with gzip.GzipFile(fileobj=stream, mode="rb") as member:
+            head = member.read(ARCHIVE_HEAD_BYTES)
+    except (zlib.error, EOFError, OSError) as e:
+        raise BundleError(f"Cannot read archive {filename}: {e}") from e
+    finally:
+        stream.seek(0)
+    return "tar" if head[TAR_MAGIC_OFFSET:ARCHIVE_HEAD_BYTES] == TAR_MAGIC else "gzip"
+
+# Function to load uploaded files, expanding archives
+def load_bundle_files(files, max_bytes=None, max_members=None):
+    """
+    Loads uploaded files into the in-memory layout used by the analyzers.
+
+    Regular files are kept under their name. zip, tar, tar.gz and .gz files
+    are expanded member by member, reading each one in chunks straight from
+    the upload stream, so the archive itself is never held in memory. Nested
+    archives (such as rotated .log.gz files inside a zip) are expanded too.
+
+    Args:
+        files (iterable): (filename, file object) pairs, such as Flask uploads.
+        max_bytes (int, optional): Limit on the total size of the loaded files.
+        max_members (int, optional): Limit on the number of files read.
+
+    Returns:
+        dict: Dictionary of {filename: BytesIO}.
+
+    Raises:
+        BundleTooLargeError: If the files exceed one of the limits.
+        BundleError: If an archive is corrupt.
+    """
+    budget = _Budget(max_bytes, max_members)
+    in_memory_files = {}
+    for filename, stream in files:
+        head = b""
+        if _is_seekable(stream):
+            head = stream.read(ARCHIVE_HEAD_BYTES)
+            stream.seek(0)
+
+        archive_type = get_archive_type(filename, head)
+        if archive_type == "gzip" and head:
+            archive_type = _get_gzip_content_type(filename, stream)
+
+        if archive_type is None:
+            budget.add_member(filename)
+            if _is_skipped(filename):
+                logger.info(f"Skipping {filename}, it is not read by the analyzers")
+                continue
+            in_memory_files[filename] = _copy_member(stream, filename, budget)
+        else:
+            logger.info(f"Expanding {archive_type} archive {filename}")
+            _expand_archive(in_memory_files, filename, stream, archive_type, budget, 1)
+    return in_memory_files
+
+# Function to load a bundle given as a folder or an archive on disk
+def load_bundle_path(path, max_bytes=None, max_members=None):
+    """
+    Loads a diagnostic bundle from a folder or an archive file.
+
+    A folder is read like an upload of its regular files, so archives inside
+    it are expanded as well.
+
+    Args:
+        path (str): Folder, or zip/tar/tar.gz/.gz file.
+        max_bytes (int, optional): Limit on the total size of the loaded files.
+        max_members (int, optional): Limit on the number of files read.
+
+    Returns:
+        dict: Dictionary of {filename: BytesIO}.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, filename) for filename in sorted(os.listdir(path))]
+        paths = [file_path for file_path in paths if os.path.isfile(file_path)]
+    else:
+        paths = [path]
+
+    with ExitStack() as stack:
+        files = [(os.path.basename(file_path), stack.enter_context(open(file_path, "rb"))) for file_path in paths]
+        return load_bundle_files(files, max_bytes, max_members)
+
+# Function to tell whether a path is an archive that can be loaded as a bundle
+def is_bundle_archive(path):
+    return os.path.isfile(path) and get_archive_type(os.path.basename(path)) is not None
@@ -0,0 +1,278 @@
+import os
+import time
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from .metrics import CACHE_REQUESTS
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+CACHE_URL_VARIABLE = "DIAGNOSTIC_ANALYZER_CACHE_URL"
+KEY_PREFIX = "diagnostic_analyzer"
+DEFAULT_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_SQLITE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Seconds entries of each namespace are kept, None keeps them until evicted
+NAMESPACE_TTLS = {
+    "llm": 7 * 24 * 3600,
+    "github": 24 * 3600,
+    "dump": 30 * 24 * 3600,
+}
+
+class CacheBackend:
+    """
+    Byte values stored under (namespace, key), shared by everything that uses the same backend.
+
+    Backends are safe to use from several threads. Values written with a ttl
+    expire after that many seconds; backends may also evict entries early to
+    stay within their size limit.
+    """
+    def get(self, namespace, key):
+        """Returns the value stored under key, or None."""
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        """Stores value (bytes) under key for ttl seconds, or until evicted."""
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        """Removes the value stored under key, if any."""
+        raise NotImplementedError
+
+class MemoryCache(CacheBackend):
+    """Least recently used entries in a dictionary of this process, up to max_bytes of values."""
+    def __init__(self, max_bytes=DEFAULT_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # {(namespace, key): (value, expires)}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                self._remove((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        if len(value) > self.max_bytes:
+            return
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[(namespace, key)] = (value, expires)
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._remove((namespace, key))
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[0])
+
+class SqliteCache(CacheBackend):
+    """
+    Entries in an SQLite database file, shared by the worker processes of one machine.
+
+    The database runs in WAL mode so readers do not block the writer. Each
+    thread of each process opens its own connection. Once the values exceed
+    max_bytes, the least recently read entries are deleted.
+    """
+    def __init__(self, path, max_bytes=DEFAULT_SQLITE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connect(self):
+        # Connections must not cross threads, nor processes forked by batch mode
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # Imported on first use, only this backend needs it
+            import sqlite3
+
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, namespace, key):
+        connection = self._connect()
+        row = connection.execute("SELECT value, expires FROM entries WHERE namespace = ? AND key = ?",
+                                 (namespace, key)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        now = time.time()
+        if expires is not None and expires <= now:
+            self.delete(namespace, key)
+            return None
+        connection.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return bytes(value)
+
+    def set(self, namespace, key, value, ttl=None):
+        # Would evict every other entry and then itself
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                           (namespace, key, bytes(value), len(value), now + ttl if ttl else None, now))
+        self._evict(connection, now)
+
+    def delete(self, namespace, key):
+        self._connect().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def _evict(self, connection, now):
+        connection.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (now,))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for rowid, size in connection.execute("SELECT rowid, size FROM entries ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        connection.executemany("DELETE FROM entries WHERE rowid = ?", evicted)
+
+class RedisCache(CacheBackend):
+    """
+    Entries in Redis, or any server speaking its protocol, shared by every worker and node.
+
+    Expiry is left to the server (SET with EX) and so is eviction, configure
+    maxmemory-policy allkeys-lru on the server to bound the cache. Needs the
+    redis package unless a client, such as a fakeredis one, is passed in.
+    """
+    def __init__(self, url=None, client=None, prefix=KEY_PREFIX):
+        if client is None:
+            try:
+                import redis
+            except ImportError as error:
+                raise RuntimeError(f"{url} needs the redis package (pip install redis)") from error
+            client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        return self.client.get(self._key(namespace, key))
+
+    def set(self, namespace, key, value, ttl=None):
+        self.client.set(self._key(namespace, key), value, ex=int(ttl) if ttl else None)
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+# Function to create a cache backend from a URL
+def create_cache_backend(url):
+    """
+    Creates the cache backend a URL names.
+
+    Args:
+        url (str): memory://[?max_bytes=N], sqlite:///path/to/cache.db[?max_bytes=N],
+            or redis://, rediss:// or unix:// as understood by redis-py.
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: For an unknown scheme or an invalid max_bytes.
+    """
+    parts = urlsplit(url)
+    options = dict(option.split("=", 1) for option in parts.query.split("&") if "=" in option)
+    if parts.scheme == "memory":
+        return MemoryCache(int(options.get("max_bytes", DEFAULT_MEMORY_MAX_BYTES)))
+    if parts.scheme == "sqlite":
+        path = os.path.expanduser(parts.netloc + parts.path)
+        if not path:
+            raise ValueError(f"{url} does not name a database file")
+        return SqliteCache(path, int(options.get("max_bytes", DEFAULT_SQLITE_MAX_BYTES)))
+    if parts.scheme in ("redis", "rediss", "unix"):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported cache URL {url}, use memory://, sqlite:/// or redis://")
+
+# Function to get the shared cache backend of this process
+@functools.lru_cache(maxsize=None)
+def get_cache_backend(url=None):
+    """
+    Returns the backend named by DIAGNOSTIC_ANALYZER_CACHE_URL, created on first use.
+
+    Returns:
+        CacheBackend: The backend, or None when no cache URL is set or it cannot be used.
+    """
+    url = url if url is not None else os.getenv(CACHE_URL_VARIABLE, "")
+    if not url:
+        return None
+    try:
+        backend = create_cache_backend(url)
+    except Exception as error:
+        logger.warning(f"Shared cache disabled, {CACHE_URL_VARIABLE} is unusable: {error}")
+        return None
+    logger.info(f"Using the {type(backend).__name__} shared cache")
+    return backend
+
+# Function to compute a cache key from the inputs of a cached result
+def get_content_key(*parts):
+    """Returns a SHA-256 hex digest of the given strings, which must determine the cached value."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# Function to read a value from the shared cache
+def cache_get(namespace, key):
+    """
+    Returns the value cached under key, or None on a miss, without a backend or when the backend fails.
+
+    Failures are logged and counted, an unreachable cache only makes analyses slower.
+    """
+    backend = get_cache_backend()
+    if backend is None:
+        return None
+    try:
+        value = backend.get(namespace, key)
+    except Exception as error:
+        logger.warning(f"Shared cache read failed for {namespace}: {error}")
+        CACHE_REQUESTS.inc(namespace=namespace, result="error")
+        return None
+    CACHE_REQUESTS.inc(namespace=namespace, result="miss" if value is None else "hit")
+    return value
+
+# Function to write a value to the shared cache
+def cache_set(namespace, key, value):
+    """Stores value (bytes) under key with the TTL of its namespace, logging failures."""
+    backend = get_cache_backend()
+    if backend is None:
+        return
+    try:
+        backend.set(namespace, key, value, NAMESPACE_TTLS.get(namespace))
+    except Exception as error:
+        logger.warning(f"Shared cache write failed for {namespace}: {error}")
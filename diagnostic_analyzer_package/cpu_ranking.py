@@ -0,0 +1,147 @@
+import heapq
+import logging
+from array import array
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+TOP_CPU_THREADS = 10
+CPU_THREAD_FRAMES = 12
+
+class CpuSamples:
+    """
+    CPU and elapsed times of the threads of one dump, as columns of doubles.
+
+    Only threads whose header has cpu= are kept. A thread is identified
+    across dumps by its tid and native id; a missing elapsed time is -1.
+    """
+    def __init__(self, analysis):
+        self.date = analysis.date
+        self.threads = [thread for thread in analysis.threads if thread.cpuMillis is not None]
+        self.cpu = array("d", [thread.cpuMillis for thread in self.threads])
+        self.elapsed = array("d", [-1.0 if thread.elapsedSeconds is None else thread.elapsedSeconds
+                                   for thread in self.threads])
+        self.keys = [(thread.tid, thread.nativeId) for thread in self.threads]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.threads)
+
+# Function to compute the CPU time each thread used between two dumps
+def get_cpu_deltas(previous, current, interval_seconds=None):
+    """
+    Computes the CPU time and wall time of every thread of a dump since the previous dump.
+
+    A thread in both dumps used the difference of its CPU times, over the
+    difference of its elapsed times. A thread started after the previous dump,
+    or whose elapsed time went back because its ids were reused, used all of
+    its CPU time, provided it is younger than the interval between the dumps.
+
+    Args:
+        previous (CpuSamples): The earlier dump.
+        current (CpuSamples): The later dump.
+        interval_seconds (float, optional): Time between the dumps, from their dates.
+
+    Returns:
+        tuple: (cpu_millis, wall_seconds) arrays aligned with current.threads,
+        with -1 where the CPU time of a thread cannot be attributed to the interval.
+    """
+    positions = [previous.positions.get(key, -1) for key in current.keys]
+    previous_cpu = [previous.cpu[position] if position >= 0 else -1.0 for position in positions]
+    previous_elapsed = [previous.elapsed[position] if position >= 0 else -1.0 for position in positions]
+    limit = -1.0 if interval_seconds is None else interval_seconds
+
+    cpu_millis = array("d", bytes(8 * len(current)))
+    wall_seconds = array("d", bytes(8 * len(current)))
+    for i, (cpu, elapsed, last_cpu, last_elapsed) in enumerate(zip(current.cpu, current.elapsed,
+                                                                   previous_cpu, previous_elapsed)):
+        if last_cpu >= 0 and elapsed >= last_elapsed and cpu >= last_cpu:
+            cpu_millis[i] = cpu - last_cpu
+            wall_seconds[i] = elapsed - last_elapsed if last_elapsed >= 0 else max(limit, 0.0)
+        elif 0 <= elapsed <= limit:
+            cpu_millis[i] = cpu
+            wall_seconds[i] = elapsed
+        else:
+            cpu_millis[i] = -1.0
+            wall_seconds[i] = -1.0
+    return cpu_millis, wall_seconds
+
+# Function to rank the threads by the CPU time they used across the dumps
+def rank_cpu_threads(analyses, limit=TOP_CPU_THREADS, frames_per_thread=CPU_THREAD_FRAMES):
+    """
+    Ranks the threads by CPU time used between consecutive thread dumps.
+
+    The CPU times are summed per thread over all intervals and the top
+    threads are picked with a heap. With a single dump that has CPU times,
+    threads are ranked by the CPU time used since they started instead.
+
+    Args:
+        analyses (list): Analysis objects of the thread dumps, in the order they were taken.
+        limit (int): Maximum number of threads returned.
+        frames_per_thread (int): Number of top frames kept per thread.
+
+    Returns:
+        list: Dictionaries with the thread name, ids, status, CPU and wall
+        time, CPU usage in percent and the stack from the last dump it was in.
+    """
+    samples = [CpuSamples(analysis) for analysis in analyses]
+    samples = [sample for sample in samples if len(sample)]
+    if not samples:
+        return []
+
+    # {key: [cpu_millis, wall_seconds, intervals, sample index, position]}
+    totals = {}
+    if len(samples) == 1:
+        sample = samples[0]
+        for position, (key, cpu, elapsed) in enumerate(zip(sample.keys, sample.cpu, sample.elapsed)):
+            totals[key] = [cpu, elapsed, 0, 0, position]
+    else:
+        for index in range(1, len(samples)):
+            previous, current = samples[index - 1], samples[index]
+            interval_seconds = None
+            if previous.date is not None and current.date is not None:
+                interval_seconds = (current.date - previous.date).total_seconds()
+            cpu_millis, wall_seconds = get_cpu_deltas(previous, current, interval_seconds)
+            for position, (key, cpu, wall) in enumerate(zip(current.keys, cpu_millis, wall_seconds)):
+                if cpu < 0:
+                    continue
+                entry = totals.get(key)
+                if entry is None:
+                    totals[key] = [cpu, wall, 1, index, position]
+                else:
+                    entry[0] += cpu
+                    entry[1] += wall
+                    entry[2] += 1
+                    entry[3] = index
+                    entry[4] = position
+
+    ranked = []
+    for cpu, wall, intervals, index, position in heapq.nlargest(limit, totals.values(), key=lambda entry: entry[0]):
+        thread = samples[index].threads[position]
+        ranked.append({
+            "name": thread.name,
+            "tid": thread.tid,
+            "nid": thread.nid,
+            "status": thread.getStatus().status,
+            "cpuMillis": round(cpu, 2),
+            "wallSeconds": round(wall, 2) if wall >= 0 else None,
+            "cpuPercent": round(cpu / (wall * 10), 1) if wall > 0 else None,
+            "intervals": intervals,
+            "frames": thread.frames[:frames_per_thread],
+        })
+    return ranked
+
+# Function to format the CPU ranking as text
+def format_cpu_threads(cpu_threads):
+    """Returns the ranked threads with their stacks, for prompts and reports."""
+    lines = []
+    for thread in cpu_threads:
+        if thread["intervals"]:
+            used = f"{thread['cpuMillis']:.0f} ms CPU over {thread['intervals']} dump intervals"
+        else:
+            used = f"{thread['cpuMillis']:.0f} ms CPU since the thread started"
+        if thread["cpuPercent"] is not None:
+            used += f" ({thread['cpuPercent']}% of {thread['wallSeconds']} s)"
+        lines.append(f"- {thread['name']} (nid {thread['nid']}, {thread['status']}): {used}")
+        lines.extend(f"  at {frame}" for frame in thread["frames"])
+    return "\n".join(lines)
@@ -0,0 +1,420 @@
+import os
+import json
+import tempfile
+import zlib
+import marshal
+import hashlib
+import logging
+from array import array
+from collections import Counter
+from datetime import datetime
+
+from .thread_dump_processor import Analysis, Thread, ThreadStatus, Synchronizer
+from .dump_parsers import get_dump_parser, DEFAULT_DUMP_FORMAT
+from .metrics import timed_stage
+from .cache_backends import get_cache_backend, cache_get, cache_set
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+# Bump whenever the layout below changes so stale entries are ignored
+CACHE_FORMAT_VERSION = 4
+CACHE_MAGIC = b"DADC"
+CACHE_SUFFIX = ".dadc"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "diagnostic_analyzer", "dumps")
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def get_cache_dir():
+    """Returns the dump cache directory, or None if the cache is disabled."""
+    cache_dir = os.getenv("DIAGNOSTIC_ANALYZER_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+def get_cache_max_bytes():
+    """Returns the size limit of the dump cache directory in bytes."""
+    try:
+        return int(os.getenv("DIAGNOSTIC_ANALYZER_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+    except ValueError:
+        return DEFAULT_CACHE_MAX_BYTES
+
+# Function to compute the cache key of a thread dump
+def get_cache_key(text, thread_groups_config, dump_format=DEFAULT_DUMP_FORMAT):
+    """
+    Computes the cache key of a thread dump.
+
+    The thread groups configuration is part of the key because it decides
+    the pool assignment stored in the cache entry.
+
+    Args:
+        text (str): The thread dump text.
+        thread_groups_config (dict): Configuration for thread groups.
+        dump_format (str): Name of the parser the dump is read with.
+
+    Returns:
+        str: Hex digest identifying the parsed result.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_FORMAT_VERSION}\0{dump_format}\0".encode())
+    digest.update(json.dumps(thread_groups_config, sort_keys=True).encode())
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8", errors="surrogatepass"))
+    return digest.hexdigest()
+
+# Function to serialize a parsed analysis into the compact cache layout
+def serialize_analysis(analysis):
+    """
+    Serializes a parsed Analysis into a compact columnar byte string.
+
+    Strings that repeat across threads (frames, states, lock ids) are interned
+    into tables and every thread attribute is stored as a column of table
+    indexes, so loading only has to rebuild the objects.
+
+    Args:
+        analysis (Analysis): An analysis on which analyze() has run.
+
+    Returns:
+        bytes: The serialized analysis.
+    """
+    strings = []
+    string_ids = {None: 0}
+    strings.append(None)
+
+    def intern(value):
+        index = string_ids.get(value)
+        if index is None:
+            index = len(strings)
+            string_ids[value] = index
+            strings.append(value)
+        return index
+
+    pool_names = list(analysis.threadsByPool.keys())
+    pool_of_thread = {}
+    for pool_index, pool_name in enumerate(pool_names):
+        for thread in analysis.threadsByPool[pool_name]:
+            pool_of_thread[id(thread)] = pool_index
+
+    thread_count = len(analysis.threads)
+    names = array("I")
+    tids = array("I")
+    nids = array("I")
+    # Missing numeric values are stored as -1
+    native_ids = array("q")
+    cpu_millis = array("d")
+    elapsed_seconds = array("d")
+    thread_states = array("I")
+    states = array("I")
+    prios = array("I")
+    os_prios = array("I")
+    numbers = array("I")
+    groups = array("I")
+    dont_knows = array("I")
+    daemons = array("B")
+    virtuals = array("B")
+    carriers = array("I")
+    want_notification = array("I")
+    want_acquire = array("I")
+    classical_lock = array("I")
+    pools = array("H")
+    statuses = array("B")
+    frame_offsets = array("I", [0])
+    frame_ids = array("I")
+    lock_offsets = array("I", [0])
+    lock_ids = array("I")
+    sync_class_offsets = array("I", [0])
+    sync_class_ids = array("I")
+
+    status_index = {status: index for index, status in enumerate(ThreadStatus.ALL)}
+
+    for thread in analysis.threads:
+        names.append(intern(thread.name))
+        tids.append(intern(thread.tid))
+        nids.append(intern(thread.nid))
+        native_ids.append(-1 if thread.nativeId is None else thread.nativeId)
+        cpu_millis.append(-1.0 if thread.cpuMillis is None else thread.cpuMillis)
+        elapsed_seconds.append(-1.0 if thread.elapsedSeconds is None else thread.elapsedSeconds)
+        thread_states.append(intern(thread.threadState))
+        states.append(intern(thread.state))
+        prios.append(intern(thread.prio))
+        os_prios.append(intern(thread.osPrio))
+        numbers.append(intern(thread.number))
+        groups.append(intern(thread.group))
+        dont_knows.append(intern(thread.dontKnow))
+        daemons.append(1 if thread.daemon else 0)
+        virtuals.append(1 if thread.virtual else 0)
+        carriers.append(intern(thread.carrier))
+        want_notification.append(intern(thread.wantNotificationOn))
+        want_acquire.append(intern(thread.wantToAcquire))
+        classical_lock.append(intern(thread.classicalLockHeld))
+        pools.append(pool_of_thread.get(id(thread), len(pool_names) - 1))
+        statuses.append(status_index[thread.getStatus().status])
+
+        frame_ids.extend(intern(frame) for frame in thread.frames)
+        frame_offsets.append(len(frame_ids))
+        lock_ids.extend(intern(lock) for lock in thread.locksHeld)
+        lock_offsets.append(len(lock_ids))
+        for lock_id, class_name in thread.synchronizerClasses.items():
+            sync_class_ids.append(intern(lock_id))
+            sync_class_ids.append(intern(class_name))
+        sync_class_offsets.append(len(sync_class_ids))
+
+    synchronizers = array("I")
+    for synchronizer in analysis.synchronizers:
+        synchronizers.append(intern(synchronizer.id))
+        synchronizers.append(intern(synchronizer.className))
+
+    columns = (
+        thread_count,
+        names, tids, nids, native_ids, cpu_millis, elapsed_seconds, thread_states, states, prios, os_prios, numbers,
+        groups, dont_knows, daemons, virtuals, carriers, want_notification, want_acquire,
+        classical_lock, pools, statuses, frame_offsets, frame_ids,
+        lock_offsets, lock_ids, sync_class_offsets, sync_class_ids,
+        synchronizers,
+    )
+    payload = (
+        CACHE_FORMAT_VERSION,
+        analysis.dateString,
+        pool_names,
+        strings,
+        tuple(column if isinstance(column, int) else (column.typecode, column.tobytes()) for column in columns),
+        tuple((status_index[status], tuple(intern(frame) for frame in frames), count)
+              for (status, frames), count in analysis.virtualThreadGroups.items()),
+    )
+    return CACHE_MAGIC + zlib.compress(marshal.dumps(payload), 1)
+
+# Function to rebuild a parsed analysis from the compact cache layout
+def deserialize_analysis(data, analysis_id, analysis_name, analysis_config, thread_groups_config):
+    """
+    Rebuilds an Analysis from bytes produced by serialize_analysis().
+
+    Args:
+        data (bytes): The serialized analysis.
+        analysis_id: Identifier of the new analysis.
+        analysis_name (str): Name of the new analysis.
+        analysis_config (dict): Analysis configuration.
+        thread_groups_config (dict): Configuration for thread groups.
+
+    Returns:
+        Analysis: The analysis, or None if the data has an unknown layout.
+    """
+    if not data.startswith(CACHE_MAGIC):
+        return None
+    payload = marshal.loads(zlib.decompress(data[len(CACHE_MAGIC):]))
+    if payload[0] != CACHE_FORMAT_VERSION:
+        return None
+    _, date_string, pool_names, strings, raw_columns, virtual_thread_groups = payload
+
+    columns = []
+    for column in raw_columns:
+        if isinstance(column, int):
+            columns.append(column)
+        else:
+            typecode, raw = column
+            values = array(typecode)
+            values.frombytes(raw)
+            columns.append(values)
+    (thread_count,
+     names, tids, nids, native_ids, cpu_millis, elapsed_seconds, thread_states, states, prios, os_prios, numbers,
+     groups, dont_knows, daemons, virtuals, carriers, want_notification, want_acquire,
+     classical_lock, pools, statuses, frame_offsets, frame_ids,
+     lock_offsets, lock_ids, sync_class_offsets, sync_class_ids,
+     synchronizers) = columns
+
+    analysis = Analysis(analysis_id, analysis_name, analysis_config, thread_groups_config)
+    if date_string is not None:
+        analysis.dateString = date_string
+        analysis.date = datetime.strptime(date_string, "%Y-%m-%d %H:%M:%S")
+
+    frames = [strings[index] for index in frame_ids]
+    locks = [strings[index] for index in lock_ids]
+    threads_by_pool = {pool_name: [] for pool_name in pool_names}
+    pool_lists = [threads_by_pool[pool_name] for pool_name in pool_names]
+    thread_statuses = []
+
+    for i in range(thread_count):
+        thread = Thread.__new__(Thread)
+        sync_classes = sync_class_ids[sync_class_offsets[i]:sync_class_offsets[i + 1]]
+        thread.__dict__.update({
+            "spec": None,
+            "threadState": strings[thread_states[i]],
+            "wantNotificationOn": strings[want_notification[i]],
+            "classicalLockHeld": strings[classical_lock[i]],
+            "name": strings[names[i]],
+            "tid": strings[tids[i]],
+            "nid": strings[nids[i]],
+            "nativeId": None if native_ids[i] < 0 else native_ids[i],
+            "cpuMillis": None if cpu_millis[i] < 0 else cpu_millis[i],
+            "elapsedSeconds": None if elapsed_seconds[i] < 0 else elapsed_seconds[i],
+            "frames": frames[frame_offsets[i]:frame_offsets[i + 1]],
+            "synchronizerClasses": {strings[sync_classes[j]]: strings[sync_classes[j + 1]] for j in range(0, len(sync_classes), 2)},
+            "wantToAcquire": strings[want_acquire[i]],
+            "locksHeld": locks[lock_offsets[i]:lock_offsets[i + 1]],
+            "prio": strings[prios[i]],
+            "osPrio": strings[os_prios[i]],
+            "daemon": bool(daemons[i]),
+            "number": strings[numbers[i]],
+            "group": strings[groups[i]],
+            "state": strings[states[i]],
+            "dontKnow": strings[dont_knows[i]],
+            "virtual": bool(virtuals[i]),
+            "carrier": strings[carriers[i]],
+        })
+        analysis.threads.append(thread)
+        analysis.threadMap[thread.tid] = thread
+        pool_lists[pools[i]].append(thread)
+        thread_statuses.append(ThreadStatus.ALL[statuses[i]])
+
+    # Threads are listed by status in pool order, as _mapThreadsByStatus does
+    status_of_thread = {id(thread): status for thread, status in zip(analysis.threads, thread_statuses)}
+    analysis.threadsByPool = threads_by_pool
+    for pool_threads in pool_lists:
+        for thread in pool_threads:
+            analysis.threadsByStatus.setdefault(status_of_thread[id(thread)], []).append(thread)
+
+    analysis.virtualThreadGroups = Counter({(ThreadStatus.ALL[status], tuple(strings[frame] for frame in frames)): count
+                                            for status, frames, count in virtual_thread_groups})
+    analysis._countRunningMethods()
+
+    for j in range(0, len(synchronizers), 2):
+        synchronizer = Synchronizer(strings[synchronizers[j]], strings[synchronizers[j + 1]])
+        analysis.synchronizerMap[synchronizer.id] = synchronizer
+        analysis.synchronizers.append(synchronizer)
+    analysis._xrefSynchronizers()
+    analysis._analyzeDeadlocks()
+
+    return analysis
+
+# Function to keep the cache directory under its size limit
+def evict_cache_entries(cache_dir, max_bytes, suffix=CACHE_SUFFIX, keep=()):
+    """
+    Removes the least recently used cache entries until the cache fits in max_bytes.
+
+    Args:
+        cache_dir (str): The cache directory.
+        max_bytes (int): Maximum total size of the cache entries.
+        suffix (str): File name suffix of the cache entries.
+        keep (tuple): Paths of entries that must not be removed, such as the one just written.
+    """
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(suffix) or not entry.is_file():
+            continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as error:
+            logger.warning(f"Failed to evict dump cache entry {path}: {error}")
+
+# Function to atomically write a cache entry
+def write_cache_file(path, data, reopen=False):
+    """
+    Writes a cache entry through a temporary file renamed into place, so readers never see a partial entry.
+
+    The temporary file is unique to the call, so threads and processes writing the same entry do not collide.
+
+    Args:
+        path (str): Path of the cache entry.
+        data: Bytes to write, or a function taking the open binary file and writing the entry into it.
+        reopen (bool): Whether to return the entry opened for reading. It is opened before the rename,
+            so an eviction by another thread or process cannot remove it before the caller reads it.
+
+    Returns:
+        file: The entry opened in binary mode if reopen is set, otherwise None.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    reader = None
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            if callable(data):
+                data(temp_file)
+            else:
+                temp_file.write(data)
+        if reopen:
+            reader = open(temp_path, "rb")
+        os.replace(temp_path, path)
+        return reader
+    except BaseException:
+        if reader is not None:
+            reader.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+# Function to parse a thread dump, reusing a cached result when available
+def load_or_analyze(analysis_id, analysis_name, analysis_config, thread_groups_config, text, dump_format=DEFAULT_DUMP_FORMAT):
+    """
+    Returns the Analysis of a thread dump, served from the cache when possible.
+
+    With a shared cache backend (DIAGNOSTIC_ANALYZER_CACHE_URL), parsed dumps
+    are stored there so every worker and node reuses them. Otherwise they are
+    stored in the cache directory of this machine.
+
+    Args:
+        analysis_id: Identifier of the analysis.
+        analysis_name (str): Name of the analysis.
+        analysis_config (dict): Analysis configuration.
+        thread_groups_config (dict): Configuration for thread groups.
+        text (str): The thread dump text.
+        dump_format (str): Name of the registered parser to read the dump with, see dump_parsers.
+
+    Returns:
+        Analysis: The parsed analysis.
+    """
+    cache_dir = get_cache_dir()
+    cache_path = None
+    shared_key = None
+
+    if get_cache_backend() is not None:
+        shared_key = get_cache_key(text, thread_groups_config, dump_format)
+        data = cache_get("dump", shared_key)
+        if data is not None:
+            try:
+                with timed_stage("dump_cache_load"):
+                    analysis = deserialize_analysis(data, analysis_id, analysis_name, analysis_config, thread_groups_config)
+                if analysis is not None:
+                    logger.info(f"Loaded {analysis_name} from the shared cache")
+                    return analysis
+            except Exception as error:
+                logger.warning(f"Ignoring unreadable shared cache entry for {analysis_name}: {error}")
+    elif cache_dir:
+        cache_path = os.path.join(cache_dir, get_cache_key(text, thread_groups_config, dump_format) + CACHE_SUFFIX)
+        try:
+            with open(cache_path, "rb") as cache_file, timed_stage("dump_cache_load"):
+                analysis = deserialize_analysis(cache_file.read(), analysis_id, analysis_name, analysis_config, thread_groups_config)
+            if analysis is not None:
+                # Touch the entry so eviction treats it as recently used
+                os.utime(cache_path)
+                logger.info(f"Loaded {analysis_name} from dump cache")
+                return analysis
+        except FileNotFoundError:
+            pass
+        except Exception as error:
+            logger.warning(f"Ignoring unreadable dump cache entry {cache_path}: {error}")
+
+    analysis = Analysis(analysis_id, analysis_name, analysis_config, thread_groups_config)
+    with timed_stage("parse_dump"):
+        get_dump_parser(dump_format)["parse"](analysis, text)
+
+    if shared_key:
+        cache_set("dump", shared_key, serialize_analysis(analysis))
+    elif cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_cache_file(cache_path, serialize_analysis(analysis))
+            evict_cache_entries(cache_dir, get_cache_max_bytes(), keep=(cache_path,))
+        except Exception as error:
+            logger.warning(f"Failed to write dump cache entry {cache_path}: {error}")
+
+    return analysis
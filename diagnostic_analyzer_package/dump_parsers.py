@@ -0,0 +1,277 @@
+import re
+import sys
+import json
+import logging
+from datetime import datetime
+from collections import Counter
+
+from .thread_dump_processor import Thread, DATE_REGEX
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+DEFAULT_DUMP_FORMAT = "jstack"
+SNIFF_BYTES = 64 * 1024
+JSON_CHUNK_SIZE = 1024 * 1024
+JSON_KEY_LOOKBEHIND = 256
+
+FULL_THREAD_DUMP = "Full thread dump"
+FULL_THREAD_DUMP_REGEX = re.compile(r"^Full thread dump", re.MULTILINE)
+THREAD_HEADER_REGEX = re.compile(r'^"[^"\n]*".*(?:prio=|tid=| - Thread t@)', re.MULTILINE)
+THREAD_HEADER_BYTES_REGEX = re.compile(rb'^"[^"\n]*".*(?:prio=|tid=| - Thread t@)', re.MULTILINE)
+HEAP_SECTION_REGEX = re.compile(r"^Heap\s*$", re.MULTILINE)
+JCMD_JSON_REGEX = re.compile(r'^\s*\{\s*"threadDump"\s*:')
+JCMD_TIME_REGEX = re.compile(r'"time"\s*:\s*"([^"]*)"')
+JCMD_CONTAINER_OR_THREADS_REGEX = re.compile(r'"container"\s*:\s*("(?:[^"\\]|\\.)*")|"threads"\s*:\s*\[')
+JSON_SEPARATOR_REGEX = re.compile(r"[\s,]*")
+
+# Top frames telling what a thread is doing when the dump has no thread state (JDK 21 jcmd JSON)
+INFERRED_STATES = (
+    (re.compile(r"\bThread\.sleep"), "TIMED_WAITING (sleeping)"),
+    (re.compile(r"\bObject\.wait"), "WAITING (on object monitor)"),
+    (re.compile(r"\bUnsafe\.park|\bContinuation\.yield|\bVirtualThread\.park"), "WAITING (parking)"),
+)
+INFERRED_STATE_FRAMES = 4
+
+DUMP_PARSERS = []
+
+# Function to register a thread dump parser
+def register_dump_parser(name, sniff, split=None):
+    """
+    Decorator registering a function that parses one thread dump into an Analysis.
+
+    Parsers are tried in registration order and the first whose sniff(text)
+    returns true reads the file. split(text) returns the dumps contained in
+    the file (by default the whole text is one dump), and the decorated
+    parse(analysis, text) function fills an Analysis from one of them.
+    """
+    def decorator(parse):
+        DUMP_PARSERS.append({"name": name, "sniff": sniff, "split": split or (lambda text: [text]), "parse": parse})
+        return parse
+    return decorator
+
+# Function to look up a registered parser by name
+def get_dump_parser(name):
+    for parser in DUMP_PARSERS:
+        if parser["name"] == name:
+            return parser
+    raise KeyError(f"Unknown thread dump format: {name}")
+
+# Function to detect the format of a thread dump
+def detect_dump_format(text):
+    """
+    Returns the registered parser for a file, or None if it does not look like a thread dump.
+    """
+    for parser in DUMP_PARSERS:
+        if parser["sniff"](text):
+            return parser
+    return None
+
+# Function to cheaply check raw upload bytes before decoding them
+def is_thread_dump_candidate(data):
+    """
+    Returns whether raw file bytes may contain a thread dump in any registered format.
+
+    Used on uploads that are not named like thread dumps, such as console logs
+    with SIGQUIT output, so log files are not decoded and sniffed in full.
+    """
+    head = data[:SNIFF_BYTES]
+    return (b'"threadDump"' in head or FULL_THREAD_DUMP.encode() in data
+            or THREAD_HEADER_BYTES_REGEX.search(head) is not None)
+
+def _is_jcmd_json(text):
+    return JCMD_JSON_REGEX.match(text[:SNIFF_BYTES]) is not None
+
+def _is_sigquit_output(text):
+    # A dump printed into a console log: several dumps, log lines before it, or the heap summary after it
+    first = text.find(FULL_THREAD_DUMP)
+    if first == -1:
+        return False
+    if text.find(FULL_THREAD_DUMP, first + 1) != -1:
+        return True
+    if len(text[:first].strip().splitlines()) > 2:
+        return True
+    return HEAP_SECTION_REGEX.search(text, first) is not None
+
+def _is_jstack(text):
+    head = text[:SNIFF_BYTES]
+    return FULL_THREAD_DUMP in head or THREAD_HEADER_REGEX.search(head) is not None
+
+# Function to cut the thread dumps out of HotSpot SIGQUIT console output
+def split_sigquit_dumps(text):
+    """
+    Splits console output into its thread dumps.
+
+    Each dump starts at a "Full thread dump" line, preceded by the timestamp
+    line the JVM prints before it, and ends before the next dump or the heap
+    summary that follows the threads.
+    """
+    starts = [match.start() for match in FULL_THREAD_DUMP_REGEX.finditer(text)]
+    dumps = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        heap = HEAP_SECTION_REGEX.search(text, start, end)
+        if heap is not None:
+            end = heap.start()
+
+        date_line = text[text.rfind("\n", 0, max(0, start - 1)) + 1:start].strip()
+        header = date_line + "\n" if DATE_REGEX.match(date_line) else ""
+        dumps.append(header + text[start:end])
+    return dumps
+
+# Function to stream the thread objects of a jcmd JSON dump
+def iter_jcmd_threads(source, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yields (container, thread) for every thread object of a jcmd Thread.dump_to_file -format=json dump.
+
+    Like ijson, the document is never materialized as one object tree: the
+    input is scanned for thread containers and each thread object is decoded
+    on its own. source is the dump text or a text file object; files are read
+    in chunks, so memory stays proportional to a chunk and a single thread.
+    """
+    decoder = json.JSONDecoder()
+    read = getattr(source, "read", None)
+    buffer = source if read is None else read(chunk_size)
+    eof = read is None
+    container = None
+    in_threads = False
+    position = 0
+    while True:
+        if in_threads:
+            position = JSON_SEPARATOR_REGEX.match(buffer, position).end()
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    in_threads = False
+                    position += 1
+                    continue
+                try:
+                    thread, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The object is cut at the end of the chunk unless the input ended
+                    if eof:
+                        raise
+                else:
+                    yield container, thread
+                    continue
+        else:
+            match = JCMD_CONTAINER_OR_THREADS_REGEX.search(buffer, position)
+            if match is not None:
+                position = match.end()
+                if match.group(1) is not None:
+                    container = json.loads(match.group(1))
+                else:
+                    in_threads = True
+                continue
+            # Keep the tail in case a key is cut at the end of the chunk
+            position = max(position, len(buffer) - JSON_KEY_LOOKBEHIND)
+
+        if eof:
+            return
+        chunk = read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def _lock_id(value):
+    # Locks are printed as "ClassName@hash"
+    if isinstance(value, dict):
+        value = value.get("object")
+    if not value:
+        return None, None
+    return value, value.rsplit("@", 1)[0]
+
+def _infer_thread_state(frames):
+    for frame in frames[:INFERRED_STATE_FRAMES]:
+        for pattern, state in INFERRED_STATES:
+            if pattern.search(frame):
+                return state
+    return "RUNNABLE"
+
+def _build_jcmd_thread(data, container):
+    thread = Thread()
+    thread.tid = str(data.get("tid"))
+    thread.virtual = bool(data.get("virtual", not data.get("name")))
+    thread.name = data.get("name") or f"VirtualThread[#{thread.tid}]"
+    thread.carrier = data.get("carrier")
+    thread.group = container
+    thread.frames = [sys.intern(frame) for frame in data.get("stack", [])]
+
+    # Newer JDKs print the state and the locks, JDK 21 only prints the stack
+    if data.get("state"):
+        thread.state = data["state"]
+    else:
+        thread.threadState = _infer_thread_state(thread.frames)
+
+    lock_id, class_name = _lock_id(data.get("blockedOn"))
+    if lock_id:
+        thread.wantToAcquire = lock_id
+        thread.synchronizerClasses[lock_id] = class_name
+    lock_id, class_name = _lock_id(data.get("waitingOn") or data.get("parkBlocker"))
+    if lock_id:
+        thread.wantNotificationOn = lock_id
+        thread.synchronizerClasses[lock_id] = class_name
+    for monitors in data.get("monitorsOwned", []):
+        for lock in monitors.get("locks", []):
+            lock_id, class_name = _lock_id(lock)
+            if lock_id and lock_id not in thread.locksHeld:
+                thread.locksHeld.append(lock_id)
+                thread.synchronizerClasses[lock_id] = class_name
+    return thread
+
+def _is_aggregated_virtual_thread(data):
+    # Unmounted virtual threads that hold no monitor and wait for none are only counted
+    return (bool(data.get("virtual", not data.get("name"))) and not data.get("carrier")
+            and not data.get("blockedOn") and not data.get("monitorsOwned"))
+
+@register_dump_parser("jcmd-json", _is_jcmd_json)
+def parse_jcmd_json(analysis, source):
+    """
+    Fills an Analysis from a jcmd JSON dump, given as text or a text file object.
+
+    Platform threads, mounted virtual threads and virtual threads blocked on or
+    holding monitors become Thread objects. All other virtual threads are only
+    counted by (status, stack) in analysis.virtualThreadGroups, so memory grows
+    with the number of distinct virtual thread stacks, not with their number.
+    """
+    if isinstance(source, str):
+        head = source[:SNIFF_BYTES]
+    else:
+        head = source.read(SNIFF_BYTES)
+        source.seek(0)
+
+    time_match = JCMD_TIME_REGEX.search(head)
+    if time_match:
+        try:
+            analysis.date = datetime.fromisoformat(time_match.group(1)[:19])
+            analysis.dateString = analysis.date.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            logger.warning(f"Unrecognized jcmd thread dump time: {time_match.group(1)}")
+
+    virtual_thread_groups = Counter()
+    group_keys = {}
+
+    def threads():
+        for container, data in iter_jcmd_threads(source):
+            if not _is_aggregated_virtual_thread(data):
+                yield _build_jcmd_thread(data, container)
+                continue
+
+            # The status only depends on the state, the stack and whether the thread waits on an object
+            stack_key = (data.get("state"), bool(data.get("waitingOn") or data.get("parkBlocker")), tuple(data.get("stack", ())))
+            group_key = group_keys.get(stack_key)
+            if group_key is None:
+                thread = _build_jcmd_thread(data, container)
+                group_key = group_keys[stack_key] = (thread.getStatus().status, tuple(thread.frames))
+            virtual_thread_groups[group_key] += 1
+
+    analysis.analyzeThreads(threads(), virtual_thread_groups)
+
+# SIGQUIT dumps are regular jstack text once cut out of the console output
+@register_dump_parser("sigquit", _is_sigquit_output, split_sigquit_dumps)
+def parse_sigquit(analysis, text):
+    analysis.analyze(text)
+
+# Covers jstack and jstack -l, whose lock details the thread parser already reads
+@register_dump_parser(DEFAULT_DUMP_FORMAT, _is_jstack)
+def parse_jstack(analysis, text):
+    analysis.analyze(text)
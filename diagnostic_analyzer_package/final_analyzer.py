@@ -1,6 +1,8 @@
 from .utils import call_chatgpt_api
 from .prompts import get_diagnostic_conclusion_prompt
+from .metrics import timed_stage
 
+@timed_stage("final_conclusion")
 def get_diagnostic_conclusion(customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis):
     """
     Gets a final diagnostic conclusion and suggestions by analyzing multiple inputs.
@@ -0,0 +1,255 @@
+import re
+import logging
+from collections import Counter
+
+from .thread_analyzer import parse_thread_dumps
+from .log_analyzer import get_log_content
+from .log_ingest import get_dump_dates
+from .log_rules import scan_log_files, format_log_signatures
+from .thread_dump_processor import ThreadStatus, DeadlockStatus
+from .stack_aggregator import aggregate_stacks, build_call_tree, get_hot_methods, get_top_contended_locks
+from .cpu_ranking import rank_cpu_threads, format_cpu_threads
+from .thread_table import get_thread_table, get_virtual_thread_summary
+from .metrics import timed_stage
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+TOP_RUNNING_METHODS = 10
+TOP_EXCEPTIONS = 10
+STUCK_THREAD_FRAMES = 8
+# Frames of the merged call tree kept in the report, counted from the outermost frame
+CALL_TREE_DEPTH = 24
+# Share of all threads a call tree frame needs to be kept in the report
+CALL_TREE_MIN_SHARE = 0.05
+
+# Statuses in which a thread with an unchanged stack is considered stuck
+STUCK_STATUSES = [ThreadStatus.RUNNING, ThreadStatus.WAITING_ACQUIRE]
+
+EXCEPTION_REGEX = re.compile(r"((?:[A-Za-z_$][\w$]*\.)+[A-Z][\w$]*(?:Exception|Error|Throwable))(?::\s*([^\n]*))?")
+FINGERPRINT_SUBSTITUTIONS = [
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<uuid>"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+]
+
+# Function to count the threads of every pool by status
+def get_pool_state_histogram(analysis):
+    """
+    Builds a thread state histogram per pool from the ThreadTable of the analysis,
+    including the virtual threads that are only counted.
+
+    Returns:
+        dict: {pool_name: {status: thread_count}} with statuses in ThreadStatus.ALL order.
+    """
+    return get_thread_table(analysis).count_by_pool()
+
+# Function to list the locks involved in deadlocks
+def get_deadlocks(analysis):
+    """
+    Lists the synchronizers with a possible or confirmed deadlock.
+
+    Returns:
+        list: Dictionaries describing the lock, its holder, its waiters and the thread cycle.
+    """
+    deadlocks = []
+    for synchronizer in sorted(analysis.synchronizers, key=lambda sync: -sync.deadlockStatus.severity):
+        if synchronizer.deadlockStatus.severity < DeadlockStatus.HIGH_RISK:
+            break
+        deadlocks.append({
+            "lock": synchronizer.id,
+            "className": synchronizer.className,
+            "status": str(synchronizer.deadlockStatus),
+            "detail": synchronizer.deadlockStatus.detail,
+            "holder": synchronizer.lockHolder.name if synchronizer.lockHolder else None,
+            "waiters": [thread.name for thread in synchronizer.lockWaiters],
+            "cycle": synchronizer.deadlockStatus.trail,
+        })
+    return deadlocks
+
+# Function to find threads whose stack did not change across the dumps
+def get_stuck_threads(analyses):
+    """
+    Finds threads that are running or blocked with the same stack in every dump.
+
+    Args:
+        analyses (list): Analysis objects of the thread dumps, in order.
+
+    Returns:
+        list: Dictionaries with the thread name, its statuses and its top frames.
+    """
+    if len(analyses) < 2:
+        return []
+
+    stuck_threads = []
+    later_threads = [{thread.name: thread for thread in analysis.threads} for analysis in analyses[1:]]
+    for thread in analyses[0].threads:
+        if not thread.frames or thread.getStatus().status not in STUCK_STATUSES:
+            continue
+        occurrences = [threads.get(thread.name) for threads in later_threads]
+        if all(other is not None and other.frames == thread.frames and other.getStatus().status in STUCK_STATUSES
+               for other in occurrences):
+            stuck_threads.append({
+                "name": thread.name,
+                "statuses": [thread.getStatus().status] + [other.getStatus().status for other in occurrences],
+                "frames": thread.frames[:STUCK_THREAD_FRAMES],
+            })
+    return stuck_threads
+
+# Function to count exceptions in the log by fingerprint
+def get_exception_fingerprints(log_content, limit=TOP_EXCEPTIONS):
+    """
+    Groups the exceptions in a log by class and normalized message.
+
+    Numbers, hex values and UUIDs are replaced by placeholders, so occurrences
+    that only differ in ids or ports share a fingerprint.
+
+    Returns:
+        list: The most frequent fingerprints with their count and a sample line.
+    """
+    counts = Counter()
+    samples = {}
+    for match in EXCEPTION_REGEX.finditer(log_content or ""):
+        message = (match.group(2) or "").strip()[:200]
+        for pattern, placeholder in FINGERPRINT_SUBSTITUTIONS:
+            message = pattern.sub(placeholder, message)
+        fingerprint = f"{match.group(1)}: {message}" if message else match.group(1)
+        counts[fingerprint] += 1
+        if fingerprint not in samples:
+            samples[fingerprint] = match.group(0)[:300]
+
+    return [{"fingerprint": fingerprint, "count": count, "sample": samples[fingerprint]}
+            for fingerprint, count in counts.most_common(limit)]
+
+# Function to build the deterministic report from the native parse results
+@timed_stage("local_report")
+def build_local_report(thread_groups_config, in_memory_files, customer_problem="", analyses=None):
+    """
+    Builds a structured report from the parsed thread dumps and log, without any LLM call.
+
+    Args:
+        thread_groups_config (dict): Configuration for thread groups.
+        in_memory_files (dict): Dictionary of {filename: file_content} for in-memory files.
+        customer_problem (str): Description of the customer's problem.
+        analyses (list): Already parsed thread dumps, parsed from in_memory_files if None.
+
+    Returns:
+        dict: JSON serializable report.
+    """
+    logger.info("Building local report without LLM calls...")
+    if analyses is None:
+        analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+
+    thread_dumps = []
+    for analysis in analyses:
+        table = get_thread_table(analysis)
+        thread_dumps.append({
+            "name": analysis.name,
+            "filename": analysis.filename,
+            "date": analysis.dateString,
+            "threadCount": table.thread_count,
+            "virtualThreads": get_virtual_thread_summary(table),
+            "deadlockStatus": str(analysis.deadlockStatus),
+            "statesByPool": get_pool_state_histogram(analysis),
+            "topRunningMethods": [{"method": item["string"], "count": item["count"]}
+                                  for item in analysis.runningMethods.get_strings()[:TOP_RUNNING_METHODS]],
+            "deadlocks": get_deadlocks(analysis),
+        })
+
+    stack_counts = aggregate_stacks(analyses)
+    call_tree = build_call_tree(stack_counts)
+    return {
+        "customerProblem": customer_problem,
+        "threadDumps": thread_dumps,
+        "stuckThreads": get_stuck_threads(analyses),
+        "topCpuThreads": rank_cpu_threads(analyses),
+        "topContendedLocks": get_top_contended_locks(analyses),
+        "hotMethods": get_hot_methods(stack_counts, ThreadStatus.RUNNING, TOP_RUNNING_METHODS),
+        "callTree": call_tree.to_dict(max(1, int(call_tree.total * CALL_TREE_MIN_SHARE)), CALL_TREE_DEPTH),
+        "topExceptions": get_exception_fingerprints(get_log_content(in_memory_files, get_dump_dates(analyses))),
+        "logSignatures": scan_log_files(in_memory_files),
+    }
+
+# Function to turn the local report into titled text sections
+def format_local_report(report):
+    """
+    Formats a report from build_local_report() as text sections for rendering.
+
+    Returns:
+        list: (heading, text) tuples.
+    """
+    sections = []
+    for dump in report["threadDumps"]:
+        lines = [f"Taken: {dump['date'] or 'unknown'} ({dump['filename']})",
+                 f"Threads: {dump['threadCount']}",
+                 f"Deadlock status: {dump['deadlockStatus']}",
+                 "",
+                 "Thread states by pool:"]
+        for pool_name, states in dump["statesByPool"].items():
+            counts = ", ".join(f"{status}: {count}" for status, count in states.items())
+            lines.append(f"- {pool_name} ({sum(states.values())}): {counts}")
+
+        virtual_threads = dump.get("virtualThreads")
+        if virtual_threads and virtual_threads["count"]:
+            lines.append("")
+            lines.append(f"Virtual threads: {virtual_threads['count']} ({virtual_threads['mounted']} mounted "
+                         f"on {virtual_threads['carriers']} carriers), most common stacks:")
+            for group in virtual_threads["topStacks"]:
+                lines.append(f"- {group['count']} {group['status']}")
+                lines.extend(f"  at {frame}" for frame in group["frames"])
+
+        lines.append("")
+        lines.append("Top running methods:")
+        for method in dump["topRunningMethods"] or [{"count": 0, "method": "None"}]:
+            lines.append(f"- {method['count']} {method['method']}")
+
+        if dump["deadlocks"]:
+            lines.append("")
+            lines.append("Deadlocks:")
+            for deadlock in dump["deadlocks"]:
+                lines.append(f"- {deadlock['status']} on <{deadlock['lock']}> ({deadlock['className']}), "
+                             f"held by {deadlock['holder']}, waiters: {', '.join(deadlock['waiters']) or 'none'}")
+                if deadlock["cycle"]:
+                    lines.append(f"  Cycle: {' -> '.join(deadlock['cycle'])}")
+        sections.append((dump["name"], "\n".join(lines)))
+
+    stuck_lines = []
+    for thread in report["stuckThreads"]:
+        stuck_lines.append(f"- {thread['name']} ({' / '.join(thread['statuses'])})")
+        stuck_lines.extend(f"  at {frame}" for frame in thread["frames"])
+    sections.append(("Threads Stuck Across Dumps", "\n".join(stuck_lines) or "No stuck threads found."))
+
+    sections.append(("Top CPU Consuming Threads",
+                     format_cpu_threads(report.get("topCpuThreads", [])) or "No thread CPU times in the thread dumps."))
+
+    lock_lines = [f"- {item['className']}: {item['blockedThreads']} blocked, {item['waitingThreads']} waiting "
+                  f"on {item['locks']} locks (max {item['maxWaitersOnOneLock']} blocked on one lock)"
+                  for item in report["topContendedLocks"]]
+    sections.append(("Most Contended Locks", "\n".join(lock_lines) or "No contended locks found."))
+
+    hot_lines = [f"- {item['count']} {item['method']}" for item in report.get("hotMethods", [])]
+    sections.append(("Hot Methods Across Dumps", "\n".join(hot_lines) or "No running threads found."))
+
+    tree_lines = format_call_tree(report["callTree"]) if report.get("callTree") else []
+    sections.append(("Merged Call Tree", "\n".join(tree_lines) or "No thread stacks found."))
+
+    exception_lines = [f"- {item['count']}x {item['fingerprint']}" for item in report["topExceptions"]]
+    sections.append(("Top Exceptions in Logs", "\n".join(exception_lines) or "No exceptions found in the logs."))
+    sections.append(("Known Failure Signatures in Logs",
+                     format_log_signatures(report.get("logSignatures", [])) or "No known failure signatures found."))
+    return sections
+
+# Function to render the merged call tree as indented text lines
+def format_call_tree(node, depth=0):
+    """
+    Formats a call tree from CallTreeNode.to_dict() one frame per line, children
+    indented below their caller, with the number of threads passing through each frame.
+
+    Returns:
+        list: The text lines, without the root node.
+    """
+    lines = []
+    for child in node["children"]:
+        lines.append(f"{'  ' * depth}{child['total']} {child['frame']}")
+        lines.extend(format_call_tree(child, depth + 1))
+    return lines
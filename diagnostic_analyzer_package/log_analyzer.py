@@ -1,71 +1,57 @@
 import os
-import requests
+import json
 import base64
-import ast
-import re
 import logging
 
 from .utils import call_chatgpt_api
+from .log_ingest import read_logs
+from .log_rules import format_log_signatures
 from .prompts import get_log_analysis_prompt, get_class_analysis_prompt
+from .metrics import timed_stage
+from .cache_backends import cache_get, cache_set, get_content_key
+from .structured_output import call_structured_llm, decode_json_response, validate_json, LOG_FINDINGS_FORMAT
 
 logger = logging.getLogger("diagnostic_analyzer")
 
-def get_log_content(in_memory_files):
+MAX_SUSPECTED_CLASSES = 5
+
+@timed_stage("log_read")
+def get_log_content(in_memory_files, dump_dates=None):
     """
-    Retrieves the content of the log.txt file from in-memory files.
+    Retrieves the log content of a bundle from in-memory files.
+
+    All log files (log.txt, wso2carbon logs including rotated ones, access
+    logs) are merged in timestamp order, and only the records around the
+    thread dumps are kept when their dates are given, see log_ingest.read_logs().
 
     Args:
         in_memory_files (dict): Dictionary of {filename: file_content} for in-memory files.
-            Each file_content should be a BytesIO object or a bytes/string content.
+            Each file_content should be a BytesIO object.
+        dump_dates (list, optional): Analysis.date of the thread dumps.
 
     Returns:
-        str: The content of the log.txt file, or None if not found.
+        str: The merged log content, or None if no log file was found.
     """
-    # Check if log.txt exists in the in_memory_files dictionary
-    if 'log.txt' not in in_memory_files:
-        logger.error("Error: log.txt not found in uploaded files")
-        return None
-    
     try:
-        # Get the content from the dictionary
-        file_content = in_memory_files['log.txt']
-        
-        # Handle different types of file content
-        if hasattr(file_content, 'read'):
-            # If it's a file-like object (BytesIO, etc.)
-            file_content.seek(0)  # Ensure we're at the start of the file
-            
-            if hasattr(file_content, 'getvalue'):
-                # BytesIO object
-                log_content = file_content.getvalue()
-            else:
-                # Other file-like object
-                log_content = file_content.read()
-                file_content.seek(0)  # Reset position after reading
-                
-            # Convert bytes to string if needed
-            if isinstance(log_content, bytes):
-                log_content = log_content.decode('utf-8', errors='ignore')
-        else:
-            # If it's already a string or bytes
-            log_content = file_content
-            if isinstance(log_content, bytes):
-                log_content = log_content.decode('utf-8', errors='ignore')
-                
-        return log_content
-        
+        log_content = read_logs(in_memory_files, dump_dates)
     except Exception as e:
-        logger.error(f"Error processing log.txt: {e}")
+        logger.error(f"Error processing log files: {e}")
         return None
+
+    if log_content is None:
+        logger.error("Error: no log files found in uploaded files")
+    return log_content
     
 # Function to analyze error logs
-def analyze_error_log(log_content, customer_problem):
+@timed_stage("log_analysis")
+def analyze_error_log(log_content, customer_problem, log_signatures=None):
     """
     Analyzes error logs to identify patterns and potential issues.
     
     Args:
         log_content (str): Content of the log file.
         customer_problem (str): Description of the customer's problem.
+        log_signatures (list, optional): Known failure signatures from log_rules.scan_log_files().
         
     Returns:
         tuple: A tuple containing (return log_analysis, suspected_classes, error_message)
@@ -75,16 +61,17 @@ def analyze_error_log(log_content, customer_problem):
     
     if not log_content:
         logger.warning("[WARNING] No log content available for analysis")
-        return "No log content available for analysis.", []
+        return "No log content available for analysis.", [], ""
 
     sus_classes = [
     {"package": "org.apache.synapse.commons.json", "class": "JsonUtil", "issue_line": 123},
     {"package": "org.apache.synapse.mediators.builtin", "class": "LogMediator", "issue_line": 456},]
 
-    log_analysis_prompt = get_log_analysis_prompt(customer_problem, log_content, sus_classes)
+    log_analysis_prompt = get_log_analysis_prompt(customer_problem, log_content, sus_classes,
+                                                  format_log_signatures(log_signatures or []))
     
     try:
-        log_analysis = call_chatgpt_api(log_analysis_prompt)
+        findings, log_analysis = call_structured_llm(log_analysis_prompt, LOG_FINDINGS_FORMAT)
         
         # # Generate PDF report and also save text version
         # log_analysis = write_analysis_report(
@@ -93,61 +80,63 @@ def analyze_error_log(log_content, customer_problem):
         #     'log_analysis_report.pdf'
         # )
         
-        # Extract suspected classes from the response
-        suspected_classes = extract_suspected_classes(log_analysis)
-        error_message = extract_error_message(log_analysis)        
-        return log_analysis, suspected_classes, error_message
-        
-    except Exception as e:
-        logger.error(f"[ERROR] Error in log analysis: {str(e)}")
-        return error_message, []
+        if findings is None:
+            # Last resort for a response that could not be repaired
+            return get_partial_log_findings(log_analysis)
 
-# Function to extract suspected classes from log analysis
-def extract_suspected_classes(log_analysis):
-    """
-    Extracts suspected class names from the log analysis response.
-    
-    Args:
-        log_analysis (str): The log analysis report from the ChatGPT API.
+        suspected_classes = findings["suspected_classes"][:MAX_SUSPECTED_CLASSES]
+        error_message = findings["error_message"]
+        return format_log_findings(findings["analysis"], suspected_classes, error_message), suspected_classes, error_message
         
-    Returns:
-        list: A list of dictionaries with "package" and "class" keys, or an empty list if none are found.
-    """
-    try:
-        # Match the line starting with SUSPECTED_CLASSES followed by a Python list
-        match = re.search(r"SUSPECTED_CLASSES:\s*(\[.*?\])", log_analysis, re.DOTALL)
-        if match:
-            suspected_classes_str = match.group(1)
-            suspected_classes = ast.literal_eval(suspected_classes_str)
-            if isinstance(suspected_classes, list):
-                return suspected_classes
     except Exception as e:
-        logger.error(f"Error while extracting suspected classes: {e}")
+        error_message = f"[ERROR] Error in log analysis: {str(e)}"
+        logger.error(error_message)
+        return error_message, [], ""
 
-    return []
+# Function to format the log analysis with its findings for the report and later prompts
+def format_log_findings(analysis, suspected_classes, error_message):
+    """Returns the analysis text followed by the SUSPECTED_CLASSES and ERROR_MESSAGE lines."""
+    return f"{analysis}\n\nSUSPECTED_CLASSES: {json.dumps(suspected_classes)}\nERROR_MESSAGE: {error_message}"
 
-def extract_error_message(log_analysis):
+# Function to keep the valid findings of a log analysis response that failed validation
+def get_partial_log_findings(response_text):
     """
-    Extracts error messages from the log analysis response.
-    
+    Keeps the valid keys of a JSON response that does not match LOG_FINDINGS_FORMAT.
+
+    Suspected classes that are not valid are dropped one by one, so a single
+    bad entry does not lose the others. A response that is not a JSON object,
+    such as the error of a failed call, gives no suspected classes and no error message.
+
     Args:
-        log_analysis (str): The log analysis report from the ChatGPT API.
-        
+        response_text (str): The last response of the log analysis.
+
     Returns:
-        str: The error message, or an empty string if none are found.
+        tuple: (log_analysis, suspected_classes, error_message)
     """
     try:
-        # Match the line starting with ERROR_MESSAGE followed by a Python string
-        match = re.search(r"ERROR_MESSAGE:\s*(.*)", log_analysis, re.DOTALL)
-        if match:
-            error_message = match.group(1).strip()
-            return error_message
-    except Exception as e:
-        logger.error(f"Error while extracting error message: {e}")
+        findings = decode_json_response(response_text)
+    except ValueError:
+        findings = None
+    if not isinstance(findings, dict):
+        return response_text, [], ""
 
-    return ""
+    class_schema = LOG_FINDINGS_FORMAT["schema"]["properties"]["suspected_classes"]["items"]
+    suspected_classes = findings.get("suspected_classes")
+    if isinstance(suspected_classes, list):
+        suspected_classes = [sus_class for sus_class in suspected_classes
+                             if not validate_json(sus_class, class_schema)][:MAX_SUSPECTED_CLASSES]
+    else:
+        suspected_classes = []
+    error_message = findings.get("error_message")
+    if not isinstance(error_message, str):
+        error_message = ""
+    analysis = findings.get("analysis")
+    if not isinstance(analysis, str):
+        analysis = response_text
+    return format_log_findings(analysis, suspected_classes, error_message), suspected_classes, error_message
     
 # Function to fetch and analyze class files
+@timed_stage("class_analysis")
 def fetch_and_analyze_files(suspected_classes, customer_problem, error_message_text, log_analysis):
     """
     Fetches the specified class files from GitHub and analyzes them.
@@ -171,7 +160,7 @@ def fetch_and_analyze_files(suspected_classes, customer_problem, error_message_t
         package_name = sus_class["package"]
         line_number = sus_class["issue_line"]
         file_path = get_file_path(filename, package_name)
-        file_content = fetch_file_content(file_path)
+        file_content = get_file_content(file_path)
         file_content_with_line_number = embed_line_number(file_content, line_number)
 
         class_files_content[filename] = f"// Content in {filename}\n// {file_content_with_line_number} \n// Line number with the issue: {line_number}\n"
@@ -213,13 +202,22 @@ def embed_line_number(file_content, line_number):
     return '\n'.join(lines)
     
 def get_file_path(filename: str, package_name: str) -> str:
+    # Imported on first use, only class analysis talks to GitHub
+    import requests
+
     owner = "WSO2"
     token = os.getenv("GITHUB_API_KEY")
     path = package_name.replace('.', '/')
 
     try:
-        # Search for file paths
-        file_urls = search_file_paths(owner, filename, token)
+        # Search for file paths, shared through the cache backend
+        cache_key = get_content_key("search", owner, filename)
+        cached = cache_get("github", cache_key)
+        if cached is not None:
+            file_urls = json.loads(cached)
+        else:
+            file_urls = search_file_paths(owner, filename, token)
+            cache_set("github", cache_key, json.dumps(file_urls).encode("utf-8"))
         for file_url in file_urls:
             if path in file_url:
                 return file_url
@@ -228,7 +226,10 @@ def get_file_path(filename: str, package_name: str) -> str:
         logger.error(f"Error: {e}")
 
 # Function to search for file paths by file name
+@timed_stage("github_fetch")
 def search_file_paths(owner, filename, token):
+    import requests
+
     query = f"org:{owner} filename:{filename}.java"
     url = f"https://api.github.com/search/code?q={query}"
     headers = {
@@ -241,7 +242,20 @@ def search_file_paths(owner, filename, token):
     
     return [item['url'] for item in search_results['items']]
 
+# Function to get the content of a GitHub file, shared through the cache backend
+def get_file_content(url: str) -> str:
+    cache_key = get_content_key("content", url)
+    cached = cache_get("github", cache_key)
+    if cached is not None:
+        return cached.decode("utf-8")
+    content = fetch_file_content(url)
+    cache_set("github", cache_key, content.encode("utf-8"))
+    return content
+
+@timed_stage("github_fetch")
 def fetch_file_content(url: str) -> str:
+    import requests
+
     GITHUB_TOKEN = os.getenv("GITHUB_API_KEY")
     headers = {'Authorization': f'token {GITHUB_TOKEN}'}
     
@@ -0,0 +1,166 @@
+import re
+import logging
+from io import BytesIO
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from .log_ingest import iter_log_records, TIMESTAMP_FORMAT
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+CORRELATION_BEFORE_SECONDS = 120
+CORRELATION_AFTER_SECONDS = 10
+EVENTS_PER_QUERY = 20
+THREAD_NAME_SEARCH_CHARS = 200
+
+# "[2024-01-01 10:00:00,123] [PassThroughMessageProcessor-12]  INFO {LogMediator} - ..."
+BRACKETED_FIELD_REGEX = re.compile(r"\[([^\[\]]+)\]")
+LOG_LEVEL_REGEX = re.compile(r"\s(?:TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\b")
+# Bracketed fields that are not thread names: timestamps, tenant IDs
+NOT_THREAD_NAME_REGEX = re.compile(r"^\s*$|^-?\d+$|\d{4}-\d{2}-\d{2}|\d{2}/[A-Z][a-z]{2}/\d{4}:")
+
+class LogIndex:
+    """
+    Log events in timestamp order, indexed by time and by the thread that logged them.
+
+    Timestamps are "YYYY-MM-DD HH:MM:SS" strings kept in sorted lists, one for
+    all events and one per thread, so every time range query is two bisections.
+    """
+    def __init__(self):
+        self.timestamps = []
+        self.events = []
+        self.thread_names = []
+        self._thread_timestamps = {}
+        self._thread_events = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, timestamp, event, thread_name=None):
+        """Appends an event; events must be added in timestamp order."""
+        event_id = len(self.events)
+        self.timestamps.append(timestamp)
+        self.events.append(event)
+        self.thread_names.append(thread_name)
+        if thread_name is not None:
+            self._thread_timestamps.setdefault(thread_name, []).append(timestamp)
+            self._thread_events.setdefault(thread_name, []).append(event_id)
+
+    def query(self, start, end, thread_name=None):
+        """
+        Returns the IDs of the events from start to end (inclusive), of one thread if given.
+
+        Args:
+            start (str): "YYYY-MM-DD HH:MM:SS" timestamp.
+            end (str): "YYYY-MM-DD HH:MM:SS" timestamp.
+            thread_name (str, optional): Name of the thread that logged the events.
+
+        Returns:
+            list: Event IDs in timestamp order.
+        """
+        if thread_name is None:
+            return list(range(bisect_left(self.timestamps, start), bisect_right(self.timestamps, end)))
+        timestamps = self._thread_timestamps.get(thread_name)
+        if not timestamps:
+            return []
+        return self._thread_events[thread_name][bisect_left(timestamps, start):bisect_right(timestamps, end)]
+
+# Function to get the thread name of a log record
+def get_log_thread_name(record):
+    """
+    Returns the thread name of a log record, or None if its layout has none.
+
+    The thread is the last bracketed field of the record header that is
+    neither a timestamp nor a tenant ID.
+    """
+    header = record[:record.find("\n")] if "\n" in record else record
+    level = LOG_LEVEL_REGEX.search(header[:THREAD_NAME_SEARCH_CHARS])
+    header = header[:level.start()] if level else header[:THREAD_NAME_SEARCH_CHARS]
+    fields = [field for field in BRACKETED_FIELD_REGEX.findall(header) if not NOT_THREAD_NAME_REGEX.search(field)]
+    return fields[-1].strip() if fields else None
+
+# Function to index the log content of a bundle
+def build_log_index(log_content):
+    """
+    Builds a LogIndex from log text, such as the merged records returned by get_log_content().
+
+    Lines before the first timestamp cannot be placed in time and are left out.
+    """
+    index = LogIndex()
+    if not log_content:
+        return index
+    last_timestamp = ""
+    for timestamp, record in iter_log_records("log", BytesIO(log_content.encode("utf-8"))):
+        timestamp = timestamp.decode()
+        # Out of order records, such as in a log.txt assembled by hand, are kept in order of the index
+        if not timestamp or timestamp < last_timestamp:
+            continue
+        last_timestamp = timestamp
+        index.add(timestamp, record, get_log_thread_name(record))
+    return index
+
+# Function to find the log events correlated with the problem threads
+def get_correlated_log_events(log_index, problem_threads, dump_dates, before_seconds=CORRELATION_BEFORE_SECONDS,
+                              after_seconds=CORRELATION_AFTER_SECONDS, limit=EVENTS_PER_QUERY):
+    """
+    Returns the log events logged around each thread dump by the problem threads.
+
+    For every dump, the events each problem thread logged from before_seconds
+    before the dump to after_seconds after it are looked up. When none of the
+    problem threads logged in that range, or the log layout has no thread
+    names, the events of all threads in the range are used instead. Each query
+    keeps the limit events closest to the dump, and an event is reported once.
+
+    Args:
+        log_index (LogIndex): Index built by build_log_index().
+        problem_threads (list): Names of the problematic threads.
+        dump_dates (list): Analysis.date of the thread dumps.
+
+    Returns:
+        list: {"dumpDate", "thread" (None for all threads), "events"} dictionaries.
+    """
+    correlated = []
+    seen = set()
+    for dump_date in sorted(dump_dates):
+        start = (dump_date - timedelta(seconds=before_seconds)).strftime(TIMESTAMP_FORMAT)
+        end = (dump_date + timedelta(seconds=after_seconds)).strftime(TIMESTAMP_FORMAT)
+        queries = [(thread_name, log_index.query(start, end, thread_name)) for thread_name in problem_threads]
+        queries = [(thread_name, event_ids) for thread_name, event_ids in queries if event_ids]
+        if not queries:
+            queries = [(None, log_index.query(start, end))]
+
+        for thread_name, event_ids in queries:
+            event_ids = [event_id for event_id in event_ids[-limit:] if event_id not in seen]
+            seen.update(event_ids)
+            if event_ids:
+                correlated.append({"dumpDate": dump_date.strftime(TIMESTAMP_FORMAT), "thread": thread_name,
+                                   "events": [log_index.events[event_id] for event_id in event_ids]})
+    return correlated
+
+# Function to format the correlated log events for the comprehensive thread analysis
+def get_correlated_log_content(log_content, problem_threads, dump_dates):
+    """
+    Returns the log events correlated with the problem threads and dumps, as text for a prompt.
+
+    Args:
+        log_content (str): Log records from get_log_content().
+        problem_threads (list): Names of the problematic threads.
+        dump_dates (list): Analysis.date of the thread dumps.
+
+    Returns:
+        str: The correlated events grouped by dump and thread, or None if there are none.
+    """
+    log_index = build_log_index(log_content)
+    correlated = get_correlated_log_events(log_index, problem_threads, dump_dates)
+    if not correlated:
+        return None
+
+    sections = []
+    for group in correlated:
+        logged_by = f"thread {group['thread']}" if group["thread"] else "all threads"
+        sections.append(f"Logged by {logged_by} around the thread dump taken at {group['dumpDate']}:\n"
+                        + "".join(group["events"]))
+    logger.info(f"Correlated {sum(len(group['events']) for group in correlated)} of {len(log_index)} log events "
+                f"with the problem threads")
+    return "\n".join(sections)
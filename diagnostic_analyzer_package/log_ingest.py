@@ -0,0 +1,228 @@
+import os
+import re
+import gzip
+import heapq
+import logging
+from datetime import timedelta
+from operator import itemgetter
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+DEFAULT_WINDOW_BEFORE_MINUTES = 10
+DEFAULT_WINDOW_AFTER_MINUTES = 2
+TIMESTAMP_SEARCH_BYTES = 120
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# log.txt, wso2carbon.log, wso2carbon-2024-01-01.log, wso2carbon.log.1(.gz), http_access_2024-01-01.log, nohup.out
+LOG_FILENAME_REGEX = re.compile(r"^log\.txt$|\.log(?:\.\d+|\.\d{4}-\d{2}-\d{2})?(?:\.gz)?$|^nohup\.out$", re.IGNORECASE)
+# wso2error.log repeats the error records of wso2carbon.log
+DUPLICATE_LOG_REGEX = re.compile(r"^wso2error", re.IGNORECASE)
+PRIMARY_LOG_REGEX = re.compile(r"^wso2carbon", re.IGNORECASE)
+
+# "[2024-01-01 10:00:00,123]" in carbon logs and "[01/Jan/2024:10:00:00 +0000]" in access logs
+ISO_TIMESTAMP_REGEX = re.compile(rb"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})")
+ACCESS_LOG_TIMESTAMP_REGEX = re.compile(rb"\[(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}:\d{2}:\d{2})")
+MONTHS = {month.encode(): f"{i + 1:02d}".encode() for i, month in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])}
+# Lines looked at after a bisection probe before giving up on finding a timestamp
+PROBE_LINES = 64
+
+# Function to list the log files of a bundle
+def find_log_files(in_memory_files):
+    """
+    Returns the names of the log files among the in-memory files.
+
+    log.txt comes first, then the wso2carbon logs and the other logs by name.
+    wso2error logs are left out when a wso2carbon log is present, as they
+    repeat its error records.
+    """
+    names = [name for name in in_memory_files if LOG_FILENAME_REGEX.search(os.path.basename(name))]
+    if any(PRIMARY_LOG_REGEX.match(os.path.basename(name)) for name in names):
+        names = [name for name in names if not DUPLICATE_LOG_REGEX.match(os.path.basename(name))]
+    return sorted(names, key=lambda name: (os.path.basename(name) != "log.txt",
+                                           not PRIMARY_LOG_REGEX.match(os.path.basename(name)), name))
+
+# Function to get the timestamp of a log line
+def get_log_timestamp(line):
+    # Timestamps are kept as b"YYYY-MM-DD HH:MM:SS", which sort like the times they stand for
+    head = line[:TIMESTAMP_SEARCH_BYTES]
+    match = ISO_TIMESTAMP_REGEX.search(head)
+    if match:
+        return match.group(1) + b" " + match.group(2)
+    match = ACCESS_LOG_TIMESTAMP_REGEX.search(head)
+    if match and match.group(2) in MONTHS:
+        return match.group(3) + b"-" + MONTHS[match.group(2)] + b"-" + match.group(1) + b" " + match.group(4)
+    return None
+
+def _get_timestamp_after(data, offset):
+    # Returns (line offset, timestamp) of the first line with a timestamp starting at or after offset
+    if offset > 0:
+        newline = data.find(b"\n", offset - 1)
+        offset = len(data) if newline == -1 else newline + 1
+    for _ in range(PROBE_LINES):
+        if offset >= len(data):
+            break
+        end = data.find(b"\n", offset)
+        end = len(data) if end == -1 else end + 1
+        timestamp = get_log_timestamp(data[offset:min(end, offset + TIMESTAMP_SEARCH_BYTES)])
+        if timestamp is not None:
+            return offset, timestamp
+        offset = end
+    return None, None
+
+# Function to find where the records of a time window start in a log file
+def find_start_offset(data, start):
+    """
+    Bisects the bytes of a log file, sorted by time, for the first record at or after start.
+
+    Probes that find no timestamp count as late, so the offset may fall a few
+    records early, never after the first record of the window.
+
+    Returns:
+        int: The offset of a line at or before that record.
+    """
+    low, high = 0, len(data)
+    while low < high:
+        middle = (low + high) // 2
+        _, timestamp = _get_timestamp_after(data, middle)
+        if timestamp is None or timestamp >= start:
+            high = middle
+        else:
+            low = middle + 1
+    if low == 0:
+        return 0
+    newline = data.find(b"\n", low - 1)
+    return len(data) if newline == -1 else newline + 1
+
+# Function to read the records of one log file
+def iter_log_records(name, file_content, start=None):
+    """
+    Yields (timestamp, record) for every record of a log file, in file order.
+
+    A record is a line with a timestamp followed by the lines without one,
+    such as the stack trace of an exception. Lines are read one at a time,
+    straight from the BytesIO (or through gzip for .gz files). With a start,
+    plain files are bisected to the first record of the window and the
+    records of gzipped files before it are skipped without being decoded.
+
+    Args:
+        name (str): Name of the log file.
+        file_content (BytesIO): Content of the log file.
+        start (bytes, optional): Timestamp of the first record to yield.
+
+    Yields:
+        tuple: (b"YYYY-MM-DD HH:MM:SS" or b"" before the first timestamp, record text).
+    """
+    if name.lower().endswith(".gz"):
+        file_content.seek(0)
+        lines = gzip.GzipFile(fileobj=file_content, mode="rb")
+    else:
+        file_content.seek(0 if start is None else find_start_offset(file_content.getvalue(), start))
+        lines = file_content
+    try:
+        timestamp = b""
+        record = []
+        for line in lines:
+            line_timestamp = get_log_timestamp(line)
+            if line_timestamp is not None:
+                if record:
+                    yield timestamp, b"".join(record).decode("utf-8", errors="ignore")
+                    record = []
+                timestamp = line_timestamp
+            if start is None or timestamp >= start:
+                record.append(line)
+        if record:
+            yield timestamp, b"".join(record).decode("utf-8", errors="ignore")
+    finally:
+        if lines is not file_content:
+            lines.close()
+        file_content.seek(0)
+
+# Function to merge the records of several log files by time
+def merge_log_records(in_memory_files, names=None, start=None, end=None):
+    """
+    Streams the records of several log files in timestamp order.
+
+    Each file is read lazily and the files are combined with a k-way merge,
+    so memory stays proportional to one record per file. Reading stops at the
+    first record after end.
+
+    Args:
+        in_memory_files (dict): Dictionary of {filename: BytesIO} for in-memory files.
+        names (list, optional): Log files to merge, find_log_files() by default.
+        start (str, optional): Timestamp of the first record to yield.
+        end (str, optional): Timestamp of the last record to yield.
+
+    Yields:
+        tuple: (timestamp, record text).
+    """
+    if names is None:
+        names = find_log_files(in_memory_files)
+    start = start.encode() if start is not None else None
+    end = end.encode() if end is not None else None
+    records = [iter_log_records(name, in_memory_files[name], start) for name in names]
+    for timestamp, record in heapq.merge(*records, key=itemgetter(0)):
+        if end is not None and timestamp > end:
+            break
+        yield timestamp.decode(), record
+
+# Function to get the time window of the logs around the thread dumps
+def get_log_window(dump_dates, before_minutes=None, after_minutes=None):
+    """
+    Returns the (start, end) timestamps of the log records relevant to the thread dumps.
+
+    The window starts DIAGNOSTIC_ANALYZER_LOG_WINDOW_BEFORE_MINUTES (default 10)
+    before the first dump and ends DIAGNOSTIC_ANALYZER_LOG_WINDOW_AFTER_MINUTES
+    (default 2) after the last one.
+
+    Args:
+        dump_dates (list): Analysis.date of the thread dumps.
+
+    Returns:
+        tuple: ("YYYY-MM-DD HH:MM:SS", "YYYY-MM-DD HH:MM:SS"), or None if no dump has a date.
+    """
+    dump_dates = [date for date in dump_dates if date is not None]
+    if not dump_dates:
+        return None
+    if before_minutes is None:
+        before_minutes = float(os.getenv("DIAGNOSTIC_ANALYZER_LOG_WINDOW_BEFORE_MINUTES", DEFAULT_WINDOW_BEFORE_MINUTES))
+    if after_minutes is None:
+        after_minutes = float(os.getenv("DIAGNOSTIC_ANALYZER_LOG_WINDOW_AFTER_MINUTES", DEFAULT_WINDOW_AFTER_MINUTES))
+    start = min(dump_dates) - timedelta(minutes=before_minutes)
+    end = max(dump_dates) + timedelta(minutes=after_minutes)
+    return start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+
+# Function to get the dates of parsed thread dumps
+def get_dump_dates(analyses):
+    return [analysis.date for analysis in analyses or [] if analysis.date is not None]
+
+# Function to read the logs of a bundle
+def read_logs(in_memory_files, dump_dates=None):
+    """
+    Returns the merged text of all log files, limited to the window around the thread dumps.
+
+    Without dump dates the logs are merged in full. When no record falls in the
+    window, for instance because the dumps and the logs come from different
+    days, the full logs are returned rather than nothing.
+
+    Args:
+        in_memory_files (dict): Dictionary of {filename: BytesIO} for in-memory files.
+        dump_dates (list, optional): Analysis.date of the thread dumps.
+
+    Returns:
+        str: The log records in timestamp order, or None if there is no log file.
+    """
+    names = find_log_files(in_memory_files)
+    if not names:
+        return None
+
+    window = get_log_window(dump_dates or [])
+    if window is not None:
+        text = "".join(record for _, record in merge_log_records(in_memory_files, names, *window))
+        if text:
+            logger.info(f"Read log records from {window[0]} to {window[1]} in {', '.join(names)}")
+            return text
+        logger.warning(f"No log records between {window[0]} and {window[1]}, using the full logs")
+
+    return "".join(record for _, record in merge_log_records(in_memory_files, names))
@@ -0,0 +1,225 @@
+import re
+import gzip
+import logging
+import functools
+from collections import Counter
+
+from .utils import load_log_rules_config
+from .log_ingest import find_log_files, get_log_timestamp
+from .metrics import timed_stage
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+SAMPLE_CHARS = 300
+# An alternative of a pattern that is plain text, possibly with escaped punctuation
+LITERAL_ALTERNATIVE_REGEX = re.compile(r"^(?:[^\\.^$*+?{}\[\]()|]|\\[^A-Za-z0-9])+$")
+ESCAPE_REGEX = re.compile(r"\\(.)")
+# Keywords are searched through shared substrings of this length, like "onnectio" for all connection errors
+ANCHOR_LENGTH = 8
+# Anchors inside words that fill every log would send most lines to the regex
+COMMON_LOG_WORDS = (b"exception", b"error", b"warning", b"thread", b"message", b"request", b"response")
+
+# Function to get the literals that every match of a rule contains one of
+def get_rule_keywords(rule):
+    """
+    Returns the keywords of a log rule: its "keywords", or the alternatives of a plain text pattern.
+
+    Returns:
+        list: Keywords, or None if the rule must be matched against every line.
+    """
+    if rule.get("keywords"):
+        return rule["keywords"]
+    alternatives = rule["pattern"].split("|")
+    if all(LITERAL_ALTERNATIVE_REGEX.match(alternative) for alternative in alternatives):
+        return [ESCAPE_REGEX.sub(r"\1", alternative) for alternative in alternatives]
+    return None
+
+# Function to choose the substrings searched for a set of keywords
+def get_keyword_anchors(keywords, anchor_length=ANCHOR_LENGTH):
+    """
+    Returns a small set of substrings such that every keyword contains one of them.
+
+    Each anchor is a separate pass over the text, so keywords sharing a
+    substring are covered by one anchor, picked greedily by the number of
+    keywords it covers. Short anchors are searched at about half the speed of
+    long ones, so keywords sharing a substring with fewer than two others are
+    searched whole.
+    """
+    uncovered = set(keywords)
+    anchors = []
+    while uncovered:
+        candidates = Counter()
+        for keyword in uncovered:
+            length = min(anchor_length, len(keyword))
+            for substring in {keyword[i:i + length] for i in range(len(keyword) - length + 1)}:
+                if not any(substring.lower() in word or word in substring.lower() for word in COMMON_LOG_WORDS):
+                    candidates[substring] += 1
+        anchor, count = max(candidates.items(), key=lambda item: (item[1], item[0]), default=(None, 0))
+        if count < 3:
+            # Sharing an anchor between two keywords costs as much as searching both
+            anchors.extend(sorted(uncovered))
+            break
+        anchors.append(anchor)
+        uncovered = {keyword for keyword in uncovered if anchor not in keyword}
+    return anchors
+
+def _compile_rules(indexed_rules):
+    # One alternation with a named group per rule, so a single search tells which rules match
+    if not indexed_rules:
+        return None
+    groups = []
+    for index, rule in indexed_rules:
+        flags = "(?i:" if rule.get("ignoreCase") else "(?:"
+        groups.append(f"(?P<rule{index}>{flags}{rule['pattern']}))")
+    return re.compile("|".join(groups).encode())
+
+class LogRules:
+    """
+    Known failure signatures from LogRules.json, compiled for a single pass over the logs.
+
+    Every rule is a named group of one combined regex. The literal keywords of
+    all rules are first reduced to a few shared anchors, which are searched
+    with bytes.find (lowercased if a rule ignores case) at memory speed, and
+    the combined regex only confirms the lines that contain an anchor. Rules
+    without keywords are matched by a second combined regex over the whole text.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        keyword_rules = []
+        scan_rules = []
+        keywords = set()
+        for index, rule in enumerate(rules):
+            rule_keywords = get_rule_keywords(rule)
+            if rule_keywords:
+                keyword_rules.append((index, rule))
+                keywords.update(keyword.lower().encode() for keyword in rule_keywords)
+            else:
+                logger.debug(f"Log rule '{rule['name']}' has no keywords and is matched against every line")
+                scan_rules.append((index, rule))
+
+        # Lowercasing the text costs a pass, so it is only done when a rule ignores case
+        self.ignore_case = any(rule.get("ignoreCase") for _, rule in keyword_rules)
+        if not self.ignore_case:
+            keywords = {keyword.encode() for _, rule in keyword_rules for keyword in get_rule_keywords(rule)}
+        self.keywords = sorted(keywords)
+        self.anchors = get_keyword_anchors(self.keywords)
+        self.keyword_regex = _compile_rules(keyword_rules)
+        self.scan_regex = _compile_rules(scan_rules)
+
+    def new_summary(self):
+        return [{"rule": rule["name"], "severity": rule.get("severity", "error"),
+                 "description": rule.get("description", ""), "count": 0,
+                 "firstSeen": None, "lastSeen": None, "sample": None} for rule in self.rules]
+
+    def _add_line(self, summary, line, regex):
+        for index in {int(match.lastgroup[4:]) for match in regex.finditer(line)}:
+            entry = summary[index]
+            entry["count"] += 1
+            if entry["sample"] is None:
+                entry["sample"] = line[:SAMPLE_CHARS].decode("utf-8", errors="ignore").strip()
+            timestamp = get_log_timestamp(line)
+            if timestamp is not None:
+                timestamp = timestamp.decode()
+                entry["firstSeen"] = entry["firstSeen"] or timestamp
+                entry["lastSeen"] = timestamp
+
+    def scan_chunk(self, summary, chunk):
+        """Counts the lines of a chunk, which must end at a line end, matching each rule."""
+        if self.keyword_regex is not None:
+            text = chunk.lower() if self.ignore_case else chunk
+            line_starts = set()
+            for anchor in self.anchors:
+                position = text.find(anchor)
+                while position != -1:
+                    line_starts.add(chunk.rfind(b"\n", 0, position) + 1)
+                    line_end = chunk.find(b"\n", position)
+                    if line_end == -1:
+                        break
+                    position = text.find(anchor, line_end)
+            for line_start in sorted(line_starts):
+                line_end = chunk.find(b"\n", line_start)
+                self._add_line(summary, chunk[line_start:len(chunk) if line_end == -1 else line_end], self.keyword_regex)
+
+        if self.scan_regex is not None:
+            line_starts = {chunk.rfind(b"\n", 0, match.start()) + 1 for match in self.scan_regex.finditer(chunk)}
+            for line_start in sorted(line_starts):
+                line_end = chunk.find(b"\n", line_start)
+                self._add_line(summary, chunk[line_start:len(chunk) if line_end == -1 else line_end], self.scan_regex)
+
+    def scan(self, stream, summary=None, chunk_size=SCAN_CHUNK_SIZE):
+        """
+        Scans a binary stream in chunks cut at line ends.
+
+        Returns:
+            list: Per-rule entries with the number of matching lines, the first
+            and last timestamps and a sample line, in rule order.
+        """
+        if summary is None:
+            summary = self.new_summary()
+        tail = b""
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b"\n") + 1
+            self.scan_chunk(summary, data[:cut])
+            tail = data[cut:]
+        if tail:
+            self.scan_chunk(summary, tail)
+        return summary
+
+# Function to compile the configured log rules on first use
+@functools.lru_cache(maxsize=None)
+def get_log_rules():
+    return LogRules(load_log_rules_config()["logRules"])
+
+# Function to count the known failure signatures in the logs of a bundle
+@timed_stage("log_rules")
+def scan_log_files(in_memory_files, log_rules=None):
+    """
+    Counts the lines matching each log rule across all log files of a bundle.
+
+    Every file is read once, in chunks, and gzipped files are decompressed
+    while they are scanned.
+
+    Args:
+        in_memory_files (dict): Dictionary of {filename: BytesIO} for in-memory files.
+        log_rules (LogRules, optional): Rules to apply, LogRules.json by default.
+
+    Returns:
+        list: The rules that matched, most frequent first.
+    """
+    if log_rules is None:
+        log_rules = get_log_rules()
+
+    summary = log_rules.new_summary()
+    for name in find_log_files(in_memory_files):
+        file_content = in_memory_files[name]
+        file_content.seek(0)
+        if name.lower().endswith(".gz"):
+            with gzip.GzipFile(fileobj=file_content, mode="rb") as stream:
+                log_rules.scan(stream, summary)
+        else:
+            log_rules.scan(file_content, summary)
+        file_content.seek(0)
+
+    matches = sorted((entry for entry in summary if entry["count"]), key=lambda entry: -entry["count"])
+    if matches:
+        logger.info("Known failure signatures in the logs: "
+                    + ", ".join(f"{entry['rule']} ({entry['count']})" for entry in matches))
+    return matches
+
+# Function to format the log rule matches as text
+def format_log_signatures(log_signatures):
+    """Returns one line per matched rule, for prompts and reports."""
+    lines = []
+    for entry in log_signatures:
+        seen = ""
+        if entry["firstSeen"]:
+            seen = f", first {entry['firstSeen']}, last {entry['lastSeen']}"
+        lines.append(f"- {entry['count']}x {entry['rule']} ({entry['severity']}{seen}): {entry['description']}")
+        lines.append(f"  Sample: {entry['sample']}")
+    return "\n".join(lines)
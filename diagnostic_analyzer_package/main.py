@@ -1,21 +1,46 @@
-import json
 import os
 import sys
 import logging
+import argparse
 
-from .thread_analyzer import analyze_thread_dumps_and_extract_problems, get_comprehensive_thread_analysis
+from .thread_analyzer import parse_thread_dumps, analyze_thread_dumps_and_extract_problems, get_comprehensive_thread_analysis
 from .log_analyzer import get_log_content, analyze_error_log, fetch_and_analyze_files
-from .utils import read_package_file, pretty_print
-from .report import write_final_report
+from .log_ingest import get_dump_dates
+from .log_rules import scan_log_files
+from .utils import load_thread_groups_config, pretty_print
+from .bundle_loader import load_bundle_path, BundleError
+from .report import get_final_report_model, render_report_pdf, export_report, get_report_format, REPORT_EXPORTERS
 from .final_analyzer import get_diagnostic_conclusion
+from .batch import batch_main
+from .metrics import start_request_timings, get_request_timings, format_request_timings
+from .profiling import AnalysisProfiler
 
 # Configure logger
 logger = logging.getLogger("diagnostic_analyzer")
 
+REPORT_BASENAME = "final_diagnostic_report"
+
 def main():
     """
     Main function that runs the diagnostic tool in an interactive flow.
+
+    `diagnostic_analyzer batch ...` runs the non-interactive batch mode instead.
     """
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(prog="diagnostic_analyzer", description="Interactive diagnostic analysis.")
+    parser.add_argument("-f", "--format", default="pdf",
+                        help=f"Final report format, one of {', '.join(REPORT_EXPORTERS)} or md (default pdf)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the analysis with cProfile and tracemalloc, saved next to the report")
+    args = parser.parse_args()
+    report_format = get_report_format(args.format)
+    if report_format is None:
+        parser.error(f"unsupported report format: {args.format}")
+
     try:
         # ASCII art banner for CLI
         banner = """
@@ -41,27 +66,41 @@ def main():
         logger.info("\n" + "="*70)
         logger.info("STEP 2: Diagnostic Data Location")
         logger.info("="*70)
-        folder_path = input("Enter the path to the folder containing thread dumps and logs: ")
+        folder_path = input("Enter the path to the folder or archive (zip, tar.gz) containing thread dumps and logs: ")
         
         # Validate folder path
         if not os.path.exists(folder_path):
             logger.error(f"The specified folder path '{folder_path}' does not exist.")
             return
+
+        start_request_timings()
+        try:
+            in_memory_files = load_bundle_path(folder_path)
+        except BundleError as error:
+            logger.error(f"Failed to load '{folder_path}': {error}")
+            return
         
         # Load the thread groups configuration
         try:
-            thread_groups_config = json.loads(read_package_file('ThreadGroups.json'))
+            thread_groups_config = load_thread_groups_config()
         except Exception as error:
             logger.error(f"Failed to read ThreadGroups.json: {error}")
             return
         
+        report_file = os.path.abspath(REPORT_BASENAME + REPORT_EXPORTERS[report_format]['extension'])
+        profiler = AnalysisProfiler(os.path.abspath(REPORT_BASENAME)) if args.profile else None
+        if profiler:
+            profiler.start()
+
         # Step 3: Analyze thread dumps and extract problematic threads
         logger.info("\n" + "="*70)
         logger.info("STEP 3: Thread Dump Analysis")
         logger.info("="*70)
+        analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+        log_signatures = scan_log_files(in_memory_files)
         thread_analysis, problem_threads = analyze_thread_dumps_and_extract_problems(
-            thread_groups_config, folder_path, customer_problem
-        )
+            thread_groups_config, in_memory_files, customer_problem, analyses
+        ) or ("Thread dump analysis failed.", [])
         
         # Display summary of thread analysis
         if thread_analysis and "THREADS_FOR_ANALYSIS" in thread_analysis:
@@ -76,7 +115,8 @@ def main():
         else:
             logger.warning("Thread dump analysis did not yield expected results.")
 
-        log_content = get_log_content(folder_path)
+        # Only the log records around the thread dumps
+        log_content = get_log_content(in_memory_files, get_dump_dates(analyses))
 
         # Step 4: Comprehensive thread analysis with stack traces
         logger.info("\n" + "="*70)
@@ -86,7 +126,7 @@ def main():
         
         if problem_threads:
             comprehensive_thread_analysis = get_comprehensive_thread_analysis(
-                thread_analysis, problem_threads, customer_problem, log_content
+                thread_analysis, problem_threads, customer_problem, log_content, get_dump_dates(analyses), analyses
             )
             logger.info("Comprehensive thread analysis completed.")
         else:
@@ -98,7 +138,7 @@ def main():
         logger.info("="*70)
         
         if log_content:
-            log_analysis, suspected_classes, error_message = analyze_error_log(log_content, customer_problem)
+            log_analysis, suspected_classes, error_message = analyze_error_log(log_content, customer_problem, log_signatures)
 
             logger.info(f"Log analysis completed. error in the log - {error_message}")
             
@@ -110,7 +150,7 @@ def main():
             else:
                 logger.info("No specific classes were identified as suspicious in logs.")
         else:
-            logger.warning("No log.txt file found in the specified folder.")
+            logger.warning("No log files found in the specified folder.")
             log_analysis = "No log content available for analysis."
             suspected_classes = []
         
@@ -157,15 +197,22 @@ def main():
 
         final_report = get_diagnostic_conclusion(customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis)
         
-        report_file = write_final_report(
+        report = get_final_report_model(
             customer_problem, 
             log_analysis, 
             comprehensive_thread_analysis, 
             class_analysis,
-            final_report
+            str(final_report)
         )
-        
+        if report_format == 'pdf':
+            render_report_pdf(report, output=report_file)
+        else:
+            export_report(report, report_format, report_file)
+        if profiler:
+            profiler.stop()
+
         logger.info(f"Analysis complete! Final report generated: {report_file}")
+        logger.info(f"Time per stage: {format_request_timings(get_request_timings())}")
         logger.info("\nThank you for using the Diagnostic Analyzer Tool!")
         
     except KeyboardInterrupt:
@@ -0,0 +1,269 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+METRIC_PREFIX = "diagnostic_analyzer"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Stages entered by the current thread or task, innermost last
+_stage_stack = contextvars.ContextVar("diagnostic_analyzer_stages", default=())
+# Timing breakdown of the current request, None outside of a request
+_request_timings = contextvars.ContextVar("diagnostic_analyzer_request_timings", default=None)
+
+def _format_labels(label_names, label_values, extra=""):
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing value per label set, in the Prometheus counter model."""
+    def __init__(self, name, documentation, label_names=()):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Observations counted in cumulative buckets per label set, in the Prometheus histogram model."""
+    def __init__(self, name, documentation, label_names=(), buckets=SECONDS_BUCKETS):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # {labels: [bucket counts..., sum, count]}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                bound_label = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, bound_label)} {count}")
+            infinity_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, infinity_label)} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each analysis stage, including nested stages.", ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Analysis stages that raised an exception.", ("stage",))
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by the stage that made them, the model and their outcome.",
+                    ("stage", "model", "outcome"))
+LLM_SECONDS = Histogram("llm_call_seconds", "Latency of LLM calls.", ("stage", "model"))
+LLM_COST = Counter("llm_cost_dollars_total", "Cost of LLM calls in US dollars, from the prices in ModelRouting.json.",
+                   ("stage", "model"))
+LLM_TOKENS = Counter("llm_tokens_total",
+                     "Tokens sent to (in) and received from (out) the LLM, and the prompt tokens served from the "
+                     "provider's prompt cache (cached, also counted in in).", ("stage", "direction"))
+LLM_PAYLOAD_BYTES = Histogram("llm_payload_bytes", "Size of LLM prompts (in) and responses (out) in UTF-8 bytes.",
+                              ("stage", "direction"), BYTES_BUCKETS)
+HTTP_SECONDS = Histogram("http_request_seconds", "Time to handle web requests, until the response starts.",
+                         ("endpoint", "method", "status"))
+COALESCED_CALLS = Counter("coalesced_calls_total", "Calls that waited for an identical call in flight and shared its result.",
+                          ("flight",))
+CACHE_REQUESTS = Counter("cache_requests_total", "Shared cache lookups by namespace and result (hit, miss or error).",
+                         ("namespace", "result"))
+STRUCTURED_OUTPUTS = Counter("structured_outputs_total",
+                             "Structured LLM responses by format and outcome (valid, repaired, invalid or error).",
+                             ("format", "outcome"))
+LLM_BATCHES = Counter("llm_batches_total",
+                      "Batch API jobs by final status (completed, failed, expired, cancelled or error).", ("status",))
+REGISTRY = [STAGE_SECONDS, STAGE_ERRORS, LLM_CALLS, LLM_SECONDS, LLM_COST, LLM_TOKENS, LLM_PAYLOAD_BYTES, HTTP_SECONDS, COALESCED_CALLS,
+            CACHE_REQUESTS, STRUCTURED_OUTPUTS, LLM_BATCHES]
+
+# Function to name the innermost stage being timed
+def get_current_stage():
+    """Returns the name of the innermost timed stage, or "none" outside of any stage."""
+    stages = _stage_stack.get()
+    return stages[-1] if stages else "none"
+
+def _add_request_timing(name, seconds):
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings["stages"].setdefault(name, {"seconds": 0.0, "count": 0})
+        entry["seconds"] += seconds
+        entry["count"] += 1
+
+# Function to time an analysis stage
+@contextmanager
+def timed_stage(name):
+    """
+    Times a block or, used as a decorator, every call of a function as the stage name.
+
+    The time is observed in the stage histogram and added to the timing
+    breakdown of the current request. Stages nest, so the time of an inner
+    stage is also part of the stages around it.
+    """
+    token = _stage_stack.set(_stage_stack.get() + (name,))
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _stage_stack.reset(token)
+        STAGE_SECONDS.observe(seconds, stage=name)
+        _add_request_timing(name, seconds)
+
+# Function to record the cost of one LLM call
+def record_llm_call(prompt, response_text, seconds, prompt_tokens=None, completion_tokens=None, error=False, model=None,
+                    reasoning_effort=None, cost=None, cached_tokens=None):
+    """
+    Records the latency, payload sizes, token usage and cost of an LLM call under the current stage.
+
+    Args:
+        prompt (str): The prompt sent.
+        response_text (str): The text received, empty on errors.
+        seconds (float): Time the call took.
+        prompt_tokens (int, optional): Tokens in the prompt, as reported by the API.
+        completion_tokens (int, optional): Tokens in the response, as reported by the API.
+        error (bool): Whether the call failed.
+        model (str, optional): The model the call was routed to.
+        reasoning_effort (str, optional): The reasoning effort asked for.
+        cost (float, optional): Cost of the call in US dollars.
+        cached_tokens (int, optional): Prompt tokens served from the provider's prompt cache.
+    """
+    stage = get_current_stage()
+    model_label = model or "unknown"
+    LLM_CALLS.inc(stage=stage, model=model_label, outcome="error" if error else "ok")
+    LLM_SECONDS.observe(seconds, stage=stage, model=model_label)
+    if cost is not None:
+        LLM_COST.inc(cost, stage=stage, model=model_label)
+    LLM_PAYLOAD_BYTES.observe(len(prompt.encode("utf-8", errors="ignore")), stage=stage, direction="in")
+    LLM_PAYLOAD_BYTES.observe(len((response_text or "").encode("utf-8", errors="ignore")), stage=stage, direction="out")
+    if prompt_tokens is not None:
+        LLM_TOKENS.inc(prompt_tokens, stage=stage, direction="in")
+    if completion_tokens is not None:
+        LLM_TOKENS.inc(completion_tokens, stage=stage, direction="out")
+    if cached_tokens is not None:
+        LLM_TOKENS.inc(cached_tokens, stage=stage, direction="cached")
+
+    _add_request_timing("llm_call", seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings["llm"].append({
+            "stage": stage,
+            "model": model,
+            "reasoningEffort": reasoning_effort,
+            "seconds": round(seconds, 3),
+            "promptTokens": prompt_tokens,
+            "completionTokens": completion_tokens,
+            "cachedTokens": cached_tokens,
+            "costUsd": cost,
+            "error": error,
+        })
+
+# Function to start collecting the timing breakdown of a request
+def start_request_timings():
+    """
+    Starts a new timing breakdown for the current request or bundle.
+
+    Returns:
+        contextvars.Token: Token to pass to stop_request_timings().
+    """
+    return _request_timings.set({"stages": {}, "llm": []})
+
+# Function to stop collecting the timing breakdown of a request
+def stop_request_timings(token):
+    """Ends the breakdown started with start_request_timings() and returns it."""
+    timings = get_request_timings()
+    _request_timings.reset(token)
+    return timings
+
+# Function to get the timing breakdown of the current request
+def get_request_timings():
+    """
+    Returns the timing breakdown collected since start_request_timings().
+
+    Returns:
+        dict: {"stages": {stage: {"seconds", "count"}}, "llm": [per call details],
+        "llmTokens": {"in", "out", "cached"}, "llmCostUsd", "llmStages": {stage: {"calls", "seconds", "costUsd", "models"}}},
+        or None outside of a request.
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        return None
+    # LLM latency and cost per stage, to tune ModelRouting.json
+    llm_stages = {}
+    for call in timings["llm"]:
+        entry = llm_stages.setdefault(call["stage"], {"calls": 0, "seconds": 0.0, "costUsd": 0.0, "models": []})
+        entry["calls"] += 1
+        entry["seconds"] = round(entry["seconds"] + call["seconds"], 3)
+        entry["costUsd"] = round(entry["costUsd"] + (call["costUsd"] or 0), 6)
+        if call["model"] not in entry["models"]:
+            entry["models"].append(call["model"])
+    return {
+        "stages": {name: {"seconds": round(entry["seconds"], 3), "count": entry["count"]}
+                   for name, entry in timings["stages"].items()},
+        "llm": list(timings["llm"]),
+        "llmTokens": {
+            "in": sum(call["promptTokens"] or 0 for call in timings["llm"]),
+            "out": sum(call["completionTokens"] or 0 for call in timings["llm"]),
+            "cached": sum(call["cachedTokens"] or 0 for call in timings["llm"]),
+        },
+        "llmCostUsd": round(sum(call["costUsd"] or 0 for call in timings["llm"]), 6),
+        "llmStages": llm_stages,
+    }
+
+# Function to format a timing breakdown for the console
+def format_request_timings(timings):
+    """Returns the stages of a breakdown from get_request_timings() on one line, slowest first."""
+    stages = sorted(timings["stages"].items(), key=lambda item: -item[1]["seconds"])
+    text = ", ".join(f"{name} {entry['seconds']:.2f}s" for name, entry in stages)
+    if timings["llm"]:
+        text += (f"; {len(timings['llm'])} LLM calls, {timings['llmTokens']['in']} tokens in "
+                 f"({timings['llmTokens']['cached']} cached), {timings['llmTokens']['out']} out, "
+                 f"${timings['llmCostUsd']:.4f}")
+    return text
+
+# Function to export every metric in the Prometheus text format
+def render_metrics():
+    """Returns the metrics of this process in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
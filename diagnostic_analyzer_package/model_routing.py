@@ -0,0 +1,57 @@
+import logging
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+# Average characters per token of English text and Java stack traces for OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+# Function to estimate the number of tokens of a prompt
+def estimate_tokens(text):
+    """Returns an estimate of the tokens of text, from its length, without loading a tokenizer."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+# Function to pick the model of an LLM call
+def get_model_route(routing_config, stage, input_tokens):
+    """
+    Picks the model and reasoning effort of a call from the routing rules of its stage.
+
+    The rules of a stage are tried in order and the first one whose
+    maxInputTokens is not exceeded, or that has no maxInputTokens, is used.
+    Stages without rules use the default route.
+
+    Args:
+        routing_config (dict): The ModelRouting.json configuration.
+        stage (str): The timed stage making the call, such as "log_analysis".
+        input_tokens (int): Estimated tokens of the prompt.
+
+    Returns:
+        dict: {"model", "reasoningEffort"}, reasoningEffort is None for models without reasoning.
+    """
+    route = routing_config["defaultRoute"]
+    for rule in routing_config.get("stages", {}).get(stage, []):
+        if rule.get("maxInputTokens") is None or input_tokens <= rule["maxInputTokens"]:
+            route = rule
+            break
+    return {"model": route["model"], "reasoningEffort": route.get("reasoningEffort")}
+
+# Function to compute the cost of an LLM call
+def get_call_cost(routing_config, model, prompt_tokens, completion_tokens, cached_tokens=None, batch=False):
+    """
+    Computes the cost of a call in US dollars from the model prices of the routing configuration.
+
+    Prompt tokens served from the provider's prompt cache are charged at
+    cachedInputPerMillion, when the model has that price. Calls made through
+    the Batch API are charged batchPriceFactor of the price.
+
+    Returns:
+        float: The cost, or None if the model has no price or the token counts are unknown.
+    """
+    price = routing_config.get("modelPrices", {}).get(model)
+    if price is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    cached_tokens = min(cached_tokens or 0, prompt_tokens)
+    input_cost = ((prompt_tokens - cached_tokens) * price["inputPerMillion"]
+                  + cached_tokens * price.get("cachedInputPerMillion", price["inputPerMillion"]))
+    cost = (input_cost + completion_tokens * price["outputPerMillion"]) / 1_000_000
+    return cost * routing_config.get("batchPriceFactor", 1) if batch else cost
@@ -0,0 +1,67 @@
+import logging
+
+from .thread_analyzer import parse_thread_dumps, analyze_thread_dumps_and_extract_problems, get_comprehensive_thread_analysis
+from .log_analyzer import get_log_content, analyze_error_log, fetch_and_analyze_files
+from .log_ingest import get_dump_dates
+from .log_rules import scan_log_files
+from .final_analyzer import get_diagnostic_conclusion
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+# Function to run the full analysis without any user interaction
+def run_analysis(thread_groups_config, in_memory_files, customer_problem, analyze_classes=False):
+    """
+    Runs every analysis stage on a set of in-memory diagnostic files.
+
+    Args:
+        thread_groups_config (dict): Configuration for thread groups.
+        in_memory_files (dict): Dictionary of {filename: file_content} for in-memory files.
+        customer_problem (str): Description of the customer's problem.
+        analyze_classes (bool): Whether to fetch and analyze all suspected classes.
+
+    Returns:
+        dict: The results of every stage, including the final conclusion.
+    """
+    analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
+    # Counted before any LLM call, over all logs
+    log_signatures = scan_log_files(in_memory_files)
+    thread_analysis, problem_threads = analyze_thread_dumps_and_extract_problems(
+        thread_groups_config, in_memory_files, customer_problem, analyses
+    ) or ("Thread dump analysis failed.", [])
+
+    # Only the log records around the thread dumps
+    log_content = get_log_content(in_memory_files, get_dump_dates(analyses))
+
+    if problem_threads:
+        comprehensive_thread_analysis = get_comprehensive_thread_analysis(
+            thread_analysis, problem_threads, customer_problem, log_content, get_dump_dates(analyses), analyses
+        )
+    else:
+        comprehensive_thread_analysis = "Not applicable - no problematic threads identified."
+
+    suspected_classes = []
+    error_message = ""
+    if log_content:
+        log_analysis, suspected_classes, error_message = analyze_error_log(log_content, customer_problem, log_signatures)
+    else:
+        log_analysis = "No log content available for analysis."
+
+    class_analysis = None
+    if analyze_classes and suspected_classes:
+        class_analysis = fetch_and_analyze_files(suspected_classes, customer_problem, error_message, log_analysis)
+
+    final_report = get_diagnostic_conclusion(customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis)
+
+    return {
+        'customer_problem': customer_problem,
+        'problem_threads': problem_threads,
+        'suspected_classes': suspected_classes,
+        'error_message': error_message,
+        'log_signatures': log_signatures,
+        'thread_analysis': thread_analysis,
+        'comprehensive_thread_analysis': comprehensive_thread_analysis,
+        'log_analysis': log_analysis,
+        'class_analysis': class_analysis,
+        'final_report': final_report,
+    }
@@ -0,0 +1,127 @@
+import io
+import os
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+PROFILE_HEADER = "X-Diagnostic-Profile"
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "diagnostic_analyzer", "profiles")
+TRACEMALLOC_FRAMES = 8
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# tracemalloc is process wide, so only one analysis is profiled at a time
+_profile_lock = threading.Lock()
+
+# Function to get the directory profiles of web requests are saved to
+def get_profile_dir():
+    """Returns the profile directory, from DIAGNOSTIC_ANALYZER_PROFILE_DIR or the default."""
+    return os.getenv("DIAGNOSTIC_ANALYZER_PROFILE_DIR") or DEFAULT_PROFILE_DIR
+
+# Function to check whether a request asked to be profiled
+def is_profile_requested(value):
+    """Returns True for the header values that enable profiling (1, true, yes or on)."""
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+class AnalysisProfiler:
+    """
+    Profiles the stages of one analysis with cProfile and tracemalloc.
+
+    cProfile sees the calls of the thread that started the profiler only.
+    Allocations are compared with a snapshot taken at start, so memory held
+    before the analysis does not show. stop() writes <path_prefix>.pstats, for
+    pstats or snakeviz, and <path_prefix>.profile.txt with the slowest
+    functions and the largest allocations.
+    """
+    def __init__(self, path_prefix):
+        self.path_prefix = path_prefix
+        self.profiler = None
+        self.started_tracemalloc = False
+        self.start_snapshot = None
+        self.start_time = None
+        self.paths = None
+
+    def start(self):
+        """Starts profiling, returns False if another analysis is already being profiled."""
+        if not _profile_lock.acquire(blocking=False):
+            logger.warning(f"Another analysis is being profiled, {self.path_prefix} runs without the profiler")
+            return False
+
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        self.start_snapshot = tracemalloc.take_snapshot()
+        self.start_time = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+
+    def stop(self):
+        """
+        Stops profiling and writes the profile files.
+
+        Returns:
+            dict: {"pstats", "summary"} paths of the written files, or None if the profiler was not running.
+        """
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        seconds = time.perf_counter() - self.start_time
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+            directory = os.path.dirname(os.path.abspath(self.path_prefix))
+            os.makedirs(directory, exist_ok=True)
+            paths = {"pstats": f"{self.path_prefix}.pstats", "summary": f"{self.path_prefix}.profile.txt"}
+            self.profiler.dump_stats(paths["pstats"])
+            with open(paths["summary"], "w", encoding="utf-8") as summary_file:
+                summary_file.write(self._format_summary(snapshot, seconds, peak_bytes))
+            logger.info(f"Profile saved to {paths['pstats']} and {paths['summary']}")
+            self.paths = paths
+            return paths
+        finally:
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+            self.profiler = None
+            self.start_snapshot = None
+            _profile_lock.release()
+
+    def _format_summary(self, snapshot, seconds, peak_bytes):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        allocations = snapshot.filter_traces(filters).compare_to(self.start_snapshot.filter_traces(filters), "lineno")
+
+        functions = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=functions)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+
+        lines = [
+            f"Profiled time: {seconds:.2f} s",
+            f"Peak traced memory: {peak_bytes / (1024 * 1024):.1f} MB",
+            "",
+            f"Top {TOP_ALLOCATIONS} allocation sites by memory grown since the start:",
+        ]
+        for allocation in allocations[:TOP_ALLOCATIONS]:
+            frame = allocation.traceback[0]
+            lines.append(f"  {allocation.size / 1024:10.1f} KiB ({allocation.size_diff / 1024:+.1f}) "
+                         f"{allocation.count:8d} blocks  {frame.filename}:{frame.lineno}")
+        lines += ["", f"Top {TOP_FUNCTIONS} functions by own time:", functions.getvalue()]
+        return "\n".join(lines)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
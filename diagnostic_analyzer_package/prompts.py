@@ -1,60 +1,48 @@
 import json
 
-def get_initial_thread_analysis_prompt(customer_problem, combined_content, thread_groups_config):
+# Every prompt starts with text that is the same for every analysis (instructions,
+# response format and configuration) and ends with the content of the analysis,
+# so the provider can serve the prefix from its prompt cache on repeated calls.
+# Nothing that changes between analyses may be added to the *_INSTRUCTIONS.
+# Providers only cache prefixes of 1024 tokens or more, which no stage reaches yet,
+# see benchmarks/bench_prompt_prefix.py.
+
+PDF_FORMAT_NOTE = """
+    ## Important Note
+    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
+    """
 
-    initial_prompt = f"""
+INITIAL_THREAD_ANALYSIS_INSTRUCTIONS = """
     # Thread Dump Analysis Request
-    
-    ## Customer Problem
-    {customer_problem}
-    
-    ## Thread Dumps
-    The following contains thread dumps taken when the issue occurred:
-    
-    {combined_content}
 
-    ## Thread Group Configuration
-   The following dictionary contains the thread group configurations of the micro integrator:
-   {thread_groups_config}
-   you can use this to get an idea about how many threads can be in each thread group without causing an issue.
-    
+    You will be given thread dumps of a WSO2 Micro Integrator taken when a customer issue occurred, after the thread group configuration and the customer problem.
+
     ## Analysis Request
     1. Analyze these thread dumps to identify potential issues
     2. Look for patterns across the dumps such as:
        - Threads in BLOCKED state
        - Deadlocks or potential deadlocks
-       - High CPU threads
+       - High CPU threads (topCpuThreads, when present, lists the threads that used the most CPU time between the dumps, measured from the thread headers)
        - Threads waiting for resources
        - Any unusual thread states
     3. Provide a summary of your findings
-    4. At the end of your report, list the specific thread names that require further detailed analysis in this format:
-       THREADS_FOR_ANALYSIS: ["thread_name_1", "thread_name_2", ...]
-       limit the number of threads to 5.
+    4. List the specific thread names that require further detailed analysis, limit the number of threads to 5.
     5. If there are no threads with potential issues, keep the list empty.
-       THREADS_FOR_ANALYSIS: []
+
+    ## Response Format
+    Respond with a JSON object only:
+    - "analysis": your findings and summary (steps 1 to 3)
+    - "threads_for_analysis": the thread names of step 4, exactly as they appear in the thread dumps, for example ["thread_name_1", "thread_name_2"]
 
     ## Important Note
-    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
+    Note that the analysis will be directly written into a pdf report, so please ensure to fromat it accordingly. **Do not leave indentation spaces in the analysis**. Start all sentences at the begining of a newline.
     """
-    return initial_prompt
 
-def get_comprehensive_thread_analysis_prompt(customer_problem, initial_response, log_content, thread_stack_traces):
-    # Create a comprehensive analysis prompt with thread stack traces
-    comprehensive_prompt = f"""
+COMPREHENSIVE_THREAD_ANALYSIS_INSTRUCTIONS = """
     # Comprehensive Thread Analysis Request
-    
-    ## Customer Problem
-    {customer_problem}
-    
-    ## Initial Analysis Summary
-    {initial_response}
-    
-    ## System Logs
-    {log_content if log_content else "No log content available."}
-    
-    ## Problematic Threads and Their Stack Traces
-    {json.dumps(thread_stack_traces, indent=2)}
-    
+
+    You will be given the customer problem, an initial analysis of the thread dumps, the system logs and the stack traces of the problematic threads.
+
     ## Analysis Request
     1. For each problematic thread:
         - Analyze its stack trace in detail
@@ -63,25 +51,13 @@ def get_comprehensive_thread_analysis_prompt(customer_problem, initial_response,
     2. Analyze how these issues relate to the system logs
     3. Provide an overall diagnosis of the root cause
     4. Suggest specific solutions to address the identified issues
+    """ + PDF_FORMAT_NOTE
 
-    ## Important Note
-    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
-    """
-    return comprehensive_prompt
+LOG_ANALYSIS_INSTRUCTIONS = """
+    # You are a software engineer at wso2 and you are analyzing error logs related to a customer problem to identify potential issues.
+
+    You will be given the customer problem, the system logs around the time the issue occurred and the counts of known failure signatures.
 
-def get_log_analysis_prompt(customer_problem, log_content, sus_classes):
-    # Create a prompt for log analysis
-    log_analysis_prompt = f"""
-    # You are a software engineer at wso2 and you are analyzing error logs related to the following customer problem to identify potential issues.
-    
-    ## Customer Problem
-    {customer_problem}
-    
-    ## System Logs
-    The following contains system logs around the time the issue occurred:
-    
-    {log_content}
-    
     ## Analysis Request
     1. Analyze these logs to identify patterns, errors, and warnings
     2. Look for:
@@ -90,37 +66,25 @@ def get_log_analysis_prompt(customer_problem, log_content, sus_classes):
        - Suspicious timing of events
        - Component failures
     3. Provide a summary of your findings
-    4. Decide what classes you would analyze further to get a better idea about the issue, give a list of dictionaries of suspected Java classes with package names and line numbers that might be involved in the issues (limit to top 5 classes) example :-
-       SUSPECTED_CLASSES: {sus_classes}. 
+    4. Decide what classes you would analyze further to get a better idea about the issue, give the suspected Java classes with package names and line numbers that might be involved in the issues (limit to top 5 classes).
        **If you think there are no classes to be suspected, then provide an empty list.**
-       ensure that the SUSPECTED_CLASSES strictly obey the format curly bracket dictionaries inside one square bracket pair.
-    5. Also given that another llm call will do a futher analysis with the java classes, provide the error message to be given in that llm call. It should be in the format:
-         ERROR_MESSAGE: "error message"
+    5. Also given that another llm call will do a futher analysis with the java classes, provide the error message to be given in that llm call.
+
+    ## Response Format
+    Respond with a JSON object only:
+    - "analysis": your findings and summary (steps 1 to 3)
+    - "suspected_classes": the classes of step 4, for example {sus_classes}
+    - "error_message": the error message of step 5
 
     ## Important Note
-    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
+    Note that the analysis will be directly written into a pdf report, so please ensure to fromat it accordingly. **Do not leave indentation spaces in the analysis**. Start all sentences at the begining of a newline.
     """
-    return log_analysis_prompt
 
-def get_class_analysis_prompt(customer_problem, class_files_content, error_message_text, log_analysis):
-    # Create a prompt for class file analysis
-    class_analysis_prompt = f"""
-    # You are a software engineer at wso2 and you are analyzing Java class files related to the following customer problem to identify potential issues.
-    
-    ## Customer Problem
-    {customer_problem}
+CLASS_ANALYSIS_INSTRUCTIONS = """
+    # You are a software engineer at wso2 and you are analyzing Java class files related to a customer problem to identify potential issues.
 
-    ## Initial Log Analysis
-    {log_analysis}
-    
-    ## Identified issue in the logs
-    {error_message_text}
+    You will be given the customer problem, the initial log analysis, the issue identified in the logs and the contents of the suspected class files (please note that the line number of the issue can be slightly different from the one given).
 
-    ## Suspected Class Files
-    The following are the contents of suspected class files related to the issue: (please note that the line number of the issue can be slightly different from the one given)
-    
-    {json.dumps(class_files_content, indent=2)}
-    
     ## Analysis Request
     1. Analyze these class files to identify potential issues related to the customer problem and initial log analysis. If you think there is no need to analyze the class files, then provide a message saying that.
     2. Look for:
@@ -133,33 +97,129 @@ def get_class_analysis_prompt(customer_problem, class_files_content, error_messa
     4. Suggest specific improvements or fixes
 
     **Kepp the analysis to a precise and concise format.**
+    """ + PDF_FORMAT_NOTE
 
-    ## Important Note
-    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
+DIAGNOSTIC_CONCLUSION_INSTRUCTIONS = """
+    Based on the information that follows (the customer problem, the log file analysis, the thread dump analysis and the class analysis), provide a comprehensive diagnostic conclusion and actionable suggestions.
+
+    Please provide:
+    1. A clear diagnosis of the root cause. Be specific and concise.
+    2. Specific actionable steps to resolve the issue. If applicable, specially mention if we can try increasing any thread pool sizes.
+    """ + PDF_FORMAT_NOTE
+
+STRUCTURED_OUTPUT_REPAIR_INSTRUCTIONS = """
+    # Structured Output Repair Request
+
+    The response at the end was supposed to be a JSON object following the "{name}" JSON schema below, but it is not valid.
+    Return the same content as a single JSON object that follows the schema. Keep the wording of the analysis, do not analyze again and do not add anything outside the JSON object.
+
+    ## JSON Schema
+    {schema}
+    """
+
+def format_thread_groups_config(thread_groups_config):
+    # Compact and key-sorted, so the same configuration always gives the same prompt prefix
+    return json.dumps(thread_groups_config, sort_keys=True, separators=(",", ":"))
+
+def get_initial_thread_analysis_prompt(customer_problem, combined_content, thread_groups_config):
+
+    initial_prompt = f"""{INITIAL_THREAD_ANALYSIS_INSTRUCTIONS}
+    ## Thread Group Configuration
+    The following dictionary contains the thread group configurations of the micro integrator:
+    {format_thread_groups_config(thread_groups_config)}
+    you can use this to get an idea about how many threads can be in each thread group without causing an issue.
+
+    ## Customer Problem
+    {customer_problem}
+
+    ## Thread Dumps
+    The following contains thread dumps taken when the issue occurred:
+
+    {combined_content}
+    """
+    return initial_prompt
+
+def get_comprehensive_thread_analysis_prompt(customer_problem, initial_response, log_content, thread_stack_traces):
+    # Create a comprehensive analysis prompt with thread stack traces
+    comprehensive_prompt = f"""{COMPREHENSIVE_THREAD_ANALYSIS_INSTRUCTIONS}
+    ## Customer Problem
+    {customer_problem}
+
+    ## Initial Analysis Summary
+    {initial_response}
+
+    ## System Logs
+    {log_content if log_content else "No log content available."}
+
+    ## Problematic Threads and Their Stack Traces
+    {json.dumps(thread_stack_traces, indent=2)}
+    """
+    return comprehensive_prompt
+
+def get_log_analysis_prompt(customer_problem, log_content, sus_classes, log_signatures=""):
+    # Create a prompt for log analysis, sus_classes is a fixed example so the instructions stay the same
+    log_analysis_prompt = f"""{LOG_ANALYSIS_INSTRUCTIONS.format(sus_classes=json.dumps(sus_classes))}
+    ## Customer Problem
+    {customer_problem}
+
+    ## Known Failure Signatures
+    Number of lines matching known MI failure signatures across all logs, not only the excerpt below:
+
+    {log_signatures if log_signatures else "No known failure signatures found."}
+
+    ## System Logs
+    The following contains system logs around the time the issue occurred:
+
+    {log_content}
+    """
+    return log_analysis_prompt
+
+def get_class_analysis_prompt(customer_problem, class_files_content, error_message_text, log_analysis):
+    # Create a prompt for class file analysis
+    class_analysis_prompt = f"""{CLASS_ANALYSIS_INSTRUCTIONS}
+    ## Customer Problem
+    {customer_problem}
+
+    ## Initial Log Analysis
+    {log_analysis}
+
+    ## Identified issue in the logs
+    {error_message_text}
+
+    ## Suspected Class Files
+    The following are the contents of suspected class files related to the issue:
+
+    {json.dumps(class_files_content, indent=2)}
     """
     return class_analysis_prompt
 
 def get_diagnostic_conclusion_prompt(customer_problem, log_analysis, comprehensive_thread_analysis, class_analysis):
-    diagnostic_conclusion_prompt = f"""
-    Based on the following information, provide a comprehensive diagnostic conclusion and actionable suggestions:
-    
+    diagnostic_conclusion_prompt = f"""{DIAGNOSTIC_CONCLUSION_INSTRUCTIONS}
     CUSTOMER PROBLEM:
     {customer_problem}
-    
+
     LOG FILE ANALYSIS:
     {log_analysis}
-    
+
     THREAD DUMP ANALYSIS:
     {comprehensive_thread_analysis}
-    
+
     CLASS ANALYSIS:
     {class_analysis}
-    
-    Please provide:
-    1. A clear diagnosis of the root cause. Be specific and concise.
-    2. Specific actionable steps to resolve the issue. If applicable, specially mention if we can try increasing any thread pool sizes.
-
-     ## Important Note
-    Note that your response will be directly written into a pdf report, so please ensure to fromat your response accordingly. **Do not leave indentation spaces in the response**. Start all sentences at the begining of a newline.
     """
     return diagnostic_conclusion_prompt
+
+def get_structured_output_repair_prompt(response_text, errors, response_format):
+    # Asks to fix a response that is not valid JSON of the requested format, without redoing the analysis
+    problems = "\n".join(f"- {error}" for error in errors[:20])
+    instructions = STRUCTURED_OUTPUT_REPAIR_INSTRUCTIONS.format(
+        name=response_format['name'], schema=json.dumps(response_format['schema'], indent=2)
+    )
+    repair_prompt = f"""{instructions}
+    ## Problems
+    {problems}
+
+    ## Response To Fix
+    {response_text}
+    """
+    return repair_prompt
@@ -1,118 +1,389 @@
+import os
+import re
+import sys
+import json
+import html
 import time
+import hashlib
+import subprocess
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
 import logging
 
 from .utils import draw_wrapped_text
+from .dump_cache import evict_cache_entries, write_cache_file
+from .metrics import timed_stage
 
 # Configure logger
 logger = logging.getLogger("diagnostic_analyzer")
 
-def write_final_report(customer_problem, log_analysis, comprehensive_analysis, class_analysis=None, final_report=None):
+REPORT_CACHE_SUFFIX = ".pdf"
+DEFAULT_REPORT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "diagnostic_analyzer", "reports")
+DEFAULT_REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+REPORT_CHUNK_SIZE = 64 * 1024
+# Cached reports with more section text than this are rendered in a child process
+DEFAULT_REPORT_SUBPROCESS_MIN_BYTES = 2 * 1024 * 1024
+
+SECTION_PROSE = "prose"
+SECTION_ANALYSIS = "analysis"
+SECTION_PREFORMATTED = "preformatted"
+
+class Report:
+    """
+    Format independent content of a report: a title, ordered sections and metadata.
+
+    Sections are rendered by the exporters registered in REPORT_EXPORTERS. Their
+    style tells exporters how to lay the text out: prose is running text,
+    analysis is LLM output (already Markdown-like) and preformatted text keeps
+    its indentation, such as stack traces and tables.
+    """
+    def __init__(self, title, metadata=None, generated_on=None):
+        self.title = title
+        self.metadata = metadata or {}
+        self.generated_on = generated_on or time.strftime('%Y-%m-%d %H:%M:%S')
+        self.sections = []
+
+    def add_section(self, key, heading, text, style=SECTION_ANALYSIS):
+        """Appends a section, skipping sections without text."""
+        if text:
+            self.sections.append({"key": key, "heading": heading, "text": str(text), "style": style})
+        return self
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "generatedOn": self.generated_on,
+            "metadata": self.metadata,
+            "sections": self.sections,
+        }
+
+# Function to build the report model of a final (LLM) analysis
+def get_final_report_model(customer_problem, log_analysis, comprehensive_analysis, class_analysis=None, final_report=None,
+                           metadata=None):
+    """Returns the Report with the same sections, in the same order, as the final PDF report."""
+    report = Report("Diagnostic Analysis Report", metadata)
+    report.add_section("customerProblem", "Customer Problem", customer_problem, SECTION_PROSE)
+    report.add_section("logAnalysis", "Log Analysis", log_analysis)
+    report.add_section("comprehensiveThreadAnalysis", "Comprehensive Thread Analysis", comprehensive_analysis)
+    report.add_section("classAnalysis", "Class Files Analysis", class_analysis)
+    report.add_section("conclusions", "Conclusions and Recommendations", final_report)
+    return report
+
+# Function to build the report model of a local (parse-only) analysis
+def get_local_report_model(local_report):
+    """Returns the Report of local_report.build_local_report() output, keeping the structured data as metadata."""
+    from .local_report import format_local_report
+
+    report = Report("Diagnostic Analysis Report (Local)", local_report)
+    report.add_section("customerProblem", "Customer Problem", local_report.get("customerProblem"), SECTION_PROSE)
+    for heading, text in format_local_report(local_report):
+        key = re.sub(r"[^a-z0-9]+", "-", heading.lower()).strip("-")
+        report.add_section(key, heading, text, SECTION_PREFORMATTED)
+    return report
+
+REPORT_EXPORTERS = {}
+REPORT_FORMAT_ALIASES = {"md": "markdown", "htm": "html"}
+
+# Function to register an exporter for a report format
+def register_report_exporter(report_format, mimetype, extension):
+    """
+    Decorator registering a function that renders a Report in the given format.
+
+    The function takes the Report and yields the output in chunks (str or
+    bytes), so text formats can be streamed while they are rendered.
+    """
+    def decorator(render):
+        REPORT_EXPORTERS[report_format] = {"mimetype": mimetype, "extension": extension, "render": render}
+        return render
+    return decorator
+
+# Function to resolve a report format name, extension or alias
+def get_report_format(report_format):
+    """Returns the registered format name for a name such as "md", or None if there is no such exporter."""
+    report_format = (report_format or "").lower().lstrip(".")
+    report_format = REPORT_FORMAT_ALIASES.get(report_format, report_format)
+    return report_format if report_format in REPORT_EXPORTERS else None
+
+# Function to stream a report in the given format
+def iter_report(report, report_format):
+    """Yields a Report rendered in the given format as bytes chunks."""
+    for chunk in REPORT_EXPORTERS[get_report_format(report_format)]["render"](report):
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+# Function to export a report in the given format
+def export_report(report, report_format, output=None):
     """
-    Writes the final consolidated report as a PDF and returns it as a BytesIO object (in-memory).
+    Renders a Report in the given format.
+
+    Args:
+        report (Report): The report to render.
+        report_format (str): A registered format, such as "pdf", "json", "markdown" or "html".
+        output: A file path or writable binary file object. If None, a BytesIO is used.
+
+    Returns:
+        The output, or the BytesIO rewound to its start.
+    """
+    if isinstance(output, str):
+        with open(output, 'wb') as file:
+            for chunk in iter_report(report, report_format):
+                file.write(chunk)
+        return output
+
+    buffer = BytesIO() if output is None else output
+    for chunk in iter_report(report, report_format):
+        buffer.write(chunk)
+    if output is None:
+        buffer.seek(0)
+    return buffer
+
+# Function to render a report as a PDF
+@timed_stage("pdf_render")
+def render_report_pdf(report, output=None):
+    """
+    Renders a Report as a PDF.
+
+    By default the PDF is returned as a BytesIO object (in-memory). When output
+    is a file path or a writable file object the PDF is written there instead
+    and output is returned.
     """
-    logger.info("Generating final PDF report (in-memory)...")
-    
-    # Use an in-memory bytes buffer
-    buffer = BytesIO()
+    # Imported on first use, reportlab is only needed to render PDFs
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import inch
+
+    logger.info(f"Generating PDF report: {report.title}")
+
+    # Use an in-memory bytes buffer unless an output is given
+    buffer = BytesIO() if output is None else output
     c = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
-    
+
     # Set margins
     left_margin = 1 * inch
     right_margin = 1 * inch
     top_margin = 1 * inch
     bottom_margin = 1 * inch
-    
+
     # Calculate text width
     text_width = width - left_margin - right_margin
-    
+
     # Set up fonts
     title_font = "Helvetica-Bold"
     heading_font = "Helvetica-Bold"
     normal_font = "Helvetica"
     mono_font = "Courier"
-    
+
     # Starting y position (from top of page)
     y = height - top_margin
-    
+
     # Title
     c.setFont(title_font, 24)
-    title = "Diagnostic Analysis Report"
-    title_width = c.stringWidth(title, title_font, 24)
-    c.drawString((width - title_width) / 2, y, title)
+    title_width = c.stringWidth(report.title, title_font, 24)
+    c.drawString((width - title_width) / 2, y, report.title)
     y -= 40
-    
-    # Customer Problem
-    c.setFont(heading_font, 18)
-    c.drawString(left_margin, y, "Customer Problem")
-    y -= 30
-    y = draw_wrapped_text(c, customer_problem, left_margin, y, text_width, 
-                         bottom_margin, height, top_margin)
-    y -= 20
-
-    # Log Analysis
-    c.setFont(heading_font, 14)
-    c.drawString(left_margin, y, "Log Analysis")
-    y -= 20
-    y = draw_wrapped_text(c, log_analysis, left_margin, y, text_width,
-                         bottom_margin, height, top_margin, 
-                         font=mono_font, font_size=9, line_height=11)
-    
-    # Check if we need a new page
-    if y < height / 2:
-        c.showPage()
-        y = height - top_margin
-    
-    # Comprehensive Thread Analysis
-    c.setFont(heading_font, 14)
-    c.drawString(left_margin, y, "Comprehensive Thread Analysis")
-    y -= 20
-    y = draw_wrapped_text(c, comprehensive_analysis, left_margin, y, text_width,
-                         bottom_margin, height, top_margin, 
-                         font=mono_font, font_size=9, line_height=11)
-    y -= 20
-    
-    # Class Analysis if available
-    if class_analysis:
-        # Check if we need a new page
-        if y < height / 2:
-            c.showPage()
-            y = height - top_margin
-        
-        c.setFont(heading_font, 14)
-        c.drawString(left_margin, y, "Class Files Analysis")
-        y -= 20
-        y = draw_wrapped_text(c, class_analysis, left_margin, y, text_width,
-                             bottom_margin, height, top_margin, 
-                             font=mono_font, font_size=9, line_height=11)
+
+    for section in report.sections:
+        if section["style"] == SECTION_PROSE:
+            c.setFont(heading_font, 18)
+            c.drawString(left_margin, y, section["heading"])
+            y -= 30
+            y = draw_wrapped_text(c, section["text"], left_margin, y, text_width,
+                                  bottom_margin, height, top_margin)
+        else:
+            # Start long sections on a new page rather than low on the current one
+            if y < height / 3:
+                c.showPage()
+                y = height - top_margin
+
+            c.setFont(heading_font, 14)
+            c.drawString(left_margin, y, section["heading"])
+            y -= 20
+            y = draw_wrapped_text(c, section["text"], left_margin, y, text_width,
+                                  bottom_margin, height, top_margin,
+                                  font=mono_font, font_size=9, line_height=11)
         y -= 20
-    
-    # Conclusions
-    # Check if we need a new page
-    if y < height / 3:
-        c.showPage()
-        y = height - top_margin
-    
-    c.setFont(heading_font, 14)
-    c.drawString(left_margin, y, "Conclusions and Recommendations")
-    y -= 20
-    y = draw_wrapped_text(c, final_report, left_margin, y, text_width,
-                             bottom_margin, height, top_margin, 
-                             font=mono_font, font_size=9, line_height=11)
-    y -= 20
-    
+
     # Generated timestamp
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
     c.setFont(normal_font, 10)
-    c.drawString(left_margin, bottom_margin / 2, f"Generated on: {timestamp}")
-    
+    c.drawString(left_margin, bottom_margin / 2, f"Generated on: {report.generated_on}")
+
     # Finalize the PDF and rewind the buffer
     c.save()
-    buffer.seek(0)  # Move to the beginning so send_file works properly
+    if hasattr(buffer, 'seek'):
+        buffer.seek(0)  # Move to the beginning so send_file works properly
 
-    logger.info("Final PDF report generated in memory.")
+    logger.info("PDF report generated.")
     return buffer
+
+@register_report_exporter("pdf", "application/pdf", ".pdf")
+def iter_report_pdf(report):
+    buffer = render_report_pdf(report)
+    while True:
+        chunk = buffer.read(REPORT_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+@register_report_exporter("json", "application/json", ".report.json")
+def iter_report_json(report):
+    # Written section by section so large reports stream without building the whole document
+    yield "{\n"
+    yield f'  "title": {json.dumps(report.title)},\n'
+    yield f'  "generatedOn": {json.dumps(report.generated_on)},\n'
+    yield f'  "metadata": {json.dumps(report.metadata, default=str)},\n'
+    yield '  "sections": ['
+    for i, section in enumerate(report.sections):
+        yield ("," if i else "") + "\n    " + json.dumps(section)
+    yield "\n  ]\n}\n"
+
+@register_report_exporter("markdown", "text/markdown", ".md")
+def iter_report_markdown(report):
+    yield f"# {report.title}\n"
+    for section in report.sections:
+        yield f"\n## {section['heading']}\n\n"
+        if section["style"] == SECTION_PREFORMATTED:
+            # A fence longer than any backtick run inside the text
+            fence = "`" * max(3, max((len(run) for run in section["text"].split("\n") if set(run) == {"`"}), default=0) + 1)
+            yield f"{fence}\n{section['text']}\n{fence}\n"
+        else:
+            yield section["text"].rstrip("\n") + "\n"
+    yield f"\n---\n\n_Generated on: {report.generated_on}_\n"
+
+@register_report_exporter("html", "text/html", ".html")
+def iter_report_html(report):
+    title = html.escape(report.title)
+    yield ("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+           f"<title>{title}</title>"
+           "<style>body{font-family:Helvetica,Arial,sans-serif;max-width:60em;margin:2em auto}"
+           "p{white-space:pre-wrap}"
+           "pre{white-space:pre-wrap;font-family:Courier,monospace;font-size:0.9em}</style></head>\n"
+           f"<body>\n<h1>{title}</h1>\n")
+    for section in report.sections:
+        tag = "p" if section["style"] == SECTION_PROSE else "pre"
+        yield (f"<h2 id=\"{html.escape(section['key'])}\">{html.escape(section['heading'])}</h2>\n"
+               f"<{tag}>{html.escape(section['text'])}</{tag}>\n")
+    yield f"<p><small>Generated on: {html.escape(report.generated_on)}</small></p>\n</body></html>\n"
+
+def write_final_report(customer_problem, log_analysis, comprehensive_analysis, class_analysis=None, final_report=None,
+                       output=None):
+    """
+    Writes the final consolidated report as a PDF.
+
+    By default the PDF is returned as a BytesIO object (in-memory). When output
+    is a file path or a writable file object the PDF is written there instead
+    and output is returned.
+    """
+    report = get_final_report_model(customer_problem, log_analysis, comprehensive_analysis, class_analysis, final_report)
+    return render_report_pdf(report, output)
+
+# Function to render the final report in a child process
+def write_final_report_in_subprocess(sections, output):
+    """
+    Writes the final report PDF to output from a child Python process.
+
+    The canvas keeps every page until the PDF is saved, several times the
+    size of the section text, and a long-lived worker keeps that memory
+    once it has grown. In the child it is returned to the system when the
+    child exits, so the caller only holds the section text.
+
+    Args:
+        sections (tuple): The arguments of write_final_report(), all strings or None.
+        output (file): A binary file opened for writing, with a file descriptor.
+
+    Raises:
+        RuntimeError: If the child process failed.
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.getenv("PYTHONPATH")])))
+    output.flush()
+    with timed_stage("pdf_render"):
+        result = subprocess.run([sys.executable, "-m", __name__], input=json.dumps(sections).encode("utf-8"),
+                                stdout=output, stderr=subprocess.PIPE, env=env)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace").strip().splitlines()
+        raise RuntimeError(f"Rendering the PDF report in a child process failed: {error[-1] if error else result.returncode}")
+
+# Function to get the section size from which cached reports are rendered in a child process
+def get_report_subprocess_min_bytes():
+    """Returns DIAGNOSTIC_ANALYZER_REPORT_SUBPROCESS_MIN_BYTES, or the default when unset or invalid."""
+    try:
+        return int(os.getenv("DIAGNOSTIC_ANALYZER_REPORT_SUBPROCESS_MIN_BYTES", DEFAULT_REPORT_SUBPROCESS_MIN_BYTES))
+    except ValueError:
+        return DEFAULT_REPORT_SUBPROCESS_MIN_BYTES
+
+# Function to compute the cache key of a rendered report
+def get_report_cache_key(*sections):
+    """Returns the content hash identifying a report rendered from the given sections."""
+    digest = hashlib.sha256()
+    for section in sections:
+        digest.update(str(section).encode('utf-8', errors='surrogatepass'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# Function to render the final report to the on-disk report cache
+def open_cached_final_report(customer_problem, log_analysis, comprehensive_analysis, class_analysis=None, final_report=None):
+    """
+    Returns the final report PDF opened for reading, rendering it only if the cache does not have it yet.
+
+    Reports are keyed by the content hash of their sections and rendered
+    straight to disk, so repeat downloads are streamed from the file instead
+    of being rendered again. Reports with at least
+    DIAGNOSTIC_ANALYZER_REPORT_SUBPROCESS_MIN_BYTES of section text are
+    rendered in a child process, see write_final_report_in_subprocess(). The file is opened before it can be evicted, so
+    the caller can stream it to the end even if the entry is evicted meanwhile.
+
+    Returns:
+        file: The PDF, opened in binary mode; the caller closes it.
+    """
+    cache_dir = os.getenv("DIAGNOSTIC_ANALYZER_REPORT_CACHE_DIR", DEFAULT_REPORT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = get_report_cache_key(customer_problem, log_analysis, comprehensive_analysis, class_analysis, final_report)
+    path = os.path.join(cache_dir, key + REPORT_CACHE_SUFFIX)
+
+    try:
+        report_file = open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            # Touch the entry so eviction treats it as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        logger.info(f"Serving final PDF report from cache: {path}")
+        return report_file
+
+    sections = (customer_problem, log_analysis, comprehensive_analysis, class_analysis, final_report)
+    if sum(len(str(section)) for section in sections if section) >= get_report_subprocess_min_bytes():
+        # Memory-bounded mode for very large reports
+        render = lambda temp_file: write_final_report_in_subprocess(sections, temp_file)
+    else:
+        render = lambda temp_file: write_final_report(*sections, output=temp_file)
+    report_file = write_cache_file(path, render, reopen=True)
+
+    try:
+        max_bytes = int(os.getenv("DIAGNOSTIC_ANALYZER_REPORT_CACHE_MAX_BYTES", DEFAULT_REPORT_CACHE_MAX_BYTES))
+    except ValueError:
+        max_bytes = DEFAULT_REPORT_CACHE_MAX_BYTES
+    evict_cache_entries(cache_dir, max_bytes, REPORT_CACHE_SUFFIX, keep=(path,))
+    return report_file
+
+# Function to stream an open file in chunks
+def iter_file_chunks(file, chunk_size=REPORT_CHUNK_SIZE):
+    """Yields the content of an open binary file in chunks, for streaming HTTP responses, and closes it."""
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def write_local_report(report):
+    """
+    Writes a report from local_report.build_local_report() as a PDF and returns it as a BytesIO object (in-memory).
+    """
+    return render_report_pdf(get_local_report_model(report))
+
+if __name__ == "__main__":
+    # Child process of write_final_report_in_subprocess(): sections as JSON on stdin, the PDF on stdout
+    write_final_report(*json.load(sys.stdin), output=sys.stdout.buffer)
+    sys.stdout.buffer.flush()
@@ -0,0 +1,106 @@
+import json
+import hashlib
+import logging
+import threading
+
+from .metrics import timed_stage, COALESCED_CALLS
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+class _Call:
+    """A call in flight, with the result or exception its waiters receive."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time in this process.
+
+    A call made while an identical one (same key) is running does not run
+    its function: it waits for the running call and shares its result, or
+    its exception. Results are not kept once the call has finished, so a
+    request arriving after that starts a new call.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Calls function(*args, **kwargs), or waits for the call already running under key.
+
+        Args:
+            key (str): Identifies calls that give the same result.
+            function (callable): Computes the result.
+
+        Returns:
+            tuple: (result, shared), shared is True when the result came from another caller's call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            COALESCED_CALLS.inc(flight=self.name)
+            logger.info(f"Waiting for the identical {self.name} already in progress ({key[:12]})")
+            with timed_stage(f"{self.name}_wait"):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.info(f"Shared the {self.name} result with {call.waiters} identical requests ({key[:12]})")
+        return call.result, False
+
+    def in_flight(self):
+        """Returns the number of calls currently running."""
+        with self._lock:
+            return len(self._calls)
+
+# Function to compute the content key of an analysis
+def get_analysis_key(in_memory_files, customer_problem, *configs):
+    """
+    Computes a hash identifying the result of analyzing a set of files.
+
+    File names and contents, the customer problem and every configuration
+    that changes the result are part of the key, the order of the uploaded
+    files is not.
+
+    Args:
+        in_memory_files (dict): Dictionary of {filename: BytesIO} of the uploaded files.
+        customer_problem (str): Description of the customer's problem.
+        *configs (dict): Configurations used by the analysis, such as ThreadGroups.json.
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    digest = hashlib.sha256()
+    for config in configs:
+        digest.update(json.dumps(config, sort_keys=True).encode())
+        digest.update(b"\0")
+    digest.update(customer_problem.encode("utf-8", errors="surrogatepass"))
+    for name in sorted(in_memory_files):
+        content = in_memory_files[name].getbuffer()
+        digest.update(f"\0{len(content)}\0".encode() + name.encode("utf-8", errors="surrogatepass") + b"\0")
+        digest.update(content)
+        content.release()
+    return digest.hexdigest()
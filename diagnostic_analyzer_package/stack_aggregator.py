@@ -0,0 +1,157 @@
+import logging
+from collections import Counter
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+ROOT_FRAME = "all"
+
+class CallTreeNode:
+    """A frame of the merged call tree, weighted by the number of threads passing through it."""
+    __slots__ = ("frame", "total", "self_count", "by_status", "children")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.total = 0
+        self.self_count = 0
+        self.by_status = {}
+        self.children = {}
+
+    def add(self, stack, status, count):
+        """Adds count threads with the given root-first stack and status below this node."""
+        node = self
+        node.total += count
+        node.by_status[status] = node.by_status.get(status, 0) + count
+        for frame in stack:
+            child = node.children.get(frame)
+            if child is None:
+                child = node.children[frame] = CallTreeNode(frame)
+            node = child
+            node.total += count
+            node.by_status[status] = node.by_status.get(status, 0) + count
+        node.self_count += count
+
+    def to_dict(self, min_count=1, max_depth=None):
+        """
+        Returns the subtree as nested dictionaries, heaviest children first.
+
+        Args:
+            min_count (int): Children seen fewer times than this are left out.
+            max_depth (int, optional): Levels of children included below this node, all if None.
+        """
+        children = []
+        if max_depth is None or max_depth > 0:
+            children = sorted((child for child in self.children.values() if child.total >= min_count),
+                              key=lambda child: (-child.total, child.frame))
+        child_depth = None if max_depth is None else max_depth - 1
+        return {
+            "frame": self.frame,
+            "total": self.total,
+            "self": self.self_count,
+            "byStatus": self.by_status,
+            "children": [child.to_dict(min_count, child_depth) for child in children],
+        }
+
+# Function to count identical stacks across all threads of all dumps
+def aggregate_stacks(analyses):
+    """
+    Counts the threads of every dump by (status, stack), including grouped virtual threads.
+
+    Identical stacks are merged before anything else is done with them, so
+    the cost of building a call tree depends on the number of distinct stacks
+    rather than on the number of threads.
+
+    Args:
+        analyses (list): Analysis objects of the thread dumps.
+
+    Returns:
+        Counter: {(status, frames): thread_count} with frames in jstack (leaf first) order.
+    """
+    stack_counts = Counter()
+    for analysis in analyses:
+        for status, threads in analysis.threadsByStatus.items():
+            stack_counts.update((status, tuple(thread.frames)) for thread in threads)
+        # Virtual threads that were only counted while parsing are already grouped by stack
+        stack_counts.update(analysis.virtualThreadGroups)
+    return stack_counts
+
+# Function to build the merged call tree of the aggregated stacks
+def build_call_tree(stack_counts):
+    """
+    Builds a flame graph call tree from aggregate_stacks() output.
+
+    Returns:
+        CallTreeNode: The root node, whose children are the outermost frames.
+    """
+    root = CallTreeNode(ROOT_FRAME)
+    for (status, frames), count in stack_counts.items():
+        root.add(reversed(frames), status, count)
+    return root
+
+# Function to export the aggregated stacks in collapsed-stack format
+def to_collapsed_stacks(stack_counts, split_by_status=True):
+    """
+    Exports aggregated stacks in the collapsed format read by flamegraph.pl and speedscope.
+
+    Each line is the root-first list of frames joined by ';' followed by a space
+    and the number of threads. When split_by_status is set, the thread status is
+    added as the outermost frame so each status gets its own tower.
+
+    Returns:
+        str: The collapsed stacks, heaviest first.
+    """
+    merged = Counter()
+    for (status, frames), count in stack_counts.items():
+        path = [f"[{status}]"] if split_by_status else []
+        path.extend(frame.replace(";", ":") for frame in reversed(frames))
+        merged[";".join(path) or ROOT_FRAME] += count
+    return "\n".join(f"{path} {count}" for path, count in merged.most_common())
+
+# Function to rank lock classes by the number of threads contending for them
+def get_top_contended_locks(analyses, limit=10):
+    """
+    Ranks synchronizer classes by the threads blocked on them across all dumps.
+
+    Args:
+        analyses (list): Analysis objects of the thread dumps.
+        limit (int): Maximum number of classes returned.
+
+    Returns:
+        list: Dictionaries with the class name, blocked and waiting thread counts,
+        the number of distinct locks and the most waiters seen on a single lock.
+    """
+    classes = {}
+    for analysis in analyses:
+        for synchronizer in analysis.synchronizers:
+            if not synchronizer.lockWaiters and not synchronizer.notificationWaiters:
+                continue
+            entry = classes.get(synchronizer.className)
+            if entry is None:
+                entry = classes[synchronizer.className] = {
+                    "className": synchronizer.className,
+                    "blockedThreads": 0,
+                    "waitingThreads": 0,
+                    "locks": 0,
+                    "maxWaitersOnOneLock": 0,
+                }
+            entry["blockedThreads"] += len(synchronizer.lockWaiters)
+            entry["waitingThreads"] += len(synchronizer.notificationWaiters)
+            entry["locks"] += 1
+            entry["maxWaitersOnOneLock"] = max(entry["maxWaitersOnOneLock"], len(synchronizer.lockWaiters))
+
+    ranked = sorted(classes.values(), key=lambda entry: (-entry["blockedThreads"], -entry["waitingThreads"], str(entry["className"])))
+    return ranked[:limit]
+
+# Function to rank the frames that threads are executing most
+def get_hot_methods(stack_counts, status, limit=10):
+    """
+    Ranks top frames of the threads in a status, such as ThreadStatus.RUNNING.
+
+    Returns:
+        list: {"method", "count"} dictionaries, most frequent first.
+    """
+    counts = Counter()
+    for (stack_status, frames), count in stack_counts.items():
+        if stack_status == status and frames:
+            counts[frames[0]] += count
+    return [{"method": method, "count": count} for method, count in counts.most_common(limit)]
@@ -0,0 +1,186 @@
+import re
+import json
+import logging
+
+from .utils import call_chatgpt_api
+from .prompts import get_structured_output_repair_prompt
+from .metrics import STRUCTURED_OUTPUTS
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+MAX_REPAIR_ATTEMPTS = 1
+CODE_FENCE_REGEX = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+# Response formats in the shape of the OpenAI json_schema response format, strict
+# mode needs every property listed as required and no additional properties
+THREAD_SELECTION_FORMAT = {
+    "name": "thread_selection",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "analysis": {"type": "string", "description": "The thread dump analysis report, as plain text."},
+            "threads_for_analysis": {
+                "type": "array",
+                "description": "Names of at most 5 threads that need a detailed analysis, empty if none.",
+                "items": {"type": "string"},
+            },
+        },
+        "required": ["analysis", "threads_for_analysis"],
+        "additionalProperties": False,
+    },
+}
+
+LOG_FINDINGS_FORMAT = {
+    "name": "log_findings",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "analysis": {"type": "string", "description": "The log analysis report, as plain text."},
+            "suspected_classes": {
+                "type": "array",
+                "description": "At most 5 Java classes to analyze further, empty if none.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "package": {"type": "string"},
+                        "class": {"type": "string"},
+                        "issue_line": {"type": "integer"},
+                    },
+                    "required": ["package", "class", "issue_line"],
+                    "additionalProperties": False,
+                },
+            },
+            "error_message": {"type": "string", "description": "The error to investigate in the suspected classes."},
+        },
+        "required": ["analysis", "suspected_classes", "error_message"],
+        "additionalProperties": False,
+    },
+}
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+# Function to validate a value against the JSON schema subset used by the response formats
+def validate_json(value, schema, path="$"):
+    """
+    Validates a decoded JSON value against a schema.
+
+    Supports the keywords of the response formats: type, properties,
+    required, additionalProperties (false), items and enum.
+
+    Args:
+        value: The decoded JSON value.
+        schema (dict): The JSON schema.
+        path (str): Location of value, used in the error messages.
+
+    Returns:
+        list: Error messages, empty if the value is valid.
+    """
+    expected = schema.get("type")
+    if expected == "integer":
+        valid_type = isinstance(value, int) and not isinstance(value, bool)
+    elif expected == "number":
+        valid_type = isinstance(value, JSON_TYPES[expected]) and not isinstance(value, bool)
+    elif expected:
+        valid_type = isinstance(value, JSON_TYPES[expected])
+    else:
+        valid_type = True
+    if not valid_type:
+        return [f"{path} must be of type {expected}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} must be one of {schema['enum']}"]
+
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path} is missing the required property '{name}'")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(validate_json(item, properties[name], f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path} has the unexpected property '{name}'")
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate_json(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+# Function to decode the JSON of a response, valid for its format or not
+def decode_json_response(response_text):
+    """
+    Decodes the JSON of a response, tolerating a Markdown code fence around it.
+
+    Raises:
+        ValueError: If the response is not valid JSON.
+    """
+    match = CODE_FENCE_REGEX.match(response_text)
+    return json.loads(match.group(1) if match else response_text)
+
+# Function to decode and validate a structured response
+def parse_structured_response(response_text, response_format):
+    """
+    Decodes a response that should be a JSON object of the given format.
+
+    A Markdown code fence around the JSON is tolerated.
+
+    Args:
+        response_text (str): The response of the LLM.
+        response_format (dict): One of the *_FORMAT response formats.
+
+    Returns:
+        tuple: (value, errors), value is None if the response is not valid JSON of the format.
+    """
+    try:
+        value = decode_json_response(response_text)
+    except ValueError as error:
+        return None, [f"The response is not valid JSON: {error}"]
+    errors = validate_json(value, response_format["schema"])
+    return (None if errors else value), errors
+
+# Function to call the LLM for a structured response, repairing an invalid one
+def call_structured_llm(prompt, response_format, max_repairs=MAX_REPAIR_ATTEMPTS):
+    """
+    Asks for a response in a JSON schema format and validates it.
+
+    An invalid response is sent back with the validation errors and a
+    request to fix it, which only repeats this call and not the stages
+    before it. API errors are not retried.
+
+    Args:
+        prompt (str): The prompt of the stage.
+        response_format (dict): One of the *_FORMAT response formats.
+        max_repairs (int): Number of repair calls made for invalid responses.
+
+    Returns:
+        tuple: (value, response_text), value is None if no valid response was obtained,
+        response_text is the last response, or the error of a failed call.
+    """
+    name = response_format["name"]
+    response = call_chatgpt_api(prompt, response_format)
+    for attempt in range(max_repairs + 1):
+        if not isinstance(response, str):
+            STRUCTURED_OUTPUTS.inc(format=name, outcome="error")
+            return None, str(response)
+
+        value, errors = parse_structured_response(response, response_format)
+        if value is not None:
+            STRUCTURED_OUTPUTS.inc(format=name, outcome="repaired" if attempt else "valid")
+            return value, response
+        if attempt == max_repairs:
+            break
+
+        logger.warning(f"Invalid {name} response, asking for a repair: {'; '.join(errors[:5])}")
+        response = call_chatgpt_api(get_structured_output_repair_prompt(response, errors, response_format), response_format)
+
+    STRUCTURED_OUTPUTS.inc(format=name, outcome="invalid")
+    logger.error(f"No valid {name} response after {max_repairs} repair attempts")
+    return None, response
@@ -3,78 +3,112 @@ import os
 import json
 import logging
 
-from .utils import process_output_to_string, call_chatgpt_api
+from .utils import process_output_to_string, call_chatgpt_api, read_in_memory_file
 
 from .prompts import get_initial_thread_analysis_prompt, get_comprehensive_thread_analysis_prompt
-from .thread_dump_processor import Analysis, ThreadStatus
+from .thread_dump_processor import ThreadStatus
+from .dump_cache import load_or_analyze
+from .dump_parsers import detect_dump_format, is_thread_dump_candidate
+from .thread_table import get_thread_table, get_virtual_thread_summary
+from .log_index import get_correlated_log_content
+from .cpu_ranking import rank_cpu_threads
+from .metrics import timed_stage
+from .structured_output import call_structured_llm, THREAD_SELECTION_FORMAT
 
 # Configure logger
 logger = logging.getLogger("diagnostic_analyzer")
 
-# Function to analyze multiple thread dumps
-def analyze_thread_dumps(thread_groups_config, in_memory_files):
+THREAD_DUMP_FILENAME_REGEX = re.compile(r"threaddump-(\d+)-\d+\.(?:txt|json)$")
+MAX_PROBLEM_THREADS = 5
+
+# Function to parse the thread dumps of a bundle
+@timed_stage("parse_thread_dumps")
+def parse_thread_dumps(thread_groups_config, in_memory_files):
     """
-    Analyzes multiple thread dump files and combines the results into a single output file.
+    Parses the thread dump files of a bundle.
+
+    Files named threaddump-<n>-<timestamp>.txt or .json come first, in dump
+    order, followed by any other upload that contains thread dumps, such as a
+    console log with SIGQUIT output. The format of every file is sniffed and
+    it is read by the matching parser in dump_parsers; a file may hold several dumps.
 
     Args:
         thread_groups_config (dict): Configuration for thread groups.
+        in_memory_files (dict): Dictionary of {filename: file_content} for in-memory files.
+
+    Returns:
+        list: Analysis objects of the thread dumps, in the order they were taken.
     """
-    file_contents = []
-    for i in range(1, 4):
+    named_files = []
+    other_files = []
+    for filename in in_memory_files:
+        match = THREAD_DUMP_FILENAME_REGEX.match(os.path.basename(filename))
+        if match:
+            named_files.append((int(match.group(1)), filename))
+        else:
+            other_files.append(filename)
 
-        pattern = re.compile(rf"threaddump-{i}-\d+\.txt")
-        matching_files = [f for f in in_memory_files.keys() if pattern.match(f)]
+    if not named_files:
+        logger.warning("No thread dump files named threaddump-<n>-<timestamp>.txt or .json found")
 
-        # Skip this iteration if no matching files are found
-        if not matching_files:
-            logger.warning(f"No matching thread dump file found for pattern threaddump-{i}-\\d+\\.txt")
+    analyses = []
+    for filename in [filename for _, filename in sorted(named_files)] + sorted(other_files):
+        file_content = in_memory_files[filename]
+        if filename in other_files and not is_thread_dump_candidate(file_content.getvalue()):
             continue
 
-        thread_dump_filename = matching_files[0]
-
         # Get file content directly from in_memory_files
-        file_content = in_memory_files[thread_dump_filename]
-        
-        # Handle different types of file content
-        if hasattr(file_content, 'read'):
-            # If it's a file-like object (BytesIO, etc.)
-            file_content.seek(0)  # Ensure we're at the start of the file
-            if hasattr(file_content, 'getvalue'):
-                # BytesIO object
-                thread_dump_text = file_content.getvalue()
-            else:
-                # Other file-like object
-                thread_dump_text = file_content.read()
-                file_content.seek(0)  # Reset position after reading
-                
-            # Convert bytes to string if needed
-            if isinstance(thread_dump_text, bytes):
-                thread_dump_text = thread_dump_text.decode('utf-8', errors='ignore')
-        else:
-            # If it's already a string or bytes
-            thread_dump_text = file_content
-            if isinstance(thread_dump_text, bytes):
-                thread_dump_text = thread_dump_text.decode('utf-8', errors='ignore')
+        text = read_in_memory_file(file_content)
+        parser = detect_dump_format(text)
+        if parser is None:
+            if filename not in other_files:
+                logger.warning(f"Unrecognized thread dump format: {filename}")
+            continue
+
+        for thread_dump_text in parser["split"](text):
+            analysis_id = len(analyses) + 1
+            analysis_name = f"Thread Dump Analysis {analysis_id}"
+            analysis_config = {}
+
+            # Reuse the parsed model when this dump has been analyzed before
+            analysis = load_or_analyze(analysis_id, analysis_name, analysis_config, thread_groups_config,
+                                       thread_dump_text, parser["name"])
+            analysis.filename = filename
+            analysis.dumpFormat = parser["name"]
+            analyses.append(analysis)
 
-        analysis_id = i
-        analysis_name = f"Thread Dump Analysis {i}"
-        analysis_config = {}
+        logger.info(f"Read {filename} as {parser['name']} thread dump")
+
+    return analyses
+
+# Function to analyze multiple thread dumps
+@timed_stage("thread_summary")
+def analyze_thread_dumps(thread_groups_config, in_memory_files, analyses=None):
+    """
+    Analyzes multiple thread dump files and combines the results into a single output file.
 
-        analysis = Analysis(analysis_id, analysis_name, analysis_config, thread_groups_config)
-        analysis.analyze(thread_dump_text)
+    Args:
+        thread_groups_config (dict): Configuration for thread groups.
+        analyses (list, optional): Dumps already parsed by parse_thread_dumps().
+    """
+    if analyses is None:
+        analyses = parse_thread_dumps(thread_groups_config, in_memory_files)
 
+    file_contents = []
+    for analysis in analyses:
         output = {
             "deadlocks": analysis.deadlockStatus,
             "threadsByState": {},
             "threadsByPool": {}
         }
 
-        thread_frames_var_name = f"thread_frames_{i}"
-        globals()[thread_frames_var_name] = {thread.name: thread.frames for thread in analysis.threads}
-
         for pool_name, threads in analysis.threadsByPool.items():
             output["threadsByPool"][pool_name] = [thread.name for thread in threads]
 
+        # Large numbers of virtual threads are summarized by stack instead of listed
+        if analysis.virtualThreadGroups:
+            output["virtualThreads"] = get_virtual_thread_summary(get_thread_table(analysis))
+
         for status in ThreadStatus.ALL:
             if status in analysis.threadsByStatus:
                 output["threadsByState"][status] = [{
@@ -88,12 +122,18 @@ def analyze_thread_dumps(thread_groups_config, in_memory_files):
 
         file_contents.append(process_output_to_string(output))
 
+    # The threads that used the most CPU between the dumps, measured rather than guessed from the stacks
+    top_cpu_threads = rank_cpu_threads(analyses)
+    if top_cpu_threads:
+        file_contents.append(process_output_to_string({"topCpuThreads": top_cpu_threads}))
+
     combined_content = "\n\n".join(file_contents)
 
     return combined_content
 
 # Function to analyze thread dumps and extract problematic threads
-def analyze_thread_dumps_and_extract_problems(thread_groups_config, in_memory_files, customer_problem):
+@timed_stage("initial_thread_analysis")
+def analyze_thread_dumps_and_extract_problems(thread_groups_config, in_memory_files, customer_problem, analyses=None):
     """
     Analyzes thread dumps, identifies problematic threads, and performs initial analysis.
     
@@ -101,37 +141,49 @@ def analyze_thread_dumps_and_extract_problems(thread_groups_config, in_memory_fi
         thread_groups_config (dict): Configuration for thread groups.
         folder_path (str): Path to the folder containing thread dumps.
         customer_problem (str): Description of the customer's problem.
+        analyses (list, optional): Dumps already parsed by parse_thread_dumps().
         
     Returns:
         tuple: A tuple containing (initial_report, problem_threads)
     """
     logger.info("Analyzing thread dumps and extracting problematic threads...")
-    combined_content = analyze_thread_dumps(thread_groups_config, in_memory_files)
+    combined_content = analyze_thread_dumps(thread_groups_config, in_memory_files, analyses)
     
     if not combined_content:
         return "No thread dump content could be analyzed.", []
 
     try:
-        # Call the API for initial analysis
+        # Call the API for initial analysis, as a validated JSON object
         initial_prompt = get_initial_thread_analysis_prompt(customer_problem, combined_content, thread_groups_config)
-        initial_response = call_chatgpt_api(initial_prompt)
-        if "context_length_exceeded" in initial_response:
+        selection, initial_response = call_structured_llm(initial_prompt, THREAD_SELECTION_FORMAT)
+        if selection is None and "context_length_exceeded" in initial_response:
             logger.warning("Context length exceeded. Trying with a smaller context.")
-            short_initial_prompt = get_initial_thread_analysis_prompt(customer_problem, combined_content[:600000])
-            initial_response = call_chatgpt_api(short_initial_prompt)
-            
-        problem_threads = extract_problem_threads(initial_response)
-        
-        return initial_response, problem_threads
+            short_initial_prompt = get_initial_thread_analysis_prompt(customer_problem, combined_content[:600000],
+                                                                      thread_groups_config)
+            selection, initial_response = call_structured_llm(short_initial_prompt, THREAD_SELECTION_FORMAT)
+
+        if selection is None:
+            # Last resort for a response that could not be repaired
+            return initial_response, extract_problem_threads(initial_response)
+
+        problem_threads = selection["threads_for_analysis"][:MAX_PROBLEM_THREADS]
+        return format_thread_selection(selection["analysis"], problem_threads), problem_threads
         
     except Exception as e:
         logger.error(f"Error in thread dump analysis: {str(e)}")
         
+# Function to format the initial analysis with its thread selection for the report and later prompts
+def format_thread_selection(analysis, problem_threads):
+    """Returns the analysis text followed by the THREADS_FOR_ANALYSIS line of the selected threads."""
+    return f"{analysis}\n\nTHREADS_FOR_ANALYSIS: {json.dumps(problem_threads)}"
+
 # Extract thread names from the initial response
 def extract_problem_threads(initial_response):
     """
     Extracts thread names from any Python-style list found in the response.
 
+    Only used for free-text responses, when no valid structured response could be obtained.
+
     Args:
         initial_response: The initial report from the ChatGPT API.
 
@@ -156,19 +208,28 @@ def extract_problem_threads(initial_response):
         return []
     
 # Function to fetch stack traces from thread frames when thread name is provided
-def get_stack_trace(thread_name):
-    try:
-        for i in range(1, 4):
-            thread_frames_var_name = f"thread_frames_{i}"
-            thread_frames = globals()[thread_frames_var_name]
-            if thread_name in thread_frames:
-                return thread_frames[thread_name]
-    except Exception as error:
-        logger.error(f"Failed to get stack trace for {thread_name}: {error}")
+def get_stack_trace(thread_name, analyses):
+    """
+    Returns the frames of a thread in the first dump of the bundle that lists it.
+
+    Args:
+        thread_name (str): Name of the thread.
+        analyses (list): The dumps of the bundle, from parse_thread_dumps().
+
+    Returns:
+        list: The frames of the thread, or None if no dump has it.
+    """
+    for analysis in analyses:
+        for thread in analysis.threads:
+            if thread.name == thread_name:
+                return thread.frames
+    return None
 
 
 # Function to get comprehensive thread analysis using stack traces
-def get_comprehensive_thread_analysis(initial_response, problem_threads, customer_problem, log_content):
+@timed_stage("comprehensive_thread_analysis")
+def get_comprehensive_thread_analysis(initial_response, problem_threads, customer_problem, log_content, dump_dates=None,
+                                      analyses=None):
     """
     Gets a comprehensive analysis of problematic threads using their stack traces.
     
@@ -177,6 +238,10 @@ def get_comprehensive_thread_analysis(initial_response, problem_threads, custome
         problem_threads (list): List of problematic thread names.
         customer_problem (str): Description of the customer's problem.
         log_content (str): Content of the log file.
+        dump_dates (list, optional): Analysis.date of the thread dumps. When given, only the log
+            events correlated with the problem threads and dumps are sent, see log_index.
+        analyses (list, optional): The dumps of the bundle, from parse_thread_dumps(), the stack
+            traces are taken from them.
         
     Returns:
         str: Comprehensive thread analysis report.
@@ -190,9 +255,12 @@ def get_comprehensive_thread_analysis(initial_response, problem_threads, custome
     # Collect stack traces for each problematic thread
     thread_stack_traces = {}
     for thread_name in problem_threads:
-        stack_trace = get_stack_trace(thread_name)
+        stack_trace = get_stack_trace(thread_name, analyses or [])
         thread_stack_traces[thread_name] = stack_trace
     
+    if dump_dates:
+        log_content = get_correlated_log_content(log_content, problem_threads, dump_dates)
+
     comprehensive_prompt = get_comprehensive_thread_analysis_prompt(customer_problem, initial_response, log_content, thread_stack_traces)
     
     try:
@@ -1,7 +1,10 @@
 from datetime import datetime
+import functools
 import re
+import sys
 
 DATE_REGEX = re.compile(r"^([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2})$")
+VIRTUAL_THREADS_POOL = "Virtual threads"
 
 class Analysis:
     def __init__(self, id, name, config, thread_groups_config):
@@ -10,6 +13,7 @@ class Analysis:
         self.date = None
         self.dateString = None
         self.filename = None
+        self.dumpFormat = None
         self.config = config
         self.thread_groups_config = thread_groups_config
         self.threadComparator = Thread.compare
@@ -23,6 +27,21 @@ class Analysis:
         self._analyzeSynchronizers()
         self._analyzeDeadlocks()
 
+    def analyzeThreads(self, threads, virtualThreadGroups=None):
+        # For parsers that build the Thread objects themselves, such as the jcmd JSON parser.
+        # virtualThreadGroups counts the virtual threads not kept as objects, by (status, frames)
+        self._init()
+        if virtualThreadGroups is not None:
+            self.virtualThreadGroups = virtualThreadGroups
+        for thread in threads:
+            self.threads.append(thread)
+            self.threadMap[thread.tid] = thread
+        self._identifyWaitedForSynchronizers()
+        self._mapThreadsByStatus()
+        self._countRunningMethods()
+        self._analyzeSynchronizers()
+        self._analyzeDeadlocks()
+
     def _init(self):
         self.threads = []
         self.threadMap = {}
@@ -31,6 +50,8 @@ class Analysis:
         self.synchronizerMap = {}
         self.ignoredData = Util.StringCounter()
         self.runningMethods = Util.StringCounter()
+        self.virtualThreadGroups = {}
+        self.threadTable = None
         self.deadlockStatus = DeadlockStatus.NONE
         self.threadGroupsConfig = self.thread_groups_config
 
@@ -83,8 +104,9 @@ class Analysis:
         return True
 
     def _handleLine(self, line):
-        thread = Thread(line)
-        if thread.isValid():
+        # Only lines starting with " can be thread headers, skip parsing a header spec for the rest
+        thread = Thread(line) if line.startswith('"') else None
+        if thread is not None and thread.isValid():
             self.threads.append(thread)
             self.threadMap[thread.tid] = thread
             self._currentThread = thread
@@ -118,6 +140,9 @@ class Analysis:
         pools['Threads with no pools'] = []
 
         for thread in self.threads:
+            if thread.virtual:
+                pools.setdefault(VIRTUAL_THREADS_POOL, []).append(thread)
+                continue
             grouped = False
             for poolName in pools:
                 if poolName != 'Threads with no pools' and poolName in thread.name:
@@ -187,7 +212,7 @@ class Analysis:
             status = self._determineDeadlockStatus(synchronizer)
             if status.severity == 0:
                 continue
-            if self.deadlockStatus['severity'] < status['severity']:
+            if self.deadlockStatus.severity < status.severity:
                 self.deadlockStatus = status
             synchronizer.deadlockStatus = status
 
@@ -208,13 +233,15 @@ class Analysis:
         work = []
         work.append(sync.lockHolder)
         visited = {sync.id: True}
+        trail = []
         while len(work) > 0:
             thread = work.pop()
+            trail.append(thread.name)
             if thread.wantNotificationOn is not None:
-                return DeadlockStatus(DeadlockStatus.HIGH_RISK, [])
+                return DeadlockStatus(DeadlockStatus.HIGH_RISK, trail)
             if thread.wantToAcquire is not None:
                 if thread.wantToAcquire in visited:
-                    return DeadlockStatus(DeadlockStatus.DEADLOCKED, [])
+                    return DeadlockStatus(DeadlockStatus.DEADLOCKED, trail)
                 visited[thread.wantToAcquire] = True
                 synchro = self.synchronizerMap[thread.wantToAcquire]
                 if synchro.lockHolder is not None:
@@ -223,7 +250,9 @@ class Analysis:
         return DeadlockStatus.NONE
 
 class Thread:
-    def __init__(self, spec):
+    _internal_generated_id_counter = 0
+
+    def __init__(self, spec=None):
         # Initial property declarations
         self.spec = spec
         self.threadState = None
@@ -231,6 +260,10 @@ class Thread:
         self.classicalLockHeld = None
         self.name = None
         self.tid = None  
+        self.nid = None
+        self.nativeId = None
+        self.cpuMillis = None
+        self.elapsedSeconds = None
         self.frames = []
         self.synchronizerClasses = {}
         self.wantToAcquire = None
@@ -242,9 +275,12 @@ class Thread:
         self.group = None
         self.state = None
         self.dontKnow = None
+        self.virtual = False
+        self.carrier = None
         
-        # Initialize the object
-        self._parseSpec(spec)
+        # Initialize the object (parsers building threads from fields pass no spec)
+        if spec is not None:
+            self._parseSpec(spec)
 
     def isValid(self):
         return hasattr(self, 'name') and self.name is not None
@@ -253,7 +289,8 @@ class Thread:
         FRAME = re.compile(r'^\s+at (.*)')
         match = FRAME.match(line)
         if match:
-            self.frames.append(match.group(1))
+            # Frames repeat across threads, interning shares one string per frame
+            self.frames.append(sys.intern(match.group(1)))
             return True
 
         THREAD_STATE = re.compile(r'^\s*java.lang.Thread.State: (.*)')
@@ -332,6 +369,7 @@ class Thread:
 
         self.dontKnow, line = extract(r'\[([0-9a-fx,]+)\]$', line)
         self.nid, line = extract(r' nid=([0-9a-fx,]+)', line)
+        self.nativeId = Util.parse_native_id(self.nid)
         self.tid, line = extract(r' tid=([0-9a-fx,]+)', line)
         
         if self.tid is None:
@@ -339,6 +377,11 @@ class Thread:
 
         self.prio, line = extract(r' prio=([0-9]+)', line)
         self.osPrio, line = extract(r' os_prio=([0-9a-fx,]+)', line)
+        # JDK 11+ headers carry the CPU time and age of the thread
+        cpu, line = extract(r' cpu=([0-9.]+)ms', line)
+        self.cpuMillis = float(cpu) if cpu is not None else None
+        elapsed, line = extract(r' elapsed=([0-9.]+)s', line)
+        self.elapsedSeconds = float(elapsed) if elapsed is not None else None
         daemon, line = extract(r' (daemon)', line)
         self.daemon = daemon is not None
         self.number, line = extract(r' #([0-9]+)', line)
@@ -541,6 +584,16 @@ class Util:
 
         return class_name
 
+    @staticmethod
+    def parse_native_id(nid):
+        # nid is hexadecimal in HotSpot dumps and decimal in some others
+        if nid is None:
+            return None
+        try:
+            return int(nid, 16) if nid.startswith('0x') else int(nid)
+        except ValueError:
+            return None
+
     @staticmethod
     def array_add_unique(array, to_add):
         if to_add not in array:
@@ -601,7 +654,7 @@ class Util:
         def sort_sources(self, compare=None):
             if compare is None:
                 return
+            # compare is a cmp-style function like Thread.compare
+            key = functools.cmp_to_key(compare)
             for data in self._strings_to_counts.values():
-                #data["sources"].sort(key=compare)
-                #possible error
-                pass
+                data["sources"].sort(key=key)
@@ -0,0 +1,159 @@
+import logging
+from array import array
+from collections import Counter
+
+from .thread_dump_processor import ThreadStatus, VIRTUAL_THREADS_POOL
+
+# Configure logger
+logger = logging.getLogger("diagnostic_analyzer")
+
+STATUS_IDS = {status: index for index, status in enumerate(ThreadStatus.ALL)}
+TOP_VIRTUAL_THREAD_STACKS = 10
+VIRTUAL_THREAD_FRAMES = 8
+
+class ThreadTable:
+    """
+    Array-backed columns describing the threads of one dump.
+
+    A row is either one thread or a group of identical unmounted virtual
+    threads, with the number of threads in the count column. Statuses, pools,
+    stacks and carriers are stored as ids into small tables, so a row takes a
+    few bytes and identical stacks are stored once.
+    """
+    def __init__(self):
+        self.pool_names = []
+        self.stacks = []
+        self.carriers = [None]
+        self._pool_ids = {}
+        self._stack_ids = {}
+        self._carrier_ids = {None: 0}
+
+        self.status = array("B")
+        self.pool = array("H")
+        self.stack = array("I")
+        self.carrier = array("I")
+        self.virtual = array("B")
+        self.count = array("I")
+
+    def __len__(self):
+        return len(self.count)
+
+    def add(self, status, pool_name, frames, carrier=None, virtual=False, count=1):
+        """Appends a row for count threads with the same status, pool, stack and carrier."""
+        pool_id = self._pool_ids.get(pool_name)
+        if pool_id is None:
+            pool_id = self._pool_ids[pool_name] = len(self.pool_names)
+            self.pool_names.append(pool_name)
+
+        frames = tuple(frames)
+        stack_id = self._stack_ids.get(frames)
+        if stack_id is None:
+            stack_id = self._stack_ids[frames] = len(self.stacks)
+            self.stacks.append(frames)
+
+        carrier_id = self._carrier_ids.get(carrier)
+        if carrier_id is None:
+            carrier_id = self._carrier_ids[carrier] = len(self.carriers)
+            self.carriers.append(carrier)
+
+        self.status.append(STATUS_IDS[status])
+        self.pool.append(pool_id)
+        self.stack.append(stack_id)
+        self.carrier.append(carrier_id)
+        self.virtual.append(1 if virtual else 0)
+        self.count.append(count)
+
+    @property
+    def thread_count(self):
+        return sum(self.count)
+
+    @property
+    def virtual_thread_count(self):
+        return sum(count for count, virtual in zip(self.count, self.virtual) if virtual)
+
+    def count_by_status(self):
+        """Returns {status: thread_count} in ThreadStatus.ALL order."""
+        counts = [0] * len(ThreadStatus.ALL)
+        for status, count in zip(self.status, self.count):
+            counts[status] += count
+        return {ThreadStatus.ALL[status]: count for status, count in enumerate(counts) if count}
+
+    def count_by_pool(self):
+        """Returns {pool_name: {status: thread_count}} with statuses in ThreadStatus.ALL order."""
+        counts = Counter()
+        for pool, status, count in zip(self.pool, self.status, self.count):
+            counts[pool, status] += count
+
+        histogram = {pool_name: {} for pool_name in self.pool_names}
+        for (pool, status), count in sorted(counts.items(), key=lambda item: item[0][1]):
+            histogram[self.pool_names[pool]][ThreadStatus.ALL[status]] = count
+        return histogram
+
+    def stack_counts(self, virtual_only=False):
+        """
+        Counts threads by (status, stack) in the layout of stack_aggregator.aggregate_stacks().
+
+        Returns:
+            Counter: {(status, frames): thread_count} with frames in jstack (leaf first) order.
+        """
+        counts = Counter()
+        for status, stack, virtual, count in zip(self.status, self.stack, self.virtual, self.count):
+            if virtual or not virtual_only:
+                counts[status, stack] += count
+        return Counter({(ThreadStatus.ALL[status], self.stacks[stack]): count for (status, stack), count in counts.items()})
+
+    def virtual_threads_by_carrier(self):
+        """
+        Groups the virtual threads by carrier thread and stack.
+
+        Returns:
+            dict: {carrier: Counter({frames: thread_count})}, with the unmounted virtual threads under None.
+        """
+        groups = {}
+        for carrier, stack, virtual, count in zip(self.carrier, self.stack, self.virtual, self.count):
+            if virtual:
+                stacks = groups.setdefault(self.carriers[carrier], Counter())
+                stacks[self.stacks[stack]] += count
+        return groups
+
+# Function to build the columnar view of a parsed dump
+def get_thread_table(analysis):
+    """
+    Returns the ThreadTable of an analysis, building it on first use.
+
+    Threads kept as objects get a row each and every group in
+    Analysis.virtualThreadGroups gets a single weighted row, so the table
+    grows with the number of distinct virtual thread stacks rather than with
+    the number of virtual threads.
+    """
+    if analysis.threadTable is not None:
+        return analysis.threadTable
+
+    table = ThreadTable()
+    for pool_name, threads in analysis.threadsByPool.items():
+        for thread in threads:
+            table.add(thread.getStatus().status, pool_name, thread.frames, thread.carrier, thread.virtual)
+    for (status, frames), count in analysis.virtualThreadGroups.items():
+        table.add(status, VIRTUAL_THREADS_POOL, frames, None, True, count)
+
+    analysis.threadTable = table
+    return table
+
+# Function to summarize the virtual threads of a dump
+def get_virtual_thread_summary(table, limit=TOP_VIRTUAL_THREAD_STACKS, frames_per_stack=VIRTUAL_THREAD_FRAMES):
+    """
+    Summarizes the virtual threads of a ThreadTable instead of listing them one by one.
+
+    Returns:
+        dict: The number of virtual threads, how many are mounted and on how many
+        carriers, and the most common (status, stack) groups.
+    """
+    by_carrier = table.virtual_threads_by_carrier()
+    mounted = {carrier: stacks for carrier, stacks in by_carrier.items() if carrier is not None}
+    return {
+        "count": table.virtual_thread_count,
+        "mounted": sum(sum(stacks.values()) for stacks in mounted.values()),
+        "carriers": len(mounted),
+        "topStacks": [{"count": count, "status": status, "frames": list(frames[:frames_per_stack])}
+                      for (status, frames), count in table.stack_counts(virtual_only=True).most_common(limit)],
+    }
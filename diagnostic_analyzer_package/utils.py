@@ -1,11 +1,16 @@
+import re
 import pkgutil
-import openai
-import textwrap
+import json
 import os
+import functools
 import time
 import logging
 from datetime import datetime, timedelta, timezone
 
+from .metrics import record_llm_call, get_current_stage
+from .model_routing import estimate_tokens, get_model_route, get_call_cost
+from .cache_backends import cache_get, cache_set, get_content_key
+
 # Configure logger
 logger = logging.getLogger("diagnostic_analyzer")
 
@@ -38,7 +43,85 @@ def read_package_file(filename):
     else: 
         logger.error(f"File not found in package: {filename}")
         return None
-    
+
+# Function to load the thread groups configuration on first use
+@functools.lru_cache(maxsize=None)
+def load_thread_groups_config():
+    """
+    Loads ThreadGroups.json from the package data.
+
+    The file is parsed on the first call only, so importing the package stays cheap.
+
+    Returns:
+        dict: Configuration for thread groups.
+    """
+    return json.loads(read_package_file('ThreadGroups.json'))
+
+# Function to load the log rules configuration on first use
+@functools.lru_cache(maxsize=None)
+def load_log_rules_config():
+    """
+    Loads the known failure signatures of the log rule engine.
+
+    The rules come from the file named by DIAGNOSTIC_ANALYZER_LOG_RULES if set,
+    otherwise from LogRules.json in the package data.
+
+    Returns:
+        dict: Configuration with the "logRules" list.
+    """
+    rules_path = os.getenv('DIAGNOSTIC_ANALYZER_LOG_RULES')
+    if rules_path:
+        with open(rules_path, encoding='utf-8') as rules_file:
+            return json.load(rules_file)
+    return json.loads(read_package_file('LogRules.json'))
+
+# Function to load the model routing configuration on first use
+@functools.lru_cache(maxsize=None)
+def load_model_routing_config():
+    """
+    Loads the rules choosing the model of every LLM call, and the model prices.
+
+    The rules come from the file named by DIAGNOSTIC_ANALYZER_MODEL_ROUTING if set,
+    otherwise from ModelRouting.json in the package data.
+
+    Returns:
+        dict: Configuration with "defaultRoute", "stages" and "modelPrices".
+    """
+    routing_path = os.getenv('DIAGNOSTIC_ANALYZER_MODEL_ROUTING')
+    if routing_path:
+        with open(routing_path, encoding='utf-8') as routing_file:
+            return json.load(routing_file)
+    return json.loads(read_package_file('ModelRouting.json'))
+
+# Function to read the text of an uploaded file held in memory
+def read_in_memory_file(file_content):
+    """
+    Returns the text of an in-memory file.
+
+    Args:
+        file_content: A BytesIO/file-like object, or bytes/string content.
+
+    Returns:
+        str: The decoded content of the file.
+    """
+    if hasattr(file_content, 'read'):
+        # If it's a file-like object (BytesIO, etc.)
+        file_content.seek(0)  # Ensure we're at the start of the file
+        if hasattr(file_content, 'getvalue'):
+            # BytesIO object
+            text = file_content.getvalue()
+        else:
+            # Other file-like object
+            text = file_content.read()
+            file_content.seek(0)  # Reset position after reading
+    else:
+        # If it's already a string or bytes
+        text = file_content
+
+    # Convert bytes to string if needed
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='ignore')
+    return text
 
 # Function to process the output to a formatted string
 def process_output_to_string(output):
@@ -61,27 +144,237 @@ def process_output_to_string(output):
             lines.append(f"  {value}")
     return "\n".join(lines)
 
-# Function to call the ChatGPT API
-def call_chatgpt_api(prompt):
+# Callable answering prompts instead of the OpenAI API, see set_llm_backend()
+_llm_backend = None
+
+# Function to replace the LLM used by every analysis stage
+def set_llm_backend(backend):
+    """
+    Sends every LLM call to backend instead of the OpenAI API, such as a local stub in benchmarks.
+
+    Args:
+        backend (callable): Takes the prompt and returns the response text, or None to use the OpenAI API again.
+            Calls asking for a structured response also pass the response format as second argument.
+    """
+    global _llm_backend
+    _llm_backend = backend
+
+# Batch API collector answering OpenAI calls instead of the synchronous endpoint, see set_llm_batch()
+_llm_batch = None
+
+# Function to send OpenAI calls as Batch API jobs
+def set_llm_batch(collector):
+    """
+    Sends every OpenAI call through collector.complete(request), which returns the chat completion as a dict.
+
+    Args:
+        collector (batch_api.BatchCollector): The collector, or None to use the synchronous endpoint again.
+    """
+    global _llm_batch
+    _llm_batch = collector
+
+# Function to send a Chat Completions request to the synchronous endpoint
+def _create_chat_completion(request):
+    # Imported on first use, parse-only runs never need the OpenAI client
+    import openai
+
     # Set the OpenAI API key
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
+    # prompt_cache_key goes through extra_body, which older openai versions also accept
+    options = {key: value for key, value in request.items() if key != "prompt_cache_key"}
+    response = openai.chat.completions.create(**options, extra_body={"prompt_cache_key": request["prompt_cache_key"]})
+    return response.model_dump()
+
+# Function to call the ChatGPT API
+def call_chatgpt_api(prompt, response_format=None):
+    """
+    Sends a prompt to the LLM and returns the response text, or the exception of a failed call.
+
+    The model and reasoning effort are picked by ModelRouting.json from the
+    current stage and the estimated tokens of the prompt.
+
+    Args:
+        prompt (str): The prompt.
+        response_format (dict, optional): {"name", "schema"} of a JSON schema the response must follow,
+            see structured_output.
+    """
+    routing_config = load_model_routing_config()
+    input_tokens = estimate_tokens(prompt)
+    route = get_model_route(routing_config, get_current_stage(), input_tokens)
+    model, reasoning_effort = route["model"], route["reasoningEffort"]
+    logger.debug(f"Routing {get_current_stage()} ({input_tokens} estimated tokens) to {model} "
+                 f"(reasoning effort {reasoning_effort or 'none'})")
+
+    # Responses are shared through the cache backend, if one is configured
+    cache_key = get_content_key(model if _llm_backend is None else type(_llm_backend).__name__, reasoning_effort or "",
+                                prompt, response_format["name"] if response_format else "")
+    cached = cache_get("llm", cache_key)
+    if cached is not None:
+        return cached.decode("utf-8")
+
+    if _llm_backend is not None:
+        start = time.perf_counter()
+        content = _llm_backend(prompt, response_format) if response_format else _llm_backend(prompt)
+        # Token counts are estimated, so the cost is what the routed model would have cost
+        output_tokens = estimate_tokens(content)
+        record_llm_call(prompt, content, time.perf_counter() - start, model=model, reasoning_effort=reasoning_effort,
+                        cost=get_call_cost(routing_config, model, input_tokens, output_tokens))
+        cache_set("llm", cache_key, content.encode("utf-8"))
+        return content
+
+    # The body of the Chat Completions request, as sent in Batch API jobs
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        # Calls of a stage share their prompt prefix, the cache key keeps them on the same prompt cache
+        "prompt_cache_key": f"diagnostic_analyzer-{get_current_stage()}",
+    }
+    if reasoning_effort:
+        request["reasoning_effort"] = reasoning_effort
+    if response_format:
+        request["response_format"] = {"type": "json_schema", "json_schema": {**response_format, "strict": True}}
+
+    batch = _llm_batch
+    start = time.perf_counter()
     try:
-        response = openai.chat.completions.create(
-            model="o3-mini", 
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-        )
-        return response.choices[0].message.content
+        completion = batch.complete(request) if batch is not None else _create_chat_completion(request)
+        content = completion["choices"][0]["message"]["content"]
+        usage = completion.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        record_llm_call(prompt, content, time.perf_counter() - start, prompt_tokens, completion_tokens, model=model,
+                        reasoning_effort=reasoning_effort, cached_tokens=cached_tokens,
+                        cost=get_call_cost(routing_config, model, prompt_tokens, completion_tokens, cached_tokens,
+                                           batch=batch is not None))
+        if content:
+            cache_set("llm", cache_key, content.encode("utf-8"))
+        return content
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        record_llm_call(prompt, "", time.perf_counter() - start, error=True, model=model, reasoning_effort=reasoning_effort)
         return e
 
+# Glyph widths per (font, font_size), measured once per process
+_char_width_cache = {}
+# Words repeat a lot in reports, but thread names and ids are unique, so only recent words are kept
+WORD_WIDTH_CACHE_SIZE = 4096
+MAX_CACHED_WORD_LENGTH = 64
+WHITESPACE_RUN_REGEX = re.compile(r'(\s+)')
+
+def measure_text_width(text, font, font_size):
+    """
+    Returns the rendered width of text, using cached per-character widths.
+
+    Args:
+        text (str): The text to measure
+        font (str): Font name
+        font_size (int): Font size
+
+    Returns:
+        float: Width of the text in points
+    """
+    if len(text) <= MAX_CACHED_WORD_LENGTH:
+        return _measure_word_width(text, font, font_size)
+    return _sum_char_widths(text, font, font_size)
+
+@functools.lru_cache(maxsize=WORD_WIDTH_CACHE_SIZE)
+def _measure_word_width(text, font, font_size):
+    return _sum_char_widths(text, font, font_size)
+
+def _sum_char_widths(text, font, font_size):
+    widths = _char_width_cache.get((font, font_size))
+    if widths is None:
+        widths = _char_width_cache[(font, font_size)] = {}
+
+    width = 0
+    for char in text:
+        char_width = widths.get(char)
+        if char_width is None:
+            from reportlab.pdfbase.pdfmetrics import stringWidth
+
+            char_width = widths[char] = stringWidth(char, font, font_size)
+        width += char_width
+    return width
+
+def wrap_text_to_width(text, width, font, font_size):
+    """
+    Greedily wraps a paragraph so that every line fits in width points.
+
+    As textwrap does, the leading indent of the paragraph is kept on its first
+    line and runs of spaces inside a line are kept, so stack frames and column
+    aligned text keep their layout; the spaces at a line break are dropped.
+
+    Args:
+        text (str): The paragraph to wrap, without newlines
+        width (float): Available width in points
+        font (str): Font name
+        font_size (int): Font size
+
+    Returns:
+        list: The wrapped lines
+    """
+    text = text.expandtabs()
+    body = text.lstrip()
+    # The leading indent, kept on the first line
+    current = text[:len(text) - len(body)]
+    current_width = measure_text_width(current, font, font_size)
+    has_word = False
+
+    lines = []
+    # Words at even positions, the whitespace runs between them at odd positions
+    chunks = WHITESPACE_RUN_REGEX.split(body)
+    for index in range(0, len(chunks), 2):
+        word = chunks[index]
+        if not word:
+            continue
+        word_width = measure_text_width(word, font, font_size)
+
+        if has_word:
+            space = chunks[index - 1]
+            space_width = measure_text_width(space, font, font_size)
+            if current_width + space_width + word_width <= width:
+                current += space + word
+                current_width += space_width + word_width
+                continue
+            lines.append(current)
+            current, current_width = '', 0
+        elif current_width + word_width > width and word_width <= width:
+            # The first word only fits without the indent
+            current, current_width = '', 0
+
+        # Break words that are longer than a whole line
+        while current_width + word_width > width and len(word) > 1:
+            cut, cut_width = 0, 0
+            while cut < len(word) - 1:
+                char_width = measure_text_width(word[cut], font, font_size)
+                if cut > 0 and current_width + cut_width + char_width > width:
+                    break
+                cut_width += char_width
+                cut += 1
+            lines.append(current + word[:cut])
+            current, current_width = '', 0
+            word = word[cut:]
+            word_width -= cut_width
+
+        current += word
+        current_width += word_width
+        has_word = True
+
+    if has_word:
+        lines.append(current)
+    return lines
+
 def draw_wrapped_text(canvas, text, x, y, width, bottom_margin, height, top_margin, 
                      font="Helvetica", font_size=10, line_height=14, mono_font="Courier"):
     """
     Draws wrapped text on a PDF canvas and returns the new y position.
+
+    Lines are wrapped by their measured width and emitted through one text
+    object per page, instead of one drawing operation per string or character.
     
     Args:
         canvas: The ReportLab canvas object
@@ -95,94 +388,85 @@ def draw_wrapped_text(canvas, text, x, y, width, bottom_margin, height, top_marg
         font (str): Font name to use
         font_size (int): Font size
         line_height (int): Line height for text
-        mono_font (str): Monospace font name for code blocks
+        mono_font (str): Monospace font name for code blocks (kept for compatibility)
         
     Returns:
         float: New y position after drawing text
     """
-    # Calculate approximately how many characters fit on one line
-    chars_per_line = int((width / (600/10)) * (10/font_size) * 10)
-    
     # Process and wrap text
     lines = []
-    for paragraph in text.split('\n'):
+    for paragraph in str(text).split('\n'):
+        paragraph = paragraph.rstrip()
         if paragraph.strip() == '':
             lines.append('')  # Preserve empty lines
-        else:
-            # Check if this is a separator line (all same character)
-            if paragraph and all(c == paragraph[0] for c in paragraph.strip()) and len(paragraph.strip()) > 10:
-                # This is a separator line, keep it intact but trim if needed
-                lines.append(paragraph[:chars_per_line])
-            # Check if this is a bullet point
-            elif paragraph.strip().startswith('•') or paragraph.strip().startswith('-'):
-                # Preserve bullet points with proper wrapping
-                indent = len(paragraph) - len(paragraph.lstrip())
-                bullet = paragraph[:indent+2]  # bullet and following space
-                rest = paragraph[indent+2:]
-                wrapped = textwrap.wrap(rest, width=chars_per_line-indent-2)
-                if wrapped:
-                    lines.append(bullet + wrapped[0])
-                    for wrap_line in wrapped[1:]:
-                        lines.append(' ' * (indent+2) + wrap_line)
-                else:
-                    lines.append(bullet)
-            # Regular text
+        # Check if this is a separator line (all same character)
+        elif all(c == paragraph.strip()[0] for c in paragraph.strip()) and len(paragraph.strip()) > 10:
+            # This is a separator line, keep it intact but trim it to the width
+            separator = paragraph
+            while len(separator) > 1 and measure_text_width(separator, font, font_size) > width:
+                separator = separator[:-1]
+            lines.append(separator)
+        # Check if this is a bullet point
+        elif paragraph.strip().startswith('•') or paragraph.strip().startswith('-'):
+            # Preserve bullet points with proper wrapping
+            indent = len(paragraph) - len(paragraph.lstrip())
+            bullet = paragraph[:indent+2]  # bullet and following space
+            rest = paragraph[indent+2:]
+            bullet_width = measure_text_width(bullet, font, font_size)
+            wrapped = wrap_text_to_width(rest, width - bullet_width, font, font_size)
+            if wrapped:
+                lines.append(bullet + wrapped[0])
+                for wrap_line in wrapped[1:]:
+                    lines.append(' ' * (indent+2) + wrap_line)
             else:
-                wrapped = textwrap.wrap(paragraph, width=chars_per_line)
-                if wrapped:
-                    lines.extend(wrapped)
-                else:
-                    lines.append('')  # Empty paragraph
-    
-    # Draw each line
-    canvas.setFont(font, font_size)
+                lines.append(bullet)
+        # Regular text
+        else:
+            lines.extend(wrap_text_to_width(paragraph, width, font, font_size) or [''])
+
+    # Draw the lines through a text object, flushed at every page break
+    text_object = None
     for line in lines:
         if y < bottom_margin:  # Check if we need a new page
+            if text_object is not None:
+                canvas.drawText(text_object)
+                text_object = None
             canvas.showPage()
             y = height - top_margin
-            canvas.setFont(font, font_size)
-            
-        # Handle code blocks specially to avoid space character issues
-        if font == mono_font:
-            # Draw each non-space character with positioning
-            pos_x = x
-            space_width = canvas.stringWidth(' ', font, font_size)
-            
-            for char in line:
-                if char == ' ':
-                    # Just move the position by space width
-                    pos_x += space_width
-                else:
-                    # Draw the character and advance position
-                    canvas.drawString(pos_x, y, char)
-                    pos_x += canvas.stringWidth(char, font, font_size)
-        else:
-            # Regular text drawn as usual
-            canvas.drawString(x, y, line)
-            
+
+        if text_object is None:
+            text_object = canvas.beginText(x, y)
+            text_object.setFont(font, font_size, leading=line_height)
+
+        text_object.textLine(line)
         y -= line_height
-    
+
+    if text_object is not None:
+        canvas.drawText(text_object)
+
+    # Keep the font active for callers that draw right after the text
+    canvas.setFont(font, font_size)
     return y
 
-def cleanup_old_data(memory_store, data_timestamps):
-    """Remove data older than 2 hours from memory_store"""
+def cleanup_old_data(memory_store, data_timestamps, lock):
+    """Remove data older than 2 hours from memory_store, holding the lock request threads write under"""
     current_time = datetime.now(timezone.utc)
-    expired_sessions = []
-    
-    for session_id, timestamp in data_timestamps.items():
-        if current_time - timestamp > timedelta(hours=2):
-            expired_sessions.append(session_id)
-    
-    for session_id in expired_sessions:
-        if session_id in memory_store['analysis_data']:
-            del memory_store['analysis_data'][session_id]
-        if session_id in memory_store['results']:
-            del memory_store['results'][session_id]
-        del data_timestamps[session_id]
-
-def cleanup_thread(memory_store, data_timestamps):
+    with lock:
+        expired_sessions = [session_id for session_id, timestamp in data_timestamps.items()
+                            if current_time - timestamp > timedelta(hours=2)]
+
+        for session_id in expired_sessions:
+            for store in memory_store.values():
+                store.pop(session_id, None)
+            del data_timestamps[session_id]
+
+def cleanup_thread(memory_store, data_timestamps, lock):
     """Background thread to clean up old data"""
     while True:
-        cleanup_old_data(memory_store, data_timestamps)
+        try:
+            cleanup_old_data(memory_store, data_timestamps, lock)
+        except Exception as e:
+            # Keep the thread alive, or the store grows for the life of the worker
+            logger.error(f"Failed to clean up old analysis data: {e}")
         time.sleep(3600)  # Run once per hour
 
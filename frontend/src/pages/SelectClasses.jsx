@@ -28,11 +28,11 @@ export default function SelectClasses({
     }
 
     const {
+        analysis_id: analysisId,
         comprehensiveThreadAnalysis,
         logAnalysis,
         suspectedClasses,
         customerProblem,
-        errorMessage,
         problemThreads,
         threadAnalysis
     } = analysisData;
@@ -61,15 +61,10 @@ export default function SelectClasses({
         setLoading('analyze');
         try {
             // Construct the payload
+            // The server reads the analysis sections it stored under the ID
             const payload = {
-                selected_classes: selectedClasses,
-                suspected_classes: suspectedClasses,
-                log_analysis: logAnalysis,
-                comprehensive_thread_analysis: comprehensiveThreadAnalysis,
-                customer_problem: customerProblem,
-                error_message: errorMessage,
-                problem_threads: problemThreads,
-                thread_analysis: threadAnalysis
+                analysis_id: analysisId,
+                selected_classes: selectedClasses
             };
 
             const response = await fetch("http://127.0.0.1:8000/analyze_classes", {
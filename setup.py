@@ -6,7 +6,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     package_data={
-        'diagnostic_analyzer_package': ['ThreadGroups.json'],
+        'diagnostic_analyzer_package': ['ThreadGroups.json', 'LogRules.json', 'ModelRouting.json'],
     },
     install_requires=[
         'openai',